@@ -1,29 +1,39 @@
 """The Home Connect New integration."""
 from __future__ import annotations
 
-import asyncio
 import copy
 import logging
 import aiohttp
-from datetime import datetime
 
 import voluptuous as vol
-from home_connect_async import Appliance, HomeConnect, Events, ConditionalLogger
+from home_connect_async import Appliance, HomeConnect, HomeConnectError, Events, ConditionalLogger
 from homeassistant.components.application_credentials import ClientCredential, async_import_client_credential
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import CONF_CLIENT_ID, CONF_CLIENT_SECRET, Platform
-from homeassistant.core import Event, HomeAssistant, HomeAssistantError
+from homeassistant.core import Event, HomeAssistant, HomeAssistantError, SupportsResponse
 from homeassistant.exceptions import ConfigEntryAuthFailed, ConfigEntryNotReady
 from homeassistant.helpers import aiohttp_client, config_entry_oauth2_flow
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers import device_registry as dr
 from homeassistant.helpers import entity_registry as er
-from homeassistant.helpers import storage
 from homeassistant.helpers.typing import ConfigType
 
 from . import api, config_flow
-from .common import Configuration, EntityBase
+from .appliance_index import ApplianceIndex
+from .budget import ApiBudget
+from .cache import HomeConnectCache
+from .catalog import CatalogInterner
+from .constraints import ConstraintCache
+from .loader import ApplianceLoader
+from .readiness import ApplianceReadiness
+from .refresh import REFRESH_SCOPES, REFRESH_SCOPE_FULL
+from .sharding import ShardManager
+from .common import Configuration, StateWriteScheduler, WriteQueue
 from .const import *
+from .discovery import EntityDiscovery
+from .history import ProgramHistory
+from .publisher import EventPublisher
+from .dispatcher import DataChangeDispatcher
 from .services import Services
 
 _LOGGER = logging.getLogger(__name__)
@@ -59,6 +69,9 @@ OPTIONS_SCHEMA = vol.Schema(
         vol.Optional(CONF_NAME_TEMPLATE, default=CONF_NAME_TEMPLATE_DEFAULT): vol.Coerce(str),
         vol.Optional(CONF_LOG_MODE, default=0): vol.Coerce(int),
         vol.Optional(CONF_SSE_TIMEOUT, default=CONF_SSE_TIMEOUT_DEFAULT): vol.Coerce(int),
+        vol.Optional(CONF_CACHE, default=CONF_CACHE_DEFAULT): vol.Coerce(bool),
+        vol.Optional(CONF_UPDATE_WINDOW, default=CONF_UPDATE_WINDOW_DEFAULT): vol.Coerce(int),
+        vol.Optional(CONF_SHARDING, default=CONF_SHARDING_DEFAULT): vol.Coerce(bool),
         vol.Optional(CONF_ENTITY_SETTINGS, default={}): vol.Any(dict, None),
         vol.Optional(CONF_APPLIANCE_SETTINGS, default={}): vol.Any(dict, None)
     },
@@ -75,14 +88,11 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
         # There is no configuration for this integration in the configuration.yaml file
         # hass.data[DOMAIN] = HC_CONFIG_SCHEMA({})
         hass.data[DOMAIN] = { "global": {} }
-        # _global_config is merged into every per-entry Configuration in
-        # Configuration.__init__. Pass only the inner "global" dict, not
-        # the whole hass.data[DOMAIN] (which subsequent async_setup_entry
-        # calls populate with each entry's Configuration under its
-        # entry_id). Aliasing _global_config with the entry storage caused
-        # __merge to recurse into other entries' Configurations, building
-        # plain-dict shadows that compounded across reloads until Python's
-        # recursion limit was reached.
+        # _global_config is the base layer of every per-entry Configuration.
+        # Pass only the inner "global" dict, not the whole hass.data[DOMAIN]
+        # (which subsequent async_setup_entry calls populate with each entry's
+        # Configuration under its entry_id), so the lookups of one entry never
+        # fall through to the runtime storage of the other entries.
         Configuration.set_global_config(hass, hass.data[DOMAIN]["global"])
         return True
 
@@ -140,72 +150,88 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
 
 
     lang = conf[CONF_LANG] # if conf[CONF_LANG] != "" else None
-    #use_cache = conf[CONF_CACHE]
     logmode = conf[CONF_LOG_MODE] if conf[CONF_LOG_MODE] else ConditionalLogger.LogMode.REQUESTS
 
 
     # If using an aiohttp-based API lib
+    # Every request is counted against the daily call limit of the service
+    budget = ApiBudget(hass, config_entry.entry_id)
+    await budget.async_load()
     auth = api.AsyncConfigEntryAuth(
-        aiohttp_client.async_get_clientsession(hass), session, api_host
+        aiohttp_client.async_get_clientsession(hass), session, api_host, budget
     )
 
-    # homeconnect:HomeConnect = None
-    # if use_cache:
-    #     homeconnect = await async_load_from_cache(hass, auth, lang)
-    # if not homeconnect:
-    #     # Create normally if failed to create from cache
-    #     try:
-    #         homeconnect = await HomeConnect.async_create(auth, delayed_load=True, lang=lang)
-    #         _LOGGER.debug("The HomeConnect object was created from scratch (without cache)")
-    #     except HomeConnectError as ex:
-    #         _LOGGER.warning("Failed to create the HomeConnect object", exc_info=ex)
-    #         return False
     ConditionalLogger.mode(logmode)
-    disabled_appliances = [haid for haid in conf[CONF_APPLIANCE_SETTINGS] if "disabled" in conf[CONF_APPLIANCE_SETTINGS][haid] and conf[CONF_APPLIANCE_SETTINGS][haid]["disabled"] ] if conf[CONF_APPLIANCE_SETTINGS] else []
-    homeconnect = await HomeConnect.async_create(auth, delayed_load=True, lang=lang, disabled_appliances=disabled_appliances, sse_timeout=conf[CONF_SSE_TIMEOUT])
-    services = register_services(hass, homeconnect)
-
-    conf.update({ "homeconnect": homeconnect, "services": services, "auth": auth })
+    disabled_appliances = [haid for haid in conf.get_configured_appliances() if conf.get_appliance_setting(haid, "disabled")]
+    if conf[CONF_SHARDING]:
+        # The appliances assigned to the other sharding entries are disabled as well, the list is kept updated by the shard manager
+        disabled_appliances = await ShardManager.get(hass).async_attach(config_entry.entry_id, budget, disabled_appliances)
+
+    # Create the HomeConnect object from the cached snapshot when one is available so the entities are
+    # created immediately and only the dynamic data has to be refreshed from the service
+    cache = HomeConnectCache(hass, config_entry.entry_id, lang) if conf[CONF_CACHE] else None
+    json_data, refresh = await cache.async_load(disabled_appliances) if cache else (None, HomeConnect.RefreshMode.DYNAMIC_ONLY)
+    # The option constraints are shared by the appliances of the same model across all the config entries
+    constraints = ConstraintCache.get(hass)
+    await constraints.async_load()
+    homeconnect = await HomeConnect.async_create(auth, json_data=json_data, refresh=refresh, delayed_load=True, lang=lang,
+                                                 disabled_appliances=disabled_appliances, sse_timeout=conf[CONF_SSE_TIMEOUT])
+    # The requests of the HomeConnect object and its appliances are served from the constraint cache or admitted through the call budget of the entry
+    entry_api = api.ConfigEntryApi.install(homeconnect, budget, constraints)
+    # Each program run is kept as a single record instead of the history of the program sensors
+    history = ProgramHistory(hass, config_entry.entry_id)
+    await history.async_load()
+    history.attach(homeconnect)
+    # Appliances of the same model share their static catalog
+    CatalogInterner.get(hass).attach(homeconnect)
+    if cache:
+        cache.attach(homeconnect)
+    if conf[CONF_SHARDING]:
+        ShardManager.get(hass).bind(config_entry.entry_id, homeconnect)
+    ApplianceIndex.get(hass).attach(homeconnect, config_entry.entry_id)
+    services = register_services(hass, config_entry.entry_id)
+
+    conf.update({ "homeconnect": homeconnect, "services": services, "auth": auth, "api": entry_api, "budget": budget, "cache": cache, "history": history })
+    # Each appliance moves through its loading stages independently so its entities are created as soon as it is ready
+    conf["readiness"] = ApplianceReadiness(hass.loop)
+    # The platforms share a single discovery pass over the appliances instead of each walking the data model on every event
+    conf["discovery"] = EntityDiscovery(homeconnect, conf, conf["readiness"])
+    # DATA_CHANGED events are dispatched only to the entities whose data has changed
+    conf["dispatcher"] = DataChangeDispatcher(homeconnect)
+    conf["state_writer"] = StateWriteScheduler(hass, conf[CONF_UPDATE_WINDOW])
+    # Disconnected appliances are only loaded when they connect
+    conf["loader"] = ApplianceLoader(homeconnect, conf["readiness"])
+    # Rapid writes from the interactive entities are collapsed so only the final value is sent
+    conf["write_queue"] = WriteQueue(hass, WRITE_COALESCE_WINDOW)
 
     #region internal event handlers
-    # async def async_delayed_update_cache(delay:float = 0):
-    #     asyncio.sleep(delay)
-    #     await async_save_to_cache(hass, homeconnect)
 
     async def on_config_entry_update(hass:HomeAssistant, new_entry:ConfigEntry):
         if dict(new_entry.options) != hass.data[DOMAIN][f"{config_entry.entry_id}_options"]:
             _LOGGER.debug("Config entry updated, reloading the integration: %s", str(new_entry.options))
+            Configuration.invalidate()
             await hass.config_entries.async_reload(new_entry.entry_id)
 
 
     async def on_data_loaded(homeconnect:HomeConnect):
-        # Save the state of the HomeConnect object to cache
-        # if use_cache:
-        #     await async_save_to_cache(hass, homeconnect)
-        # else:
-        #     _LOGGER.debug("Not saving to cache, it is disabled")
+        if cache:
+            # Save the refreshed state of the HomeConnect object to the cache
+            cache.schedule_save()
         homeconnect.register_callback(on_device_removed, Events.DEPAIRED)
-        #homeconnect.register_callback(on_device_added, [Events.PAIRED, Events.DATA_CHANGED] )
         homeconnect.subscribe_for_updates()
 
     async def on_data_load_error(homeconnect:HomeConnect, ex:Exception):
         _LOGGER.error("Failed to load data for the HomeConnect object", exc_info=ex)
-
-    # async def on_device_added(appliance:Appliance, event:str):
-    #     if use_cache:
-    #         await async_save_to_cache(hass, homeconnect)
-    #     else:
-    #         _LOGGER.debug("Not saving to cache, it is disabled")
+        if cache and cache.loaded_from_cache and not isinstance(ex, HomeConnectError):
+            # An unexpected error when refreshing a snapshot suggests it is inconsistent with the service
+            # so drop it to make sure the next load starts from scratch
+            await cache.async_clear()
 
     async def on_device_removed(appliance:Appliance):
         devreg = dr.async_get(hass)
         device = devreg.async_get_device({(DOMAIN, appliance.normalized_haId)})
         devreg.async_remove_device(device.id)
 
-        # We need to wait for the appliance to be removed from the HomeConnect data
-        # this is not 100% fail-safe but good enough for a cache
-        # asyncio.create_task(async_delayed_update_cache(30))
-
     #endregion
 
 
@@ -217,10 +243,12 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
 
     #hass.config_entries.async_setup_platforms(entry, PLATFORMS)
     await hass.config_entries.async_forward_entry_setups(config_entry, PLATFORMS)
-    register_events_publisher(hass, homeconnect)
+    # The events of the appliances are published in order, per appliance, on the Home Assistant event bus
+    conf["publisher"] = EventPublisher(hass, conf)
+    conf["publisher"].attach(homeconnect)
 
     # Continue loading the HomeConnect data model and set the callback to be notified when done
-    homeconnect.start_load_data_task(on_complete=on_data_loaded, on_error= on_data_load_error)
+    conf["loader"].start(on_complete=on_data_loaded, on_error= on_data_load_error)
 
     return True
 
@@ -239,8 +267,20 @@ async def async_unload_entry(hass: HomeAssistant, config_entry: ConfigEntry) ->
     conf = hass.data[DOMAIN]
     homeconnect:HomeConnect = conf[config_entry.entry_id]['homeconnect']
     homeconnect.close()
-
-    # await async_save_to_cache(hass, None)
+    conf[config_entry.entry_id]["state_writer"].cancel()
+    conf[config_entry.entry_id]["write_queue"].cancel()
+    conf[config_entry.entry_id]["readiness"].cancel()
+    conf[config_entry.entry_id]["publisher"].cancel()
+    unregister_services(hass, config_entry.entry_id)
+    ApplianceIndex.get(hass).detach(config_entry.entry_id)
+    if conf[config_entry.entry_id][CONF_SHARDING]:
+        ShardManager.get(hass).detach(config_entry.entry_id)
+
+    cache:HomeConnectCache = conf[config_entry.entry_id]['cache']
+    if cache:
+        await cache.async_unload()
+    await conf[config_entry.entry_id]["budget"].async_unload()
+    await conf[config_entry.entry_id]["history"].async_unload()
 
     unload_ok = await hass.config_entries.async_unload_platforms(config_entry, PLATFORMS)
     if unload_ok:
@@ -248,56 +288,28 @@ async def async_unload_entry(hass: HomeAssistant, config_entry: ConfigEntry) ->
 
     return unload_ok
 
-async def async_load_from_cache(hass:HomeAssistant, auth:api.AsyncConfigEntryAuth, lang:str|None) -> HomeConnect | None:
-    """ Helper function to load cached Home Connect data for storage """
-    cache = storage.Store(hass, version=1, key=f"{DOMAIN}_cache", private=True)
-    try:
-        refresh = HomeConnect.RefreshMode.ALL
-        json_data = None
-
-        cached_data = await cache.async_load()
-        if cached_data:
-            json_data = cached_data.get('json_data')
-
-            last_update = datetime.fromisoformat(cached_data['last_update'])
-            delta = (datetime.now()-last_update).total_seconds()
-            if delta < 60:
-                refresh = HomeConnect.RefreshMode.NOTHING
-            elif delta < 3600*24*30:
-                refresh = HomeConnect.RefreshMode.DYNAMIC_ONLY
-
-        homeconnect:HomeConnect = await HomeConnect.async_create(auth, json_data=json_data, refresh=refresh, delayed_load=True, lang=lang)
-        _LOGGER.debug("Loaded HomeConnect from cache")
-        return homeconnect
-    except Exception as ex:
-        # If there is any exception when creating the object from cache then clear the cache and continue
-        await cache.async_remove()
-        _LOGGER.debug("Exception while loading HomeConnect from cache, clearing cache and continuing", exc_info=ex)
-        return None
-
-async def async_save_to_cache(hass:HomeAssistant, homeconnect:HomeConnect, cache:storage.Store=None) -> None:
-    """ Helper function to save the Home Connect data to Home Assistant storage """
-    try:
-        if not cache:
-            cache = storage.Store(hass, version=1, key=f"{DOMAIN}_cache", private=True)
-        if homeconnect:
-            cached_data = {
-                'last_update': datetime.now().isoformat(),
-                'json_data': homeconnect.to_json()
-            }
-            await cache.async_save(cached_data)
-            _LOGGER.debug("Saved HomeConnect to cache")
-        else:
-            await cache.async_remove()
-            _LOGGER.debug("Cleared HomeConnect from cache")
-
-    except Exception as ex:
-        _LOGGER.debug("Exception when saving HomeConnect to cache", exc_info=ex)
-
-
-def register_services(hass:HomeAssistant, homeconnect:HomeConnect) -> Services:
-    """ Register the services offered by this integration """
-    services = Services(hass, homeconnect)
+async def async_remove_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> None:
+    """Remove the cached data of a deleted config entry."""
+    await HomeConnectCache(hass, config_entry.entry_id, None).async_clear()
+    await ApiBudget(hass, config_entry.entry_id).async_remove()
+    await ProgramHistory(hass, config_entry.entry_id).async_remove()
+
+
+SERVICES = ["select_program", "start_program", "stop_program", "pause_program", "resume_program", "set_program_option", "apply_setting", "run_command", "refresh", "get_program_history"]
+
+def register_services(hass:HomeAssistant, entry_id:str) -> Services:
+    """ Register the services offered by this integration
+
+    The services are registered once for all the config entries and route each call to the appliance
+    of the device, whichever config entry it belongs to. The config entries using them are reference counted.
+    """
+    services:Services|None = hass.data[DOMAIN].get("services")
+    if services:
+        services.entries.add(entry_id)
+        return services
+    services = Services(hass)
+    services.entries.add(entry_id)
+    hass.data[DOMAIN]["services"] = services
 
     select_program_schema = vol.Schema(
         {
@@ -382,57 +394,40 @@ def register_services(hass:HomeAssistant, homeconnect:HomeConnect) -> Services:
     )
     hass.services.async_register(DOMAIN, "run_command", services.async_run_command, schema=run_command_schema)
 
+    refresh_schema = vol.Schema(
+        {
+            vol.Required('device_id'): cv.string,
+            vol.Optional('scope', default=REFRESH_SCOPE_FULL): vol.In(REFRESH_SCOPES),
+            vol.Optional('dry_run', default=False): cv.boolean
+        }
+    )
+    hass.services.async_register(DOMAIN, "refresh", services.async_refresh, schema=refresh_schema, supports_response=SupportsResponse.OPTIONAL)
 
-    return services
+    get_program_history_schema = vol.Schema(
+        {
+            vol.Optional('device_id'): cv.string,
+            vol.Optional('program_key'): cv.string,
+            vol.Optional('since'): cv.datetime,
+            vol.Optional('limit', default=HISTORY_QUERY_LIMIT): cv.positive_int
+        }
+    )
+    hass.services.async_register(DOMAIN, "get_program_history", services.async_get_program_history, schema=get_program_history_schema,
+                                 supports_response=SupportsResponse.ONLY)
 
 
-def register_events_publisher(hass:HomeAssistant, homeconnect:HomeConnect):
-    """ Register for publishing events that are offered by this integration """
-    device_reg: dr.DeviceRegistry = dr.async_get(hass)
-    last_event: dict[str, str | None] = { 'key': None, 'value': None}    # Used to filter out duplicate events
-
-    async def async_handle_event(appliance:Appliance, key:str, value:str):
-        if key != last_event['key'] or value != last_event['value']:
-            last_event['key'] = key
-            last_event['value'] = value
-            haid = appliance.normalized_haId
-            device = device_reg.async_get_device({(DOMAIN, haid)})
-            if not device:
-                haid = EntityBase.get_safe_haID(hass, appliance)
-                device = device_reg.async_get_device({(DOMAIN, haid)})
-            if not device:
-                _LOGGER.warning("No device found for appliance %s, cannot publish event %s = %s", appliance.normalized_haId, key, str(value))
-                return
-            event_data = {
-                "device_id": device.id,
-                "key": key,
-                "value": value
-            }
-            if key in ("BSH.Common.Status.OperationState", "BSH.Common.Event.ProgramFinished"):
-                # delay the firing of the event to deal with event handling race condition
-                _LOGGER.debug("Creating delayed_publish_event task")
-                asyncio.create_task(delayed_publish_event(event_data, 1))
-            else:
-                hass.bus.async_fire(f"{DOMAIN}_event", event_data)
-                _LOGGER.debug("Published event to Home Assistant event bus: %s = %s", key, str(value))
-        else:
-            _LOGGER.debug("Skipped publishing of duplicate event to Home Assistant event bus: %s = %s", key, str(value))
-
-    async def delayed_publish_event(event_data, timeout):
-        _LOGGER.debug(f"Sleeping for {timeout} seconds to delay event publishing of {event_data}")
-        await asyncio.sleep(timeout)
-        hass.bus.async_fire(f"{DOMAIN}_event", event_data)
-        _LOGGER.debug("Published event to Home Assistant event bus after delay: %s = %s", event_data["key"], str(event_data["value"]))
-
-    def register_appliance(appliance:Appliance):
-        for event in PUBLISHED_EVENTS:
-            appliance.register_callback(async_handle_event, event)
-
-
-    homeconnect.register_callback(register_appliance, [Events.PAIRED, Events.CONNECTED])
-    for appliance in homeconnect.appliances.values():
-        register_appliance(appliance)
+    return services
+
 
+def unregister_services(hass:HomeAssistant, entry_id:str) -> None:
+    """ Remove the services when the last config entry using them is unloaded """
+    services:Services|None = hass.data[DOMAIN].get("services")
+    if not services:
+        return
+    services.entries.discard(entry_id)
+    if not services.entries:
+        for service in SERVICES:
+            hass.services.async_remove(DOMAIN, service)
+        hass.data[DOMAIN].pop("services")
 
 
 class HomeConnectOauth2Impl(config_entry_oauth2_flow.LocalOAuth2Implementation):
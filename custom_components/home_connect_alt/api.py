@@ -1,8 +1,22 @@
 """API for Home Connect New bound to Home Assistant OAuth."""
+from __future__ import annotations
+from contextvars import ContextVar
+from functools import partial
+from typing import Awaitable, Callable
+
 import home_connect_async
-from aiohttp import ClientSession
+from aiohttp import ClientResponse, ClientSession
+from home_connect_async import HomeConnect
+from home_connect_async.api import HomeConnectApi
 from homeassistant.helpers import config_entry_oauth2_flow
 
+from .budget import ApiBudget, PRIORITY_COMMAND, classify_request, get_request_haid
+from .common import ObservableHealthStatus
+from .constraints import ConstraintCache
+
+# Set while a request that was already counted by the budget is being sent, so only its retries are counted again
+_admitted:ContextVar[bool] = ContextVar("home_connect_alt_admitted", default=False)
+
 # TODO the following two API examples are based on our suggested best practices
 # for libraries using OAuth2 with requests or aiohttp. Delete the one you won't use.
 # For more info see the docs at https://developers.home-assistant.io/docs/api_lib_auth/#oauth2.
@@ -16,10 +30,12 @@ class AsyncConfigEntryAuth(home_connect_async.AbstractAuth):
         websession: ClientSession,
         oauth_session: config_entry_oauth2_flow.OAuth2Session,
         host: str,
+        budget: ApiBudget = None,
     ) -> None:
         """Initialize Home Connect New auth."""
         super().__init__(websession, host)
         self._oauth_session = oauth_session
+        self.budget = budget
 
     async def async_get_access_token(self) -> str:
         """Return a valid access token."""
@@ -27,3 +43,66 @@ class AsyncConfigEntryAuth(home_connect_async.AbstractAuth):
             await self._oauth_session.async_ensure_token_valid()
 
         return self._oauth_session.token["access_token"]
+
+    async def request(self, method, endpoint:str, lang:str=None, **kwargs) -> ClientResponse:
+        """Make a request and count it, the first attempt of a request admitted by the budget is already counted."""
+        if self.budget:
+            if _admitted.get():
+                _admitted.set(False)
+            else:
+                self.budget.record(classify_request(method, endpoint), get_request_haid(endpoint))
+        return await super().request(method, endpoint, lang, **kwargs)
+
+    async def stream(self, endpoint:str, lang:str, sse_timeout:int, **kwargs):
+        """Open the event stream, which is counted but never deferred."""
+        if self.budget:
+            self.budget.record(PRIORITY_COMMAND)
+        return await super().stream(endpoint, lang, sse_timeout, **kwargs)
+
+
+class ConfigEntryApi(HomeConnectApi):
+    """ The API object of a config entry, which serves the cached option constraints and admits the other requests through the daily API call budget
+
+    The library retries a failed request a few times within the request, so the budget is checked once before
+    the request, outside of the retry loop, and a request that doesn't fit in the budget fails with a 429 error
+    without being sent. The retries are counted as they are sent but never deferred. Constraints served from the
+    cache aren't counted.
+    """
+
+    def __init__(self, auth:AsyncConfigEntryAuth, lang:str, health:home_connect_async.HealthStatus, budget:ApiBudget, constraints:ConstraintCache) -> None:
+        super().__init__(auth, lang, health)
+        self._budget = budget
+        self._constraints = constraints
+
+    @classmethod
+    def install(cls, homeconnect:HomeConnect, budget:ApiBudget, constraints:ConstraintCache) -> ConfigEntryApi:
+        """ Replace the API object and the health status the library created for the HomeConnect object and its appliances """
+        library_api:HomeConnectApi = homeconnect._api
+        health = ObservableHealthStatus(homeconnect._health)
+        api = cls(library_api._auth, library_api._lang, health, budget, constraints)
+        homeconnect._health = health
+        homeconnect._api = api
+        for appliance in homeconnect.appliances.values():
+            appliance._api = api
+        constraints.add_appliances(homeconnect.appliances.values())
+        return api
+
+    async def _async_send_admitted(self, method:str, endpoint:str, send:Callable[[], Awaitable[HomeConnectApi.ApiResponse]]) -> HomeConnectApi.ApiResponse:
+        await self._budget.async_acquire(method, endpoint)
+        token = _admitted.set(True)
+        try:
+            return await send()
+        finally:
+            _admitted.reset(token)
+
+    async def async_get(self, endpoint) -> HomeConnectApi.ApiResponse:
+        return await self._constraints.async_get(endpoint, self._lang, self._async_get_admitted)
+
+    async def _async_get_admitted(self, endpoint:str) -> HomeConnectApi.ApiResponse:
+        return await self._async_send_admitted("GET", endpoint, partial(super().async_get, endpoint))
+
+    async def async_put(self, endpoint:str, data:str) -> HomeConnectApi.ApiResponse:
+        return await self._async_send_admitted("PUT", endpoint, partial(super().async_put, endpoint, data))
+
+    async def async_delete(self, endpoint:str) -> HomeConnectApi.ApiResponse:
+        return await self._async_send_admitted("DELETE", endpoint, partial(super().async_delete, endpoint))
@@ -0,0 +1,151 @@
+""" Integration wide index of the identifiers of the appliances """
+from __future__ import annotations
+import logging
+
+from home_connect_async import Appliance, HomeConnect, Events
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers import entity_registry as er
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ApplianceIndex():
+    """ Map between the appliances, their safe haId and their device ID
+
+    The values are resolved from the registries once per appliance and kept until the appliance is depaired,
+    instead of looking them up for every entity, event or service call. The index is shared by all the config
+    entries and is keyed by the normalized haId. It is dropped when the last config entry is unloaded.
+    """
+
+    def __init__(self, hass:HomeAssistant) -> None:
+        self._hass = hass
+        self._appliances:dict[str, Appliance] = {}
+        self._safe_haids:dict[str, str] = {}
+        self._device_ids:dict[str, str] = {}
+        self._haids_by_device:dict[str, str] = {}
+        self._owners:dict[str, str] = {}
+        self._entries:set[str] = set()
+        self._unsub_device_registry = hass.bus.async_listen(dr.EVENT_DEVICE_REGISTRY_UPDATED, self._on_device_registry_updated)
+
+    @classmethod
+    def get(cls, hass:HomeAssistant) -> ApplianceIndex:
+        """ Return the index of the integration, creating it on first use """
+        domain_data = hass.data.setdefault(DOMAIN, {})
+        if "index" not in domain_data:
+            domain_data["index"] = ApplianceIndex(hass)
+        return domain_data["index"]
+
+    def attach(self, homeconnect:HomeConnect, entry_id:str) -> None:
+        """ Keep the index updated with the appliances of the HomeConnect object of a config entry """
+        self._entries.add(entry_id)
+
+        def on_appliance_paired(appliance:Appliance) -> None:
+            self.add_appliance(appliance, entry_id)
+
+        # The library creates a new Appliance object when an unknown appliance connects so CONNECTED is handled as well
+        homeconnect.register_callback(on_appliance_paired, [Events.PAIRED, Events.CONNECTED])
+        homeconnect.register_callback(self.on_appliance_removed, Events.DEPAIRED)
+        for appliance in homeconnect.appliances.values():
+            self.add_appliance(appliance, entry_id)
+
+    def detach(self, entry_id:str) -> None:
+        """ Forget the appliances of an unloaded config entry, the index stops listening when no config entry is left """
+        for (haid, owner) in list(self._owners.items()):
+            if owner == entry_id:
+                self.on_appliance_removed(self._appliances[haid])
+        self._entries.discard(entry_id)
+        if not self._entries:
+            self._unsub_device_registry()
+            domain_data = self._hass.data.get(DOMAIN, {})
+            if domain_data.get("index") is self:
+                del domain_data["index"]
+
+    def add_appliance(self, appliance:Appliance, entry_id:str) -> None:
+        """ Index a new appliance and resolve its identifiers """
+        self._appliances[appliance.normalized_haId] = appliance
+        self._owners[appliance.normalized_haId] = entry_id
+        self.get_safe_haid(appliance)
+        self.get_device_id(appliance)
+
+    def get_entry_id(self, appliance:Appliance) -> str|None:
+        """ Return the ID of the config entry which owns the appliance """
+        return self._owners.get(appliance.normalized_haId)
+
+    def on_appliance_removed(self, appliance:Appliance) -> None:
+        """ Forget a depaired appliance """
+        haid = appliance.normalized_haId
+        if self._appliances.get(haid) is not appliance:
+            # The appliance is indexed through another config entry
+            return
+        self._appliances.pop(haid, None)
+        self._owners.pop(haid, None)
+        self._safe_haids.pop(haid, None)
+        device_id = self._device_ids.pop(haid, None)
+        if device_id:
+            self._haids_by_device.pop(device_id, None)
+
+    @callback
+    def _on_device_registry_updated(self, event:Event) -> None:
+        """ Forget the ID of a device that was removed from the registry """
+        if event.data["action"] == "remove":
+            haid = self._haids_by_device.pop(event.data["device_id"], None)
+            if haid:
+                self._device_ids.pop(haid, None)
+
+    def get_appliance(self, device_id:str) -> Appliance|None:
+        """ Return the appliance of a Home Assistant device or None if it isn't a known appliance """
+        haid = self._haids_by_device.get(device_id)
+        if haid is None:
+            # The device may have been created after the appliance was indexed
+            device = dr.async_get(self._hass).async_get(device_id)
+            if not device:
+                return None
+            haid = next((identifier[1] for identifier in device.identifiers if identifier[0] == DOMAIN), None)
+            if haid not in self._appliances:
+                return None
+            self._device_ids[haid] = device_id
+            self._haids_by_device[device_id] = haid
+        return self._appliances.get(haid)
+
+    def get_safe_haid(self, appliance:Appliance) -> str:
+        """ Returns a haID that doesn't start with a digit by adding the brand as a prefix if needed """
+        safe_haid = self._safe_haids.get(appliance.normalized_haId)
+        if safe_haid is None:
+            safe_haid = self._resolve_safe_haid(appliance)
+            self._safe_haids[appliance.normalized_haId] = safe_haid
+        return safe_haid
+
+    def _resolve_safe_haid(self, appliance:Appliance) -> str:
+        haid = appliance.normalized_haId
+        if haid[0].isdigit():
+            # if the haID starts with a digit and there aren't entities that use that haid already then add the brand as a prefix to the haId
+            # This is to avoid issues with using such entities in templates
+            # The entities of the appliance are found through its device instead of scanning the whole entity registry
+            existing_entities = []
+            device = dr.async_get(self._hass).async_get_device({(DOMAIN, haid)})
+            if device:
+                entries = er.async_entries_for_device(er.async_get(self._hass), device.id, include_disabled_entities=True)
+                existing_entities = [entry.entity_id for entry in entries if f".{haid}" in entry.entity_id]
+            if not existing_entities:
+                haid = appliance.brand.lower() + "_" + haid
+            else:
+                _LOGGER.debug("Not adding brand prefix to haID %s because there are existing entities without it", haid)
+        return haid
+
+    def get_device_id(self, appliance:Appliance) -> str|None:
+        """ Return the ID of the device of the appliance or None if the device wasn't created yet """
+        haid = appliance.normalized_haId
+        device_id = self._device_ids.get(haid)
+        if device_id is None:
+            devreg = dr.async_get(self._hass)
+            device = devreg.async_get_device({(DOMAIN, haid)})
+            if not device:
+                device = devreg.async_get_device({(DOMAIN, self.get_safe_haid(appliance))})
+            if device:
+                device_id = device.id
+                self._device_ids[haid] = device_id
+                self._haids_by_device[device_id] = haid
+        return device_id
@@ -1,12 +1,15 @@
 
 import logging
-from home_connect_async import Appliance, HomeConnect, Events
+from home_connect_async import Appliance
 from homeassistant.components.binary_sensor import BinarySensorEntity
+from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType
 
 from .common import Configuration, EntityBase, EntityManager
+from .discovery import EntitySpec
 from .const import DOMAIN
 
 _LOGGER = logging.getLogger(__name__)
@@ -17,48 +20,20 @@ async def async_setup_entry(hass:HomeAssistant , config_entry:ConfigType, async_
     #auth = hass.data[DOMAIN][config_entry.entry_id]
     #homeconnect:HomeConnect = hass.data[DOMAIN]['homeconnect']
     entry_conf:Configuration = hass.data[DOMAIN][config_entry.entry_id]
-    homeconnect:HomeConnect = entry_conf["homeconnect"]
     entity_manager = EntityManager(async_add_entities, "Binary Sensor")
 
-    def add_appliance(appliance:Appliance) -> None:
-        conf:Configuration = entry_conf.get_config()
-        for (key, status) in appliance.status.items():
-            device = None
-            if isinstance(status.value, bool) or conf.get_entity_setting(key, "type") == "Boolean": # should be a binary sensor if it has a boolean value
-                device = StatusBinarySensor(appliance, key, conf)
-                entity_manager.add(device)
-
-        if appliance.selected_program and appliance.selected_program.options:
-            for option in appliance.selected_program.options.values():
-                if isinstance(option.value, bool) or conf.get_entity_setting(option.key, "type") == "Boolean":
-                    device = ProgramOptionBinarySensor(appliance, option.key, conf)
-                    entity_manager.add(device)
-
-        if appliance.active_program and appliance.active_program.options:
-            for option in appliance.active_program.options.values():
-                if isinstance(option.value, bool) or conf.get_entity_setting(option.key, "type") == "Boolean":
-                    device = ProgramOptionBinarySensor(appliance, option.key, conf)
-                    entity_manager.add(device)
-
-        if appliance.settings:
-            for setting in appliance.settings.values():
-                if setting.type == "Boolean" or isinstance(setting.value, bool) or conf.get_entity_setting(setting.key, "type") == "Boolean":
-                    device = SettingsBinarySensor(appliance, setting.key, conf)
-                    entity_manager.add(device)
-
-        entity_manager.add(ConnectionBinarySensor(appliance, "Connected", conf))
-
-        # if len(new_entities)>0:
-        #     entity_manager.register_entities(new_entities, async_add_entities)
-        entity_manager.register()
-
-    def remove_appliance(appliance:Appliance) -> None:
-        entity_manager.remove_appliance(appliance)
-
-    homeconnect.register_callback(add_appliance, [Events.PAIRED, Events.DATA_CHANGED, Events.PROGRAM_STARTED, Events.PROGRAM_SELECTED])
-    homeconnect.register_callback(remove_appliance, Events.DEPAIRED)
-    for appliance in homeconnect.appliances.values():
-        add_appliance(appliance)
+    def build_entity(appliance:Appliance, spec:EntitySpec, conf:Configuration) -> Entity:
+        match spec.kind:
+            case "status":
+                return StatusBinarySensor(appliance, spec.key, conf)
+            case "option":
+                return ProgramOptionBinarySensor(appliance, spec.key, conf)
+            case "setting":
+                return SettingsBinarySensor(appliance, spec.key, conf)
+            case "connection":
+                return ConnectionBinarySensor(appliance, spec.key, conf)
+
+    entry_conf["discovery"].register_platform(Platform.BINARY_SENSOR, entity_manager, build_entity)
 
 class ProgramOptionBinarySensor(EntityBase, BinarySensorEntity):
     """ Program option binary sensor """
@@ -91,7 +66,7 @@ class ProgramOptionBinarySensor(EntityBase, BinarySensorEntity):
         return None
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
 
 class ActivityOptionBinarySensor(ProgramOptionBinarySensor):
     """ Special active program sensor """
@@ -130,7 +105,7 @@ class StatusBinarySensor(EntityBase, BinarySensorEntity):
         return None
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
 
 
 class SettingsBinarySensor(EntityBase, BinarySensorEntity):
@@ -160,7 +135,7 @@ class SettingsBinarySensor(EntityBase, BinarySensorEntity):
         return None
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
 
 
 class ConnectionBinarySensor(EntityBase, BinarySensorEntity):
@@ -174,4 +149,4 @@ class ConnectionBinarySensor(EntityBase, BinarySensorEntity):
         return self._appliance.connected
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
-        self.async_write_ha_state()
\ No newline at end of file
+        self.schedule_write_ha_state()
\ No newline at end of file
@@ -0,0 +1,252 @@
+""" Client side accounting of the daily Home Connect API call limit """
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable
+
+from home_connect_async import HomeConnectError
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import storage
+from homeassistant.helpers.event import async_call_later
+
+from .const import DOMAIN, API_BUDGET_LIMIT, API_BUDGET_WINDOW, API_BUDGET_SAVE_DELAY, API_BUDGET_MAX_WAIT
+
+_LOGGER = logging.getLogger(__name__)
+
+PRIORITY_COMMAND = 0        # User initiated commands, programs, options and settings (PUT/DELETE)
+PRIORITY_REFRESH = 1        # Reading the state of the appliances
+PRIORITY_CONSTRAINTS = 2    # Reading the option constraints of the available programs
+
+PRIORITY_NAMES = { PRIORITY_COMMAND: "command", PRIORITY_REFRESH: "refresh", PRIORITY_CONSTRAINTS: "constraints" }
+# The number of calls of the daily limit that requests of each priority leave for the higher priorities
+PRIORITY_RESERVE = { PRIORITY_COMMAND: 0, PRIORITY_REFRESH: 50, PRIORITY_CONSTRAINTS: 200 }
+# The name of the library task that processes the event stream, the requests it makes can't wait for the budget
+EVENT_STREAM_TASK = "subscribe_for_updates"
+
+
+def get_request_haid(endpoint:str) -> str|None:
+    """ Return the normalized haId of the appliance an API request is made for, None for account wide requests """
+    parts = endpoint.split("?")[0].split("/")
+    if len(parts) > 3 and parts[2] == "homeappliances" and parts[3] != "events":
+        return parts[3].lower().replace('-','_')
+    return None
+
+
+def classify_request(method:str, endpoint:str) -> int:
+    """ Return the priority of an API request """
+    if method.upper() in ["PUT", "DELETE"]:
+        return PRIORITY_COMMAND
+    if "/programs/available/" in endpoint:
+        return PRIORITY_CONSTRAINTS
+    return PRIORITY_REFRESH
+
+
+class ApiBudget():
+    """ Rolling 24h count of the API calls made by a config entry
+
+    The Home Connect service allows a limited number of calls per day for each client application. Every request
+    is recorded and when the projected usage would exceed the limit the lower priority requests are deferred
+    so that a part of the budget is always kept for the user initiated commands. The deferred requests are
+    released in priority order as the old calls expire from the window, a request that isn't released within a
+    bounded wait fails with a 429 error. The requests made while processing the event stream fail right away instead
+    of holding up the following events. Command requests are never deferred.
+    """
+
+    def __init__(self, hass:HomeAssistant, entry_id:str, limit:int = API_BUDGET_LIMIT, window:int = API_BUDGET_WINDOW) -> None:
+        self._hass = hass
+        self._store = storage.Store(hass, version=1, key=f"{DOMAIN}_budget_{entry_id}", private=True)
+        self.limit = limit
+        self.window = window
+        self._calls:deque[tuple[float, str|None]] = deque()
+        self._waiters:list[tuple[int, int, asyncio.Future, str|None]] = []
+        self._sequence = itertools.count()
+        self._unsub_timer = None
+        self._listeners:list[Callable[[], None]] = []
+        self.stats = { "requests": { name: 0 for name in PRIORITY_NAMES.values() }, "deferred": 0, "rejected": 0 }
+
+    async def async_load(self) -> None:
+        """ Restore the calls made in the current window before a restart """
+        data = await self._store.async_load()
+        if data:
+            cutoff = time.time() - self.window
+            self._calls.extend((t, haid) for (t, haid) in sorted(data.get("calls", []), key=lambda call: call[0]) if t > cutoff)
+
+    async def async_unload(self) -> None:
+        """ Cancel the deferred requests and save the current window """
+        if self._unsub_timer:
+            self._unsub_timer()
+            self._unsub_timer = None
+        while self._waiters:
+            heapq.heappop(self._waiters)[2].cancel()
+        await self._store.async_save(self._data_to_save())
+
+    async def async_remove(self) -> None:
+        """ Remove the stored window of a deleted config entry """
+        await self._store.async_remove()
+
+    def _data_to_save(self) -> dict:
+        return { "calls": [list(call) for call in self._calls] }
+
+    def _prune(self, now:float) -> None:
+        cutoff = now - self.window
+        while self._calls and self._calls[0][0] <= cutoff:
+            self._calls.popleft()
+
+    def _threshold(self, priority:int) -> int:
+        """ The number of calls in the window above which requests of the priority are deferred """
+        return max(self.limit - PRIORITY_RESERVE[priority], 0)
+
+    def _projected_usage(self, now:float) -> int:
+        """ The usage projected to the time the oldest call in the window expires, at the rate of the last hour """
+        used = len(self._calls)
+        if not self._calls:
+            return used
+        recent = len(self._calls) - next((i for (i, (t, _)) in enumerate(self._calls) if t > now - 3600), len(self._calls))
+        until_expiry = self._calls[0][0] + self.window - now
+        return used + int(recent * min(until_expiry, 3600) / 3600)
+
+    def _admits(self, priority:int, now:float) -> bool:
+        if priority == PRIORITY_COMMAND:
+            return True
+        threshold = self._threshold(priority)
+        if len(self._calls) >= threshold:
+            return False
+        # The lowest priority is also deferred when the current rate is projected to use up its share
+        return priority != PRIORITY_CONSTRAINTS or self._projected_usage(now) < threshold
+
+    def add_listener(self, listener:Callable[[], None]) -> Callable[[], None]:
+        """ Call the listener whenever a request is counted, returns a function that removes it """
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
+
+    def record(self, priority:int, haid:str|None = None) -> None:
+        """ Count a request that is sent to the service """
+        now = time.time()
+        self._prune(now)
+        self._calls.append((now, haid))
+        self.stats["requests"][PRIORITY_NAMES[priority]] += 1
+        self._store.async_delay_save(self._data_to_save, API_BUDGET_SAVE_DELAY)
+        for listener in self._listeners:
+            listener()
+
+    async def async_acquire(self, method:str, endpoint:str) -> None:
+        """ Wait until the request fits in the budget and count it """
+        priority = classify_request(method, endpoint)
+        now = time.time()
+        self._prune(now)
+        # Requests don't overtake deferred requests of the same or a higher priority
+        if (not self._waiters or priority < self._waiters[0][0]) and self._admits(priority, now):
+            self.record(priority, get_request_haid(endpoint))
+            return
+
+        task = asyncio.current_task()
+        if task and task.get_name() == EVENT_STREAM_TASK:
+            self._reject(method, endpoint)
+
+        _LOGGER.debug("Deferring %s request %s %s, %d of %d calls used in the last 24h",
+                      PRIORITY_NAMES[priority], method, endpoint, len(self._calls), self.limit)
+        self.stats["deferred"] += 1
+        future = self._hass.loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future, get_request_haid(endpoint)))
+        self._schedule_release()
+        try:
+            await asyncio.wait_for(future, API_BUDGET_MAX_WAIT)
+        except asyncio.TimeoutError:
+            self._forget_waiter(future)
+            self._reject(method, endpoint)
+        except asyncio.CancelledError:
+            self._forget_waiter(future)
+            raise
+
+    def _forget_waiter(self, future:asyncio.Future) -> None:
+        self._waiters = [w for w in self._waiters if w[2] is not future]
+        heapq.heapify(self._waiters)
+
+    def _reject(self, method:str, endpoint:str) -> None:
+        self.stats["rejected"] += 1
+        _LOGGER.warning("Not sending request %s %s, the daily API call budget is used up (%d of %d calls used in the last 24h)",
+                        method, endpoint, len(self._calls), self.limit)
+        raise HomeConnectError(f"The daily API call budget is used up, request {method} {endpoint} was not sent", code=429)
+
+    @callback
+    def _release(self, *_) -> None:
+        """ Release the deferred requests that now fit in the budget, highest priority first """
+        self._unsub_timer = None
+        now = time.time()
+        self._prune(now)
+        while self._waiters and self._admits(self._waiters[0][0], now):
+            (priority, _, future, haid) = heapq.heappop(self._waiters)
+            if not future.done():
+                self.record(priority, haid)
+                future.set_result(None)
+        self._schedule_release()
+
+    def _schedule_release(self) -> None:
+        if self._unsub_timer or not self._waiters:
+            return
+        now = time.time()
+        if self._calls:
+            delay = max(self._calls[0][0] + self.window - now, 0) + 1
+        else:
+            delay = 1
+        # Re-evaluate at least every few minutes since the projection changes with the rate
+        self._unsub_timer = async_call_later(self._hass, min(delay, 300), self._release)
+
+    def available(self, priority:int) -> int:
+        """ The number of calls requests of the priority can make before they are deferred """
+        self._prune(time.time())
+        return max(self._threshold(priority) - len(self._calls), 0)
+
+    @property
+    def remaining(self) -> int:
+        """ The number of calls left in the current window """
+        self._prune(time.time())
+        return max(self.limit - len(self._calls), 0)
+
+    @property
+    def exhaustion_time(self) -> datetime|None:
+        """ The time at which the budget will be used up at the rate of the last hour, None if it won't happen in the window """
+        now = time.time()
+        self._prune(now)
+        recent = sum(1 for (t, _) in self._calls if t > now - 3600)
+        if not recent:
+            return None
+        remaining = self.limit - len(self._calls)
+        if remaining <= 0:
+            return datetime.fromtimestamp(now, timezone.utc)
+        seconds = remaining * 3600 / recent
+        if seconds > self.window:
+            return None
+        return datetime.fromtimestamp(now + seconds, timezone.utc)
+
+    @property
+    def used(self) -> int:
+        """ The number of calls made in the current window """
+        self._prune(time.time())
+        return len(self._calls)
+
+    def get_appliance_usage(self) -> dict[str, int]:
+        """ Return the number of calls made for each appliance in the current window """
+        self._prune(time.time())
+        usage = {}
+        for (_, haid) in self._calls:
+            if haid:
+                usage[haid] = usage.get(haid, 0) + 1
+        return usage
+
+    def get_stats(self) -> dict:
+        """ Return the budget counters for diagnostics """
+        exhaustion = self.exhaustion_time
+        return {
+            "limit": self.limit,
+            "used": len(self._calls),
+            "remaining": self.remaining,
+            "exhaustion_time": exhaustion.isoformat() if exhaustion else None,
+            "waiting": len(self._waiters),
+            **self.stats,
+        }
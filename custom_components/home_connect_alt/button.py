@@ -2,13 +2,17 @@ import json
 import logging
 from home_connect_async import Appliance, HomeConnect, HomeConnectError, Events
 from homeassistant.components.button import ButtonEntity
-from homeassistant.const import CONF_CLIENT_ID, CONF_CLIENT_SECRET
+from homeassistant.const import CONF_CLIENT_ID, CONF_CLIENT_SECRET, Platform
 from homeassistant.core import HomeAssistant
 from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType
 
 from .common import Configuration, EntityBase, EntityManager
+from .discovery import EntitySpec
+from .loader import ApplianceLoader
+from .refresh import async_refresh, REFRESH_SCOPE_FULL
 from .const import DOMAIN, HOME_CONNECT_DEVICE
 
 _LOGGER = logging.getLogger(__name__)
@@ -20,32 +24,23 @@ async def async_setup_entry(hass:HomeAssistant , config_entry:ConfigType, async_
     homeconnect:HomeConnect = entry_conf["homeconnect"]
     entity_manager = EntityManager(async_add_entities, "Button")
 
-    def add_appliance(appliance:Appliance) -> None:
-        conf = entry_conf.get_config()
-
-        if appliance.available_programs:
-            entity_manager.add(StartButton(appliance, None, conf))
-            entity_manager.add(StopButton(appliance, None, conf))
-        if appliance.commands:
-            for command in appliance.commands.values():
-                # The "BSH.Common.Command.AcknowledgeEvent" command is used to acknowledge the ProgramFinished state
-                if command.key not in ["BSH.Common.Command.PauseProgram", "BSH.Common.Command.ResumeProgram", "BSH.Common.Command.AcknowledgeEvent"]:
-                    button = CommandButton(appliance, command.key, conf, hc_obj=command)
-                    entity_manager.add(button)
-        entity_manager.register()
-
-    def remove_appliance(appliance:Appliance) -> None:
-        entity_manager.remove_appliance(appliance)
+    def build_entity(appliance:Appliance, spec:EntitySpec, conf:Configuration) -> Entity:
+        match spec.kind:
+            case "start":
+                return StartButton(appliance, None, conf)
+            case "stop":
+                return StopButton(appliance, None, conf)
+            case "command":
+                return CommandButton(appliance, spec.key, conf, hc_obj=spec.hc_obj)
+            case "refresh":
+                return RefreshButton(appliance, None, conf)
 
     # First add the integration button
     button_name_suffix = "" if entry_conf["primary_config_entry"] else "_"+config_entry.entry_id
-    async_add_entities([HomeConnectRefreshButton(homeconnect, button_name_suffix), HomeConnectDebugButton(homeconnect, button_name_suffix)])
+    async_add_entities([HomeConnectRefreshButton(entry_conf["loader"], button_name_suffix), HomeConnectDebugButton(homeconnect, button_name_suffix)])
 
-    # Subscribe for events and register existing appliances
-    homeconnect.register_callback(add_appliance, [Events.PAIRED, Events.DATA_CHANGED, Events.PROGRAM_STARTED, Events.PROGRAM_SELECTED])
-    homeconnect.register_callback(remove_appliance, Events.DEPAIRED)
-    for appliance in homeconnect.appliances.values():
-        add_appliance(appliance)
+    # Register with the shared discovery which adds the entities of the existing and future appliances
+    entry_conf["discovery"].register_platform(Platform.BUTTON, entity_manager, build_entity)
 
 
 class StartButton(EntityBase, ButtonEntity):
@@ -151,7 +146,7 @@ class StartButton(EntityBase, ButtonEntity):
         self._appliance.deregister_callback(self.async_on_update, events)
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
 
 
 class StopButton(EntityBase, ButtonEntity):
@@ -215,7 +210,7 @@ class StopButton(EntityBase, ButtonEntity):
         self._appliance.deregister_callback(self.async_on_update, events)
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
 
 
 class CommandButton(EntityBase, ButtonEntity):
@@ -243,14 +238,50 @@ class CommandButton(EntityBase, ButtonEntity):
             raise HomeAssistantError(f"Failed to stop the selected program ({ex.code})")
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
+
+class RefreshButton(EntityBase, ButtonEntity):
+    """ Class for a button that refreshes the data of a single appliance """
+    @property
+    def unique_id(self) -> str:
+        return f'{self.safe_haId}_refresh'
+
+    @property
+    def name_ext(self) -> str:
+        return "Refresh"
+
+    @property
+    def translation_key(self) -> str:
+        return "refresh_appliance"
+
+    @property
+    def icon(self) -> str:
+        return "mdi:refresh"
+
+    @property
+    def available(self) -> bool:
+        # A refresh is also useful for appliances that appear to be disconnected
+        return True
+
+    async def async_press(self) -> None:
+        """ Handle button press """
+        try:
+            await async_refresh(self.hass, self._appliance, self.get_entity_setting("refresh_scope", REFRESH_SCOPE_FULL))
+        except HomeConnectError as ex:
+            if ex.error_description:
+                raise HomeAssistantError(f"Failed to refresh the appliance data: {ex.error_description} ({ex.code})")
+            raise HomeAssistantError(f"Failed to refresh the appliance data ({ex.code})")
+
+    async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
+        pass
+
 
 class HomeConnectRefreshButton(ButtonEntity):
     """ Class for a button to trigger a global refresh of Home Connect data  """
     _attr_has_entity_name = True
 
-    def __init__(self, homeconnect:HomeConnect, name_suffix:str) -> None:
-        self._homeconnect = homeconnect
+    def __init__(self, loader:ApplianceLoader, name_suffix:str) -> None:
+        self._loader = loader
         self._name_suffix = name_suffix
         self.entity_id = f'button.{self.unique_id}'
 
@@ -278,7 +309,7 @@ class HomeConnectRefreshButton(ButtonEntity):
     async def async_press(self) -> None:
         """ Handle button press """
         try:
-            self._homeconnect.start_load_data_task(refresh=HomeConnect.RefreshMode.ALL)
+            self._loader.start(refresh=HomeConnect.RefreshMode.ALL)
         except HomeConnectError as ex:
             if ex.error_description:
                 raise HomeAssistantError(f"Failed to refresh the Home Connect data: {ex.error_description} ({ex.code})")
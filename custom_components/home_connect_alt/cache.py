@@ -0,0 +1,282 @@
+""" Persistent snapshot of the Home Connect data model used for warm starts """
+from __future__ import annotations
+import asyncio
+import json
+import logging
+from importlib.metadata import PackageNotFoundError, version
+
+from home_connect_async import Appliance, HomeConnect, Events
+from homeassistant.const import EVENT_HOMEASSISTANT_FINAL_WRITE
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers import storage
+from homeassistant.helpers.event import async_call_later
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN, CACHE_VERSION, CACHE_SAVE_DELAY, CACHE_FRESH_AGE, CACHE_MAX_AGE
+
+_LOGGER = logging.getLogger(__name__)
+
+PART_STATIC = "static"
+PART_DYNAMIC = "dynamic"
+IDENTITY_FIELDS = ["name", "brand", "vib", "type", "enumber", "haId", "uri"]
+DYNAMIC_EVENTS = ["*.Status.*", "*.Setting.*", "*.Option.*", "*.Root.*", Events.CONNECTION_CHANGED]
+
+
+def get_library_version() -> str|None:
+    """ Return the installed version of the home-connect-async library """
+    try:
+        return version("home-connect-async")
+    except PackageNotFoundError:
+        return None
+
+
+def _to_dict(value):
+    """ Convert a part of the data model to new plain JSON compatible data """
+    if isinstance(value, dict):
+        return { k: _to_dict(v) for k, v in value.items() }
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    return value
+
+
+class ApplianceCache():
+    """ The cached data of a single appliance
+
+    The data is split into a static part (identity, available programs with their option constraints and commands)
+    and a dynamic part (connection, programs, status and settings) which are stored and rewritten separately.
+    """
+
+    def __init__(self, hass:HomeAssistant, entry_id:str, haid:str) -> None:
+        self._hass = hass
+        self.haid = haid
+        key = f"{DOMAIN}_cache_{entry_id}_{haid.lower().replace('-','_')}"
+        self._stores = {
+            PART_STATIC: storage.Store(hass, version=CACHE_VERSION, key=f"{key}_{PART_STATIC}", private=True),
+            PART_DYNAMIC: storage.Store(hass, version=CACHE_VERSION, key=f"{key}_{PART_DYNAMIC}", private=True),
+        }
+        # The last data written for each part, compared with the captured data to skip unchanged parts
+        self._written:dict[str, dict|None] = { PART_STATIC: None, PART_DYNAMIC: None }
+        self.dirty:set[str] = set()
+
+    async def async_load(self) -> dict|None:
+        """ Load both parts and merge them into the JSON structure of an Appliance, None if any part is missing """
+        static, dynamic = await asyncio.gather(self._stores[PART_STATIC].async_load(), self._stores[PART_DYNAMIC].async_load())
+        if not static or not dynamic:
+            return None
+        self._written[PART_STATIC] = static
+        self._written[PART_DYNAMIC] = dynamic
+        data = dict(static["identity"])
+        data["available_programs"] = static["available_programs"]
+        data["commands"] = static["commands"]
+        data.update(dynamic)
+        return data
+
+    @staticmethod
+    def capture(appliance:Appliance, part:str) -> dict:
+        """ Capture a part of the appliance for serialization
+
+        This runs in the event loop and converts the part to plain data, which the library objects don't share,
+        so the library can keep updating the appliance while the store serializes it in the executor.
+        """
+        if part == PART_STATIC:
+            return _to_dict({
+                "identity": { field: getattr(appliance, field) for field in IDENTITY_FIELDS },
+                "available_programs": appliance.available_programs,
+                "commands": appliance.commands,
+            })
+        return _to_dict({
+            "connected": appliance.connected,
+            "selected_program": appliance.selected_program,
+            "active_program": appliance.active_program,
+            "status": appliance.status,
+            "settings": appliance.settings,
+        })
+
+    async def async_save(self, appliance:Appliance) -> int:
+        """ Rewrite the dirty parts of the appliance that actually changed and return the number of written parts """
+        parts = self.dirty
+        self.dirty = set()
+        written = 0
+        for part in parts:
+            data = self.capture(appliance, part)
+            # Comparing the plain data is much cheaper than serializing it, the store serializes it only if it changed
+            if data != self._written[part]:
+                await self._stores[part].async_save(data)
+                self._written[part] = data
+                written += 1
+        return written
+
+    async def async_remove(self) -> None:
+        """ Remove the cached parts of the appliance """
+        for store in self._stores.values():
+            await store.async_remove()
+
+
+class HomeConnectCache():
+    """ Versioned on-disk snapshot of the HomeConnect object of a single config entry
+
+    The snapshot is used to create the entities immediately on startup and to skip reloading
+    the static data from the Home Connect service, which saves API calls on every restart.
+    It is made of an index and the separately stored parts of every appliance (see ApplianceCache),
+    so a change in one appliance only rewrites the changed part of that appliance.
+    """
+
+    def __init__(self, hass:HomeAssistant, entry_id:str, lang:str|None) -> None:
+        self._hass = hass
+        self._entry_id = entry_id
+        self._lang = lang
+        self._index = storage.Store(hass, version=CACHE_VERSION, key=f"{DOMAIN}_cache_{entry_id}", private=True)
+        self._appliances:dict[str, ApplianceCache] = {}
+        self._homeconnect:HomeConnect|None = None
+        self._lock = asyncio.Lock()
+        self._cancel_save = None
+        self._unsub_final_write = None
+        self.loaded_from_cache = False
+
+    def _get_appliance_cache(self, haid:str) -> ApplianceCache:
+        if haid not in self._appliances:
+            self._appliances[haid] = ApplianceCache(self._hass, self._entry_id, haid)
+        return self._appliances[haid]
+
+    async def async_load(self, disabled_appliances:list[str]|None=None) -> tuple[str|None, HomeConnect.RefreshMode]:
+        """ Load the snapshot and return the JSON data and the refresh mode to use with it
+
+        Any problem with the stored index (corrupted file, schema or library version mismatch,
+        different language or a stale snapshot) clears the cache and falls back to a full load.
+        Appliances with missing parts are left out and loaded from the service and disabled appliances are left out.
+        """
+        try:
+            index = await self._index.async_load()
+            if not index:
+                _LOGGER.debug("There is no cached HomeConnect snapshot")
+                return None, HomeConnect.RefreshMode.ALL
+
+            if index.get("library_version") != get_library_version() or index.get("lang") != self._lang:
+                _LOGGER.debug("Discarding cached HomeConnect snapshot created with a different library version or language")
+                await self.async_clear()
+                return None, HomeConnect.RefreshMode.ALL
+
+            age = (dt_util.utcnow() - dt_util.parse_datetime(index["last_update"])).total_seconds()
+            if age > CACHE_MAX_AGE:
+                _LOGGER.debug("Discarding cached HomeConnect snapshot which is %d seconds old", age)
+                await self.async_clear()
+                return None, HomeConnect.RefreshMode.ALL
+
+            appliances = {}
+            for haid in index["appliances"]:
+                if disabled_appliances and (haid in disabled_appliances or haid.lower().replace('-','_') in disabled_appliances):
+                    continue
+                try:
+                    data = await self._get_appliance_cache(haid).async_load()
+                except Exception as ex:
+                    _LOGGER.debug("Exception while loading the cached data of appliance %s", haid, exc_info=ex)
+                    data = None
+                if data:
+                    appliances[haid] = data
+                else:
+                    _LOGGER.debug("The cached data of appliance %s is incomplete, it will be loaded from the service", haid)
+                    await self._appliances.pop(haid).async_remove()
+
+            self.loaded_from_cache = True
+            json_data = await self._hass.async_add_executor_job(json.dumps, { "appliances": appliances })
+            if age < CACHE_FRESH_AGE:
+                _LOGGER.debug("Using cached HomeConnect snapshot without refreshing it")
+                return json_data, HomeConnect.RefreshMode.NOTHING
+            _LOGGER.debug("Using cached HomeConnect snapshot and refreshing the dynamic data")
+            return json_data, HomeConnect.RefreshMode.DYNAMIC_ONLY
+        except Exception as ex:
+            # This includes snapshots stored with an unsupported schema version which can't be migrated
+            _LOGGER.debug("Exception while loading the HomeConnect snapshot, clearing the cache and continuing", exc_info=ex)
+            await self.async_clear()
+            return None, HomeConnect.RefreshMode.ALL
+
+    def attach(self, homeconnect:HomeConnect) -> None:
+        """ Start saving the HomeConnect object when its data model changes """
+        self._homeconnect = homeconnect
+        homeconnect.register_callback(self.on_appliance_changed, [Events.PAIRED, Events.DATA_CHANGED])
+        homeconnect.register_callback(self.on_dynamic_data_changed, DYNAMIC_EVENTS)
+        homeconnect.register_callback(self.async_on_appliance_removed, Events.DEPAIRED)
+        self._unsub_final_write = self._hass.bus.async_listen_once(EVENT_HOMEASSISTANT_FINAL_WRITE, self._async_on_final_write)
+
+    def on_appliance_changed(self, appliance:Appliance, event:str) -> None:
+        """ Handle events that may change any part of the appliance data """
+        self._get_appliance_cache(appliance.haId).dirty |= { PART_STATIC, PART_DYNAMIC }
+        self.schedule_save()
+
+    def on_dynamic_data_changed(self, appliance:Appliance, event:str) -> None:
+        """ Handle value updates which only change the dynamic part of the appliance data """
+        self._get_appliance_cache(appliance.haId).dirty.add(PART_DYNAMIC)
+        self.schedule_save()
+
+    async def async_on_appliance_removed(self, appliance:Appliance) -> None:
+        """ Drop the cached data of a depaired appliance """
+        appliance_cache = self._appliances.pop(appliance.haId, None)
+        if appliance_cache:
+            await appliance_cache.async_remove()
+        self.schedule_save()
+
+    def schedule_save(self) -> None:
+        """ Save the changes after CACHE_SAVE_DELAY seconds, all the changes in that window are saved together """
+        if self._homeconnect is None or self._cancel_save:
+            return
+        self._cancel_save = async_call_later(self._hass, CACHE_SAVE_DELAY, self._on_save_due)
+
+    @callback
+    def _on_save_due(self, now) -> None:
+        self._cancel_save = None
+        self._hass.async_create_task(self.async_save())
+
+    async def _async_on_final_write(self, event:Event) -> None:
+        self._unsub_final_write = None
+        await self.async_save()
+
+    async def async_save(self) -> None:
+        """ Write the dirty parts of all the appliances and update the index """
+        if self._homeconnect is None:
+            return
+        async with self._lock:
+            written = 0
+            for (haid, appliance_cache) in list(self._appliances.items()):
+                appliance = self._homeconnect.appliances.get(haid)
+                if appliance is None:
+                    continue
+                if appliance_cache.dirty:
+                    written += await appliance_cache.async_save(appliance)
+
+            await self._index.async_save({
+                "last_update": dt_util.utcnow().isoformat(),
+                "library_version": get_library_version(),
+                "lang": self._lang,
+                "appliances": [ haid for haid in self._appliances if haid in self._homeconnect.appliances ]
+            })
+            _LOGGER.debug("Saved HomeConnect snapshot to cache (%d appliance parts rewritten)", written)
+
+    async def async_unload(self) -> None:
+        """ Write the pending changes immediately, used when the config entry is unloaded """
+        if self._cancel_save:
+            self._cancel_save()
+            self._cancel_save = None
+            await self.async_save()
+        if self._unsub_final_write:
+            self._unsub_final_write()
+            self._unsub_final_write = None
+        self._homeconnect = None
+
+    async def async_clear(self) -> None:
+        """ Remove the stored snapshot """
+        self.loaded_from_cache = False
+        try:
+            index = await self._index.async_load()
+            if index and "appliances" in index:
+                for haid in index["appliances"]:
+                    self._get_appliance_cache(haid)
+        except Exception as ex:
+            _LOGGER.debug("Failed to read the HomeConnect snapshot index, only clearing the known appliances", exc_info=ex)
+        try:
+            for appliance_cache in self._appliances.values():
+                await appliance_cache.async_remove()
+            self._appliances = {}
+            await self._index.async_remove()
+            _LOGGER.debug("Cleared HomeConnect snapshot from cache")
+        except Exception as ex:
+            _LOGGER.debug("Exception when clearing the HomeConnect snapshot", exc_info=ex)
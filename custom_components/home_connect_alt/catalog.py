@@ -0,0 +1,151 @@
+""" Sharing of the static catalog objects between appliances of the same model """
+from __future__ import annotations
+import logging
+import sys
+import weakref
+
+from home_connect_async import Appliance, HomeConnect, Events
+from home_connect_async.appliance import Command, Option
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+OPTION_FIELDS = ["key", "value", "type", "name", "unit", "displayvalue", "min", "max", "stepsize", "allowedvalues",
+                 "allowedvaluesdisplay", "execution", "liveupdate", "default", "access"]
+STRING_FIELDS = ["key", "name", "unit", "displayvalue", "type", "execution", "access"]
+
+
+def intern_key(key:str|None) -> str|None:
+    """ Intern a Home Connect key string so the appliances and entities share a single copy """
+    return sys.intern(key) if isinstance(key, str) else key
+
+
+def _sizeof(obj, seen:set[int]|None = None) -> int:
+    """ Approximate the memory used by a catalog object and the objects it owns """
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_sizeof(k, seen) + _sizeof(v, seen) for (k, v) in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_sizeof(v, seen) for v in obj)
+    elif hasattr(obj, "__dict__"):
+        size += _sizeof(obj.__dict__, seen)
+    return size
+
+
+def _freeze(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+class CatalogInterner():
+    """ Deduplicate the static catalog of the appliances
+
+    The options of the available programs and the commands of an appliance are never modified once they are
+    loaded, so appliances of the same model can share them instead of each holding its own copy. The objects are
+    pooled by their content and the pools hold them weakly so a catalog is released when the last appliance using
+    it is gone. The keys of the programs, options, status, settings and commands are interned as well.
+    The bytes of the duplicate objects that were dropped are counted per appliance for the memory report.
+    """
+
+    def __init__(self) -> None:
+        self._options:weakref.WeakValueDictionary[tuple, Option] = weakref.WeakValueDictionary()
+        self._commands:weakref.WeakValueDictionary[tuple, Command] = weakref.WeakValueDictionary()
+        # haId => the available programs and commands containers when they were last interned
+        self._interned:dict[str, tuple[dict|None, dict|None]] = {}
+        self._saved:dict[str, int] = {}
+
+    @classmethod
+    def get(cls, hass:HomeAssistant) -> CatalogInterner:
+        """ Return the catalog interner of the integration, creating it on first use """
+        domain_data = hass.data.setdefault(DOMAIN, {})
+        if "catalog" not in domain_data:
+            domain_data["catalog"] = CatalogInterner()
+        return domain_data["catalog"]
+
+    def attach(self, homeconnect:HomeConnect) -> None:
+        """ Intern the catalog of the appliances of the HomeConnect object whenever it is loaded """
+        homeconnect.register_callback(self.intern_appliance, [Events.PAIRED, Events.CONNECTED, Events.DATA_CHANGED])
+        homeconnect.register_callback(self.forget_appliance, Events.DEPAIRED)
+        for appliance in homeconnect.appliances.values():
+            self.intern_appliance(appliance)
+
+    def forget_appliance(self, appliance:Appliance) -> None:
+        """ Drop the accounting of a removed appliance """
+        self._interned.pop(appliance.haId, None)
+        self._saved.pop(appliance.haId, None)
+
+    def intern_appliance(self, appliance:Appliance) -> None:
+        """ Replace the catalog objects of the appliance with the shared ones, it is a no-op if they weren't reloaded """
+        interned = self._interned.get(appliance.haId)
+        if interned and interned[0] is appliance.available_programs and interned[1] is appliance.commands:
+            return
+        saved = 0
+        seen:set[int] = set()
+
+        if appliance.available_programs:
+            programs = {}
+            for program in appliance.available_programs.values():
+                # The Program objects are updated in place by the library so only their options are shared
+                program.key = intern_key(program.key)
+                program.name = intern_key(program.name)
+                if program.options:
+                    options = {}
+                    for option in program.options.values():
+                        shared = self._share(self._options, self._option_signature(option), option)
+                        if shared is not option:
+                            saved += _sizeof(option, seen)
+                        options[shared.key] = shared
+                    program.options = options
+                programs[program.key] = program
+            appliance.available_programs = programs
+
+        if appliance.commands:
+            commands = {}
+            for command in appliance.commands.values():
+                shared = self._share(self._commands, (command.key, command.name), command)
+                if shared is not command:
+                    saved += _sizeof(command, seen)
+                commands[shared.key] = shared
+            appliance.commands = commands
+
+        # The status and settings values change but their keys are the same for every appliance of the model
+        for item in list((appliance.status or {}).values()) + list((appliance.settings or {}).values()):
+            item.key = intern_key(item.key)
+
+        self._interned[appliance.haId] = (appliance.available_programs, appliance.commands)
+        self._saved[appliance.haId] = saved
+        if saved:
+            _LOGGER.debug("Shared the catalog of appliance %s with other appliances, saving about %d bytes", appliance.haId, saved)
+
+    @staticmethod
+    def _option_signature(option:Option) -> tuple:
+        return tuple(_freeze(getattr(option, field)) for field in OPTION_FIELDS)
+
+    @staticmethod
+    def _share(pool:weakref.WeakValueDictionary, signature:tuple, obj):
+        try:
+            shared = pool.get(signature)
+        except TypeError:
+            # Unexpected unhashable values, the object is kept as is
+            return obj
+        if shared is not None:
+            return shared
+        for field in STRING_FIELDS:
+            if hasattr(obj, field):
+                setattr(obj, field, intern_key(getattr(obj, field)))
+        pool[signature] = obj
+        return obj
+
+    def get_report(self) -> dict:
+        """ Return the memory report of the shared catalog for diagnostics """
+        return {
+            "shared_options": len(self._options),
+            "shared_commands": len(self._commands),
+            "saved_bytes": sum(self._saved.values()),
+            "saved_bytes_per_appliance": dict(self._saved),
+        }
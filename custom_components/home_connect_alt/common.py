@@ -1,18 +1,28 @@
 from __future__ import annotations
+import asyncio
 import logging
 import re
+import time
+import weakref
 from abc import ABC, abstractmethod
+from functools import partial
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Mapping
 
-from home_connect_async import Appliance, Events
-from homeassistant.core import HomeAssistant
+from home_connect_async import Appliance, Events, HealthStatus, HomeConnectError
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
-from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.event import async_call_later
 
-from .const import CONF_NAME_TEMPLATE, CONF_NAME_TEMPLATE_DEFAULT, DOMAIN, DEFAULT_SETTINGS, CONF_ENTITY_SETTINGS, CONF_APPLIANCE_SETTINGS
+from .appliance_index import ApplianceIndex
+from .catalog import intern_key
+from .const import CONF_NAME_TEMPLATE, CONF_NAME_TEMPLATE_DEFAULT, DOMAIN, DEFAULT_SETTINGS, CONF_ENTITY_SETTINGS, CONF_APPLIANCE_SETTINGS, OPTIMISTIC_TIMEOUT, ENTITY_UPDATE_FILTERS
 
 _LOGGER = logging.getLogger(__name__)
 
+_NO_VALUE = object()
+
 def is_boolean_enum(values:list[str]) -> bool:
     """ Check if the list of enum values represents a boolean on/off option"""
     if not values or len(values) != 2:
@@ -24,6 +34,57 @@ def is_boolean_enum(values:list[str]) -> bool:
             return False
     return True
 
+PROGRAM_RUN_TIME_OPTIONS = [
+    "BSH.Common.Option.RemainingProgramTime",
+    "BSH.Common.Option.FinishInRelative",
+    "BSH.Common.Option.EstimatedTotalProgramTime",
+]
+
+def get_program_run_time(appliance:Appliance) -> int|None:
+    """ Try to get the expected run time of the selected program or the remaining time of the running program """
+    for key in PROGRAM_RUN_TIME_OPTIONS:
+        o = appliance.get_applied_program_option(key)
+        if o:
+            return o.value
+
+    return None
+
+class ObservableHealthStatus(HealthStatus):
+    """ The health status of a config entry which calls its listeners when the status or the blocked time changes
+
+    The library doesn't notify about health changes so the integration gives the HomeConnect object and its
+    API object an instance of this class in place of the one the library created.
+    """
+
+    def __init__(self, health:HealthStatus|None = None) -> None:
+        """ Start from the state of the health status the library created, if given """
+        super().__init__()
+        if health:
+            self._status = health._status
+            self._blocked_until = health._blocked_until
+        self._listeners:list[Callable[[], None]] = []
+
+    def set_status(self, status:HealthStatus.Status, delay:int=None) -> None:
+        before = (self.get_status(), self.get_blocked_until())
+        super().set_status(status, delay)
+        self._notify_if_changed(before)
+
+    def unset_status(self, status:HealthStatus.Status) -> None:
+        before = (self.get_status(), self.get_blocked_until())
+        super().unset_status(status)
+        self._notify_if_changed(before)
+
+    def _notify_if_changed(self, before:tuple) -> None:
+        if (self.get_status(), self.get_blocked_until()) != before:
+            for listener in list(self._listeners):
+                listener()
+
+    def add_listener(self, listener:Callable[[], None]) -> Callable[[], None]:
+        """ Call the listener whenever the status changes, returns a function that removes it """
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
+
+
 class EntityBase(ABC):
     """Base class with common methods for all the entities """
 
@@ -36,13 +97,17 @@ class EntityBase(ABC):
         """Initialize the sensor."""
         self._appliance = appliance
         self._homeconnect = appliance._homeconnect
-        self._key = key
+        # Interned so the entities of all the appliances share the key strings of the catalog
+        self._key = intern_key(key)
         self._conf: Configuration = conf
         self._haid:str = ""
         self._safe_haid: str = ""
         self._unique_id:str = ""
         self.entity_id = f'{self._platform_domain()}.{self.unique_id}'
         self._hc_obj = hc_obj
+        self._last_fingerprint:tuple|None = None
+        self._last_write_time = 0.0
+        self._cancel_filter_timer = None
 
     def _platform_domain(self) -> str:
         """Return the HA platform domain (sensor, switch, ...) derived from the MRO."""
@@ -64,19 +129,7 @@ class EntityBase(ABC):
     @staticmethod
     def get_safe_haID(hass: HomeAssistant, appliance: Appliance) -> str:
         """ Returns a haID that doesn't start with a digit by adding the brand as a prefix if needed """
-        haid = appliance.haId.lower().replace('-', '_')
-        if haid[0].isdigit():
-            # if the haID starts with a digit and there aren't entities that use that haid already then add the brand as a prefix to the haId
-            # This is to avoid issues with using such entities in templates
-            ent_reg = er.async_get(hass)
-            all_entities_ids = ent_reg.entities.keys()
-            existing_entities = [eid for eid in all_entities_ids if f".{haid}" in eid]
-            if not existing_entities:
-                haid = appliance.brand.lower() + "_" + haid
-            else:
-                _LOGGER.debug("Not adding brand prefix to haID %s because there are existing entities without it", haid)
-
-        return haid
+        return ApplianceIndex.get(hass).get_safe_haid(appliance)
 
     @property
     def haId(self) -> str:
@@ -128,9 +181,8 @@ class EntityBase(ABC):
     def name(self) -> str:
         """" The name of the entity """
         # haId = self._appliance.haId
-        if self._conf and CONF_APPLIANCE_SETTINGS in self._conf and self._conf[CONF_APPLIANCE_SETTINGS] \
-            and self.haId in self._conf[CONF_APPLIANCE_SETTINGS] and CONF_NAME_TEMPLATE in self._conf[CONF_APPLIANCE_SETTINGS][self.haId]:
-            template = self._conf[CONF_APPLIANCE_SETTINGS][self.haId][CONF_NAME_TEMPLATE]
+        if self._conf and self._conf.get_appliance_setting(self.haId, CONF_NAME_TEMPLATE):
+            template = self._conf.get_appliance_setting(self.haId, CONF_NAME_TEMPLATE)
         elif self._conf and CONF_NAME_TEMPLATE in self._conf and self._conf[CONF_NAME_TEMPLATE]:
             template = self._conf[CONF_NAME_TEMPLATE]
         else:
@@ -162,24 +214,114 @@ class EntityBase(ABC):
             )
         )
 
+    @property
+    def data_keys(self) -> set[str]|None:
+        """ The keys of the data the entity state depends on, None if it may depend on any data of the appliance
+
+        DATA_CHANGED events are dispatched to the entity only when the data of one of these keys has changed
+        """
+        return {self._key} if self._key else None
+
     async def async_added_to_hass(self):
         """Run when this Entity has been added to HA."""
-        events = [Events.CONNECTION_CHANGED, Events.DATA_CHANGED, Events.PROGRAM_SELECTED]
+        events = [Events.CONNECTION_CHANGED, Events.PROGRAM_SELECTED]
         if self._key:
             events.append(self._key)
         self._appliance.register_callback(self.async_on_update, events)
+        self._conf["dispatcher"].register(self._appliance, self)
 
     async def async_will_remove_from_hass(self):
         """Entity being removed from hass."""
-        events = [Events.CONNECTION_CHANGED, Events.DATA_CHANGED, Events.PROGRAM_SELECTED]
+        events = [Events.CONNECTION_CHANGED, Events.PROGRAM_SELECTED]
         if self._key:
             events.append(self._key)
         self._appliance.deregister_callback(self.async_on_update, events)
+        self._conf["dispatcher"].deregister(self._appliance, self)
+        self._conf["state_writer"].discard(self)
+        if self._cancel_filter_timer:
+            self._cancel_filter_timer()
+            self._cancel_filter_timer = None
 
     @abstractmethod
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
         pass
 
+    @callback
+    def schedule_write_ha_state(self) -> None:
+        """ Request a state write which is coalesced with the other updates of the current update window """
+        self._conf["state_writer"].schedule(self)
+
+    def state_fingerprint(self) -> tuple:
+        """ A comparable summary of everything that a state write publishes """
+        available = self.available
+        return (
+            available,
+            self.state if available else None,
+            self.capability_attributes,
+            self.extra_state_attributes,
+            self.translation_key,
+            self.icon,
+            self.name,
+        )
+
+    @callback
+    def async_write_ha_state(self) -> None:
+        """ Write the state and remember its fingerprint """
+        self._last_fingerprint = self.state_fingerprint()
+        self._last_write_time = time.monotonic()
+        super().async_write_ha_state()
+
+    @callback
+    def async_write_ha_state_if_changed(self) -> bool:
+        """ Write the state only if it is different from the last written state and passes the update filter of the entity, return True if it was written """
+        fingerprint = self.state_fingerprint()
+        if fingerprint == self._last_fingerprint or self._filter_update(fingerprint):
+            return False
+        self._last_fingerprint = fingerprint
+        self._last_write_time = time.monotonic()
+        super().async_write_ha_state()
+        return True
+
+    def _filter_update(self, fingerprint:tuple) -> bool:
+        """ Apply the deadband, min_interval and max_interval entity settings, return True if the write is held back
+
+        Only changes of a numeric state are filtered, a change of the availability or of the attributes is
+        always written. A held back value is written when the interval that held it back expires.
+        """
+        update_filter = self._conf.get_update_filter(self._key) if self._key else None
+        last = self._last_fingerprint
+        if not update_filter or last is None or fingerprint[0] != last[0] or fingerprint[2:] != last[2:]:
+            return False
+        try:
+            change = abs(float(fingerprint[1]) - float(last[1]))
+        except (TypeError, ValueError):
+            return False
+
+        (deadband, min_interval, max_interval) = update_filter
+        elapsed = time.monotonic() - self._last_write_time
+        if min_interval and elapsed < min_interval:
+            self._schedule_filtered_write(min_interval - elapsed)
+        elif deadband and change < deadband:
+            if max_interval:
+                if elapsed >= max_interval:
+                    return False
+                self._schedule_filtered_write(max_interval - elapsed)
+        else:
+            return False
+        self._conf["state_writer"].count_filtered(self._key)
+        return True
+
+    def _schedule_filtered_write(self, delay:float) -> None:
+        if self._cancel_filter_timer:
+            return
+
+        @callback
+        def write_filtered(_now) -> None:
+            self._cancel_filter_timer = None
+            self.schedule_write_ha_state()
+
+        self._cancel_filter_timer = async_call_later(self.hass, delay, write_filtered)
+
     def pretty_enum(self, val:str) -> str:
         """Extract display string from a Home Connect Enum string."""
         name = val.split('.')[-1]
@@ -188,25 +330,132 @@ class EntityBase(ABC):
 
 
 class InteractiveEntityBase(EntityBase):
-    """ Base class for interactive entities (select, switch and number) """
+    """ Base class for interactive entities (select, switch and number)
+
+    A value written by the user is shown optimistically until the appliance confirms it with an event for
+    one of the confirmation keys. The entity reverts to the actual data if the confirmation doesn't arrive in time,
+    and if the write fails to the last value that was sent successfully and isn't confirmed yet, if there is one.
+    """
+
+    _optimistic_value = _NO_VALUE
+    # Identifies the write that set the optimistic value, only that write rolls it back
+    _optimistic_token = None
+    # The value of the last write that was sent successfully and is waiting for its confirmation
+    _sent_value = _NO_VALUE
+    _cancel_optimistic = None
+
+    @property
+    def data_keys(self) -> set[str]|None:
+        keys = super().data_keys
+        return keys | {"BSH.Common.Status.RemoteControlActive"} if keys is not None else None
+
+    @property
+    def confirmation_keys(self) -> list[str]:
+        """ The keys of the events that confirm a value written by the entity """
+        return [self._key] if self._key else []
 
     async def async_added_to_hass(self):
         await super().async_added_to_hass()
         if self._key != "BSH.Common.Status.RemoteControlActive":
             self._appliance.register_callback(self.async_on_update, "BSH.Common.Status.RemoteControlActive")
+        if self.confirmation_keys:
+            self._appliance.register_callback(self._async_on_confirmation, self.confirmation_keys)
 
     async def async_will_remove_from_hass(self):
         await super().async_will_remove_from_hass()
         if self._key != "BSH.Common.Status.RemoteControlActive":
             self._appliance.deregister_callback(self.async_on_update, "BSH.Common.Status.RemoteControlActive")
+        if self.confirmation_keys:
+            self._appliance.deregister_callback(self._async_on_confirmation, self.confirmation_keys)
+        self.clear_optimistic_value()
+
+    async def async_write(self, write:Callable[[], Awaitable], key:str|None=None) -> Any:
+        """ Send a write to the appliance through the write queue of the config entry, superseded writes return None """
+        return await self._conf["write_queue"].async_write(self._appliance, key or self._key, write)
+
+    async def async_write_optimistic(self, value, write:Callable[[], Awaitable], key:str|None=None) -> Any:
+        """ Show the value immediately and send the write
+
+        If the write fails while its value is still shown, the entity reverts to the value of the last write
+        that was sent successfully and isn't confirmed yet, or to the actual data.
+        """
+        token = self.set_optimistic_value(value)
+
+        async def async_write_value():
+            result = await write()
+            self._sent_value = value
+            return result
+
+        try:
+            return await self.async_write(async_write_value, key)
+        except Exception:
+            if self._optimistic_token is token:
+                self._revert_optimistic_value()
+            raise
+
+    @callback
+    def _revert_optimistic_value(self) -> None:
+        if self._sent_value is not _NO_VALUE:
+            self.set_optimistic_value(self._sent_value)
+        elif self.clear_optimistic_value():
+            self.async_write_ha_state()
+
+    @property
+    def has_optimistic_value(self) -> bool:
+        """ True while a written value is waiting for a confirmation from the appliance """
+        return self._optimistic_value is not _NO_VALUE
+
+    @property
+    def optimistic_value(self):
+        """ The written value which is shown until it is confirmed """
+        return self._optimistic_value
+
+    @callback
+    def set_optimistic_value(self, value) -> object:
+        """ Show a written value until the appliance confirms it or the confirmation times out, returns the token of the value """
+        self.clear_optimistic_value()
+        self._optimistic_value = value
+        self._optimistic_token = object()
+        self._cancel_optimistic = async_call_later(self.hass, OPTIMISTIC_TIMEOUT, self._on_optimistic_timeout)
+        self.async_write_ha_state()
+        return self._optimistic_token
+
+    @callback
+    def clear_optimistic_value(self) -> bool:
+        """ Drop the optimistic value, returns True if there was one """
+        if self._cancel_optimistic:
+            self._cancel_optimistic()
+            self._cancel_optimistic = None
+        self._optimistic_token = None
+        if self._optimistic_value is _NO_VALUE:
+            return False
+        self._optimistic_value = _NO_VALUE
+        return True
+
+    @callback
+    def _on_optimistic_timeout(self, now) -> None:
+        self._cancel_optimistic = None
+        shown = self.state
+        self._optimistic_value = _NO_VALUE
+        self._optimistic_token = None
+        self._sent_value = _NO_VALUE
+        if self.state != shown:
+            _LOGGER.error("The appliance didn't confirm the new value of %s within %d seconds, reverting to %s", self.entity_id, OPTIMISTIC_TIMEOUT, self.state)
+        self.async_write_ha_state()
+
+    async def _async_on_confirmation(self, appliance:Appliance, key:str, value) -> None:
+        # The state now reflects the data reported by the appliance, which may differ from the written value
+        self._sent_value = _NO_VALUE
+        if self.clear_optimistic_value():
+            self.schedule_write_ha_state()
 
 
 class EntityManager():
     """Helper class for managing entity registration.
 
-    Duplication might happen because there is a race condition between the task that
-    loads data from the Home Connect service and the initialization of the platforms.
-    This class prevents that from happening.
+    The entities are handed to it by the EntityDiscovery of the config entry as each appliance
+    becomes ready, independently of when the platform was set up. The entities are still checked
+    against the registered IDs since an appliance that reloads can report entities again.
     """
     def __init__(self, async_add_entities:AddEntitiesCallback, platform:str):
         self._existing_ids = set()
@@ -237,75 +486,311 @@ class EntityManager():
 
     def remove_appliance(self, appliance:Appliance):
         """ Remove an appliance and all its registered entities """
-        if appliance.haId in self._entity_appliance_map:
-            self._existing_ids -= self._entity_appliance_map[appliance.haId]
-            del self._entity_appliance_map[appliance.haId]
+        haid = appliance.normalized_haId
+        if haid in self._entity_appliance_map:
+            self._existing_ids -= self._entity_appliance_map[haid]
+            del self._entity_appliance_map[haid]
+
+
+class StateWriteScheduler():
+    """ Coalesce the state writes of the entities of a config entry
+
+    A burst of events, like the ones received when a program starts, makes the same entity update its state
+    several times within milliseconds. Entities mark themselves as dirty instead and a single flush, at the end
+    of the update window or on the next iteration of the event loop when the window is 0, writes the state of
+    each dirty entity once. Writes that wouldn't change the state of the entity are suppressed.
+    """
+
+    def __init__(self, hass:HomeAssistant, window:int) -> None:
+        """ The window is specified in milliseconds """
+        self._hass = hass
+        self._window = window/1000
+        self._dirty:dict[EntityBase, None] = {}
+        self._cancel_flush = None
+        self.stats = { "requested": 0, "emitted": 0, "suppressed": 0, "filtered": 0 }
+        self.filtered_keys:dict[str, int] = {}
+
+    @callback
+    def schedule(self, entity:EntityBase) -> None:
+        """ Mark the entity as dirty and schedule a flush if one isn't pending """
+        self.stats["requested"] += 1
+        self._dirty[entity] = None
+        if self._cancel_flush:
+            return
+        if self._window:
+            self._cancel_flush = async_call_later(self._hass, self._window, self._flush)
+        else:
+            self._cancel_flush = self._hass.loop.call_soon(self._flush).cancel
+
+    def count_filtered(self, key:str) -> None:
+        """ Count a write held back by the update filter of an entity, these are included in the suppressed writes """
+        self.stats["filtered"] += 1
+        self.filtered_keys[key] = self.filtered_keys.get(key, 0) + 1
+
+    @callback
+    def discard(self, entity:EntityBase) -> None:
+        """ Drop a pending write of an entity that is being removed """
+        self._dirty.pop(entity, None)
+
+    @callback
+    def _flush(self, now=None) -> None:
+        self._cancel_flush = None
+        dirty = self._dirty
+        self._dirty = {}
+        for entity in dirty:
+            if entity.hass:
+                if entity.async_write_ha_state_if_changed():
+                    self.stats["emitted"] += 1
+                else:
+                    self.stats["suppressed"] += 1
+
+    @callback
+    def cancel(self) -> None:
+        """ Cancel the pending flush, used when the config entry is unloaded """
+        if self._cancel_flush:
+            self._cancel_flush()
+            self._cancel_flush = None
+        self._dirty = {}
+
+
+class PendingWrite():
+    """ The latest write requested for a key of an appliance which wasn't sent yet """
+
+    def __init__(self, write:Callable[[], Awaitable], future:asyncio.Future, superseded:list[asyncio.Future]|None = None) -> None:
+        self.write = write
+        self.future = future
+        # The futures of the writes this write replaced, they complete with it
+        self.superseded = superseded or []
+
+    def set_result(self, result) -> None:
+        """ Complete the write, the superseded writes return None """
+        if not self.future.done():
+            self.future.set_result(result)
+        for future in self.superseded:
+            if not future.done():
+                future.set_result(None)
+
+    def set_exception(self, ex:Exception) -> None:
+        """ Fail the write and the writes it superseded """
+        for future in [self.future] + self.superseded:
+            if not future.done():
+                future.set_exception(ex)
+
+
+class WriteQueue():
+    """ Coalesce and serialize the writes of the interactive entities to the appliances
+
+    Dragging a slider or tapping through the values of a select sends a write for every intermediate value.
+    A write to a key that wasn't written recently is sent right away, the writes to the same key of the same
+    appliance that follow within the window are held and only the last of them is sent when the window ends.
+    The callers of the superseded writes return with the write that replaced them, None if it succeeded and its
+    error if it failed.
+    The writes to each appliance are sent one at a time since the appliances tend to reject concurrent changes.
+    """
+
+    def __init__(self, hass:HomeAssistant, window:int) -> None:
+        """ The window is specified in milliseconds """
+        self._hass = hass
+        self._window = window/1000
+        self._pending:dict[tuple[str, str], PendingWrite] = {}
+        # (haId, key) => cancels the window that started when a write to the key was sent
+        self._windows:dict[tuple[str, str], Callable[[], None]] = {}
+        # haId => [lock, number of writes waiting for it or holding it]
+        self._locks:dict[str, list] = {}
+        self._tasks:dict[asyncio.Task, PendingWrite] = {}
+        self.stats = { "requested": 0, "sent": 0, "superseded": 0, "failed": 0 }
+
+    async def async_write(self, appliance:Appliance, key:str, write:Callable[[], Awaitable]) -> Any:
+        """ Send a write or queue it until the window of the key ends, returns the result of the write or None if it was superseded """
+        self.stats["requested"] += 1
+        pending_key = (appliance.haId, key)
+        previous = self._pending.pop(pending_key, None)
+        superseded = None
+        if previous:
+            superseded = previous.superseded + [previous.future]
+            self.stats["superseded"] += 1
+            _LOGGER.debug("Superseded a pending write of %s to appliance %s", key, appliance.haId)
+
+        pending = PendingWrite(write, self._hass.loop.create_future(), superseded)
+        if pending_key in self._windows:
+            self._pending[pending_key] = pending
+        else:
+            self._send(pending_key, pending)
+        return await pending.future
+
+    def _send(self, pending_key:tuple[str, str], pending:PendingWrite) -> None:
+        task = self._hass.async_create_task(self._async_send(pending_key[0], pending))
+        self._tasks[task] = pending
+        task.add_done_callback(self._forget_task)
+        self._windows[pending_key] = async_call_later(self._hass, self._window, partial(self._on_window_end, pending_key))
+
+    def _forget_task(self, task:asyncio.Task) -> None:
+        self._tasks.pop(task, None)
+
+    @callback
+    def _on_window_end(self, pending_key:tuple[str, str], _now) -> None:
+        del self._windows[pending_key]
+        pending = self._pending.pop(pending_key, None)
+        if pending:
+            self._send(pending_key, pending)
+
+    async def _async_send(self, haid:str, pending:PendingWrite) -> None:
+        lock = self._locks.setdefault(haid, [asyncio.Lock(), 0])
+        lock[1] += 1
+        try:
+            async with lock[0]:
+                result = await pending.write()
+            self.stats["sent"] += 1
+            pending.set_result(result)
+        except Exception as ex:
+            self.stats["sent"] += 1
+            self.stats["failed"] += 1
+            pending.set_exception(ex)
+        finally:
+            lock[1] -= 1
+            # The lock of an appliance is dropped when none of its writes is using it, so removed appliances don't keep one
+            if not lock[1]:
+                del self._locks[haid]
+
+    @callback
+    def cancel(self) -> None:
+        """ Drop the pending writes and the writes being sent, used when the config entry is unloaded """
+        for cancel_window in self._windows.values():
+            cancel_window()
+        self._windows = {}
+        for pending in list(self._pending.values()) + list(self._tasks.values()):
+            pending.set_exception(HomeConnectError("The write was dropped because the config entry was unloaded"))
+        self._pending = {}
+        for task in self._tasks:
+            task.cancel()
 
 
 class Configuration(dict):
-    """ A class to handle both global config coming from configuration.yaml and the local config of each entity """
+    """ Layered configuration: defaults, configuration.yaml, the config entry and the local config of each entity
+
+    Each layer only holds its own values and missing keys are looked up in the parent layer, so creating the
+    config of an entity doesn't copy or merge anything. Entity and appliance settings are resolved across
+    all the layers, one option at a time, and the result is memoized per key until the settings change.
+    A setting changed in a layer only drops the memoized settings of that layer and the layers on top of it.
+    """
     _global_config:dict|None = None
     _hass:HomeAssistant
+    # Incremented whenever settings change to invalidate the memoized settings of all the layers
+    _generation:int = 0
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, parent:Configuration|None=None, **kwargs):
         super().__init__(*args, **kwargs)
-        # __merge mutates self in place and returns self; no further .update needed.
-        self.__merge(self, DEFAULT_SETTINGS, overwrite=False)
-        if Configuration._global_config:
-            self.__merge(self, Configuration._global_config, overwrite=False)
-
-    def __merge(self, destination:dict, source:dict, overwrite:bool=True ):
-        for key, value in source.items():
-            # Configuration instances are per-entry runtime storage, not config
-            # to be merged. Skipping them keeps __merge robust even if a future
-            # change re-introduces aliasing between _global_config and the
-            # integration's hass.data[DOMAIN] (the original source of the
-            # RecursionError that this guard defends against).
-            if isinstance(value, Configuration):
-                continue
-            if isinstance(value, dict):
-                # get node or create one
-                node = destination.setdefault(key, {})
-                if node is not value:
-                    self.__merge(node, value, overwrite)
-            else:
-                if key not in destination or overwrite:
-                    destination[key] = value
-
-        return destination
+        self._parent = parent
+        self._children:list[weakref.ref[Configuration]] = []
+        if parent is not None:
+            parent._children.append(weakref.ref(self))
+        self._resolved:dict[tuple[str, str], Mapping] = {}
+        self._resolved_generation = Configuration._generation
+
+    def _base_layers(self) -> list[dict]:
+        """ The layers below the root Configuration, top to bottom """
+        return [Configuration._global_config or {}, DEFAULT_SETTINGS]
+
+    def __missing__(self, key):
+        if self._parent is not None:
+            return self._parent[key]
+        for layer in self._base_layers():
+            if key in layer:
+                return layer[key]
+        raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        if dict.__contains__(self, key):
+            return True
+        if self._parent is not None:
+            return key in self._parent
+        return any(key in layer for layer in self._base_layers())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def _resolve(self, section:str, key:str) -> Mapping:
+        """ Return the read-only settings of the key in the section merged across all the layers """
+        if self._parent is not None and not dict.get(self, section):
+            # This layer doesn't override any settings so share the memoized settings of the parent
+            return self._parent._resolve(section, key)
+
+        if self._resolved_generation != Configuration._generation:
+            self._resolved = {}
+            self._resolved_generation = Configuration._generation
+        resolved = self._resolved.get((section, key))
+        if resolved is None:
+            layers = []
+            c = self
+            while c is not None:
+                layers.append(dict.get(c, section))
+                c = c._parent
+            layers.extend(layer.get(section) for layer in self._base_layers())
+            resolved = {}
+            # The top layers override the bottom layers
+            for settings in reversed(layers):
+                if settings and key in settings and settings[key]:
+                    resolved.update(settings[key])
+            # The memoized settings are shared by all the callers so they are read-only
+            resolved = self._resolved[(section, key)] = MappingProxyType(resolved)
+        return resolved
 
     def get_entity_setting(self, key:str, option:str, default=None):
         """ Retrun an entity config setting or None if it doesn't exist """
-        if CONF_ENTITY_SETTINGS in self and  self[CONF_ENTITY_SETTINGS] and key in self[CONF_ENTITY_SETTINGS] and option in self[CONF_ENTITY_SETTINGS][key]:
-            return self[CONF_ENTITY_SETTINGS][key][option]
-        return default
+        return self._resolve(CONF_ENTITY_SETTINGS, key).get(option, default)
 
     def has_entity_setting(self, key:str, option:str) -> bool:
         """Checks if the entity config setting exist """
-        if CONF_ENTITY_SETTINGS in self and self[CONF_ENTITY_SETTINGS] and key in self[CONF_ENTITY_SETTINGS] and option in self[CONF_ENTITY_SETTINGS][key]:
-            return True
-        return False
+        return option in self._resolve(CONF_ENTITY_SETTINGS, key)
 
     def set_entity_setting(self, key:str, option:str, value):
-        """Return an entity config setting or None if it doesn't exist."""
-        if CONF_ENTITY_SETTINGS not in self:
+        """Set an entity config setting in this layer."""
+        if not dict.get(self, CONF_ENTITY_SETTINGS):
             self[CONF_ENTITY_SETTINGS] = {}
         if key not in self[CONF_ENTITY_SETTINGS]:
             self[CONF_ENTITY_SETTINGS][key] = {}
         self[CONF_ENTITY_SETTINGS][key][option] = value
-
-    def get_entity_settings(self, key:str):
-        """Return an entity config setting or None if it doesn't exist."""
-        if CONF_ENTITY_SETTINGS in self and  key in self[CONF_ENTITY_SETTINGS]:
-            return self[key]
-        return None
+        self._invalidate_layer()
+
+    def _invalidate_layer(self) -> None:
+        """ Drop the memoized settings of this layer and of the layers on top of it """
+        self._resolved = {}
+        children = [child for child in (ref() for ref in self._children) if child is not None]
+        self._children = [weakref.ref(child) for child in children]
+        for child in children:
+            child._invalidate_layer()
+
+    def get_update_filter(self, key:str) -> tuple|None:
+        """ Return the (deadband, min_interval, max_interval) settings of an entity or None if its updates aren't filtered """
+        settings = self._resolve(CONF_ENTITY_SETTINGS, key)
+        update_filter = tuple(settings.get(option) for option in ENTITY_UPDATE_FILTERS)
+        return update_filter if any(update_filter) else None
+
+    def get_entity_settings(self, key:str) -> Mapping|None:
+        """Return all the config settings of an entity, read-only, or None if there aren't any."""
+        return self._resolve(CONF_ENTITY_SETTINGS, key) or None
+
+    def get_appliance_setting(self, haid:str, option:str, default=None):
+        """ Return an appliance config setting or the default if it doesn't exist """
+        return self._resolve(CONF_APPLIANCE_SETTINGS, haid).get(option, default)
+
+    def get_configured_appliances(self) -> set[str]:
+        """ Return the haIds of the appliances that have settings in any of the layers """
+        haids = set()
+        c = self
+        while c is not None:
+            haids.update(dict.get(c, CONF_APPLIANCE_SETTINGS) or {})
+            c = c._parent
+        for layer in self._base_layers():
+            haids.update(layer.get(CONF_APPLIANCE_SETTINGS) or {})
+        return haids
 
     def get_config(self, extra_conf:dict|None=None):
-        """Return a new config object which is the merging of the current one with the extra configuration"""
-        c = Configuration(self)
-        if extra_conf:
-            c.update(extra_conf)
-        return c
+        """Return a new config layer on top of the current one with the extra configuration"""
+        return Configuration(extra_conf or {}, parent=self)
 
     @property
     def hass(self) -> HomeAssistant:
@@ -314,9 +799,15 @@ class Configuration(dict):
 
     @classmethod
     def set_global_config(cls, hass:HomeAssistant, global_config:dict):
-        """Set the global config once as a static member that will be appended automatically to each config object."""
+        """Set the global config once as a static member that is used as the base layer of each config object."""
         cls._global_config = global_config
         cls._hass = hass
+        cls.invalidate()
+
+    @classmethod
+    def invalidate(cls):
+        """Drop the memoized settings of all the config objects"""
+        cls._generation += 1
 
     @classmethod
     def get_global_config(cls):
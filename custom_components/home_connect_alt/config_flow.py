@@ -171,6 +171,9 @@ class OptionsFlowHandler(config_entries.OptionsFlowWithConfigEntry):
                 {
                     vol.Optional(CONF_NAME_TEMPLATE, default=CONF_NAME_TEMPLATE_DEFAULT): str,
                     vol.Optional(CONF_SSE_TIMEOUT, default=CONF_SSE_TIMEOUT_DEFAULT): int,
+                    vol.Optional(CONF_CACHE, default=CONF_CACHE_DEFAULT): cv.boolean,
+                    vol.Optional(CONF_UPDATE_WINDOW, default=CONF_UPDATE_WINDOW_DEFAULT): vol.All(int, vol.Range(min=0, max=5000)),
+                    vol.Optional(CONF_SHARDING, default=CONF_SHARDING_DEFAULT): cv.boolean,
                     vol.Optional(CONF_APPLIANCE_SETTINGS, default={}):
                         selector({
                             "object": {}
@@ -182,7 +185,8 @@ class OptionsFlowHandler(config_entries.OptionsFlowWithConfigEntry):
                 }
             )
 
-        defaults = Configuration.get_global_config()
+        # Copy the global config which is the live base layer of the config objects
+        defaults = dict(Configuration.get_global_config())
         defaults.update(self.config_entry.options)
 
         data_schema = self.add_suggested_values_to_schema(data_schema=vol.Schema(data_schema), suggested_values=defaults)
@@ -17,6 +17,7 @@ CONF_API_HOST_OPTIONS = [ "https://api.home-connect.com", "https://api.home-conn
 CONF_LANG = "language"
 CONF_LANG_DEFAULT = "en-GB"
 CONF_CACHE = "cache"
+CONF_CACHE_DEFAULT = True
 CONF_TRANSLATION_MODE = "translation_mode"
 CONF_TRANSLATION_MODES = ["local", "server"]
 CONF_TRANSLATION_MODE_SERVER = "server"
@@ -26,11 +27,48 @@ CONF_NAME_TEMPLATE_DEFAULT = "$brand $appliance - $name"
 CONF_LOG_MODE = "log_mode"
 CONF_SSE_TIMEOUT = "sse_timeout"
 CONF_SSE_TIMEOUT_DEFAULT = 15
+CONF_UPDATE_WINDOW = "update_window"
+CONF_UPDATE_WINDOW_DEFAULT = 100            # milliseconds
+CONF_SHARDING = "sharding"
+CONF_SHARDING_DEFAULT = False
 CONF_ENTITY_SETTINGS = "entity_settings"
 CONF_APPLIANCE_SETTINGS = "appliance_settings"
 CONF_DELAYED_OPS = "delayed_ops"
 CONF_DELAYED_OPS_DEFAULT = "default"
 CONF_DELAYED_OPS_ABSOLUTE_TIME = "absolute_time"
+# Entity settings that rate limit the state writes of noisy numeric entities
+ENTITY_UPDATE_FILTERS = ["deadband", "min_interval", "max_interval"]
+
+CACHE_VERSION = 2
+CACHE_SAVE_DELAY = 30                   # seconds
+CACHE_FRESH_AGE = 60                    # seconds, a newer snapshot is used without refreshing it
+CACHE_MAX_AGE = 30*24*3600              # seconds, an older snapshot is discarded
+
+WRITE_COALESCE_WINDOW = 300             # milliseconds after a write during which further writes to the same key are collapsed
+LOAD_CONCURRENCY = 2                    # appliances loaded in parallel
+APPLIANCE_READY_TIMEOUT = 30            # seconds a service call waits for the data of the appliance to load
+OPTIMISTIC_TIMEOUT = 15                 # seconds to wait for the appliance to confirm a written value
+COUNTDOWN_TOLERANCE = 60                # seconds a reported remaining time may differ from the anchored finish time
+
+API_BUDGET_LIMIT = 1000                 # daily calls allowed by the service for each client application
+API_BUDGET_WINDOW = 24*3600             # seconds
+API_BUDGET_SAVE_DELAY = 60              # seconds
+API_BUDGET_MAX_WAIT = 60                # seconds a deferred request waits for the budget before it fails
+STATUS_BUDGET_UPDATE_DELAY = 30         # seconds between updates of the API call counters of the status sensor
+
+SHARDING_CHECK_INTERVAL = 15*60         # seconds
+SHARDING_REBALANCE_THRESHOLD = 0.8      # part of the daily limit used by an entry before its appliances are moved
+SHARDING_COOLDOWN = 6*3600              # seconds between rebalancing moves
+
+CONSTRAINT_CACHE_TTL = 30*24*3600       # seconds the option constraints of a program are reused
+CONSTRAINT_CACHE_SAVE_DELAY = 60        # seconds
+
+HISTORY_MAX_RUNS = 500                  # program runs kept in the history of each config entry
+HISTORY_SAVE_DELAY = 60                 # seconds
+HISTORY_QUERY_LIMIT = 20                # runs returned by a history query by default
+
+EVENT_DEDUP_WINDOW = 60                 # seconds during which a repeated event value of an appliance isn't published again
+EVENT_DEDUP_SIZE = 32                   # event keys remembered per appliance for deduplication
 
 HOME_CONNECT_DEVICE = {
     "identifiers": {(DOMAIN, "homeconnect")},
@@ -50,6 +88,9 @@ DEFAULT_SETTINGS = {
         "Refrigeration.Common.Status.Door.Refrigerator": { "type": "Boolean", "class": "door", "icon": None, "on_state": "Refrigeration.Common.EnumType.Door.States.Open" },
         "Refrigeration.Common.Status.Door.ChillerCommon": { "type": "Boolean", "class": "door", "icon": None, "on_state": "Refrigeration.Common.EnumType.Door.States.Open" },
         "Connected": { "class": "connectivity" },
+        # The data of the appliance is still being updated when these are received so automations get them a bit later
+        "BSH.Common.Status.OperationState": { "publish_delay": 1 },
+        "BSH.Common.Event.ProgramFinished": { "publish_delay": 1 },
     }
 }
 
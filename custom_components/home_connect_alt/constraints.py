@@ -0,0 +1,128 @@
+""" Persistent cache of the option constraints of the available programs """
+from __future__ import annotations
+import logging
+import re
+import time
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Iterable
+
+from home_connect_async import Appliance
+from home_connect_async.api import HomeConnectApi
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import storage
+
+from .const import DOMAIN, CONSTRAINT_CACHE_TTL, CONSTRAINT_CACHE_SAVE_DELAY
+
+_LOGGER = logging.getLogger(__name__)
+
+AVAILABLE_PROGRAM_ENDPOINT = re.compile(r"^/api/homeappliances/([^/?]+)/programs/available/([^/?]+)$")
+APPLIANCE_ENDPOINT = re.compile(r"^/api/homeappliances(?:/([^/?]+))?$")
+
+
+class ConstraintCache():
+    """ The option constraints of the available programs keyed by the appliance model (vib), program and language
+
+    The allowed values, min, max and step size of the options are the same for every appliance of a model, but the
+    library fetches them again after every restart and whenever a program is selected. The responses are kept
+    for CONSTRAINT_CACHE_TTL and served without calling the service, so identical appliances, other config entries
+    and a reinstall of the integration don't fetch the same constraints twice. The cache is shared by all the
+    config entries.
+    """
+
+    def __init__(self, hass:HomeAssistant) -> None:
+        self._hass = hass
+        self._store = storage.Store(hass, version=1, key=f"{DOMAIN}_constraints", private=True)
+        self._loaded = False
+        # "vib|program_key|lang" => [fetch time, response body]
+        self._entries:dict[str, list] = {}
+        # haId => vib of the appliances seen in the responses of the service
+        self._vibs:dict[str, str] = {}
+        self.stats = { "hits": 0, "misses": 0, "expired": 0, "invalidated": 0 }
+
+    @classmethod
+    def get(cls, hass:HomeAssistant) -> ConstraintCache:
+        """ Return the constraint cache of the integration, creating it on first use """
+        domain_data = hass.data.setdefault(DOMAIN, {})
+        if "constraints" not in domain_data:
+            domain_data["constraints"] = ConstraintCache(hass)
+        return domain_data["constraints"]
+
+    async def async_load(self) -> None:
+        """ Load the stored constraints, dropping the expired ones """
+        if self._loaded:
+            return
+        data = await self._store.async_load()
+        if data and not self._loaded:
+            cutoff = time.time() - CONSTRAINT_CACHE_TTL
+            self._entries = { key: entry for (key, entry) in data.get("entries", {}).items() if entry[0] > cutoff }
+        self._loaded = True
+
+    def add_appliances(self, appliances:Iterable[Appliance]) -> None:
+        """ Record the models of appliances that were restored without asking the service """
+        for appliance in appliances:
+            self._vibs[appliance.haId] = appliance.vib
+
+    async def async_get(self, endpoint:str, lang:str|None,
+                        async_get:Callable[[str], Awaitable[HomeConnectApi.ApiResponse]]) -> HomeConnectApi.ApiResponse:
+        """ Serve a GET request from the cache if it is for cached constraints, otherwise make it with async_get """
+        match = AVAILABLE_PROGRAM_ENDPOINT.match(endpoint)
+        vib = self._vibs.get(match.group(1)) if match else None
+        if not vib:
+            response = await async_get(endpoint)
+            if APPLIANCE_ENDPOINT.match(endpoint):
+                self._learn_vibs(response)
+            return response
+
+        key = self._key(vib, match.group(2), lang)
+        body = self._lookup(key)
+        if body is not None:
+            _LOGGER.debug("Using the cached constraints of %s", key)
+            return HomeConnectApi.ApiResponse(SimpleNamespace(status=200), body)
+        response = await async_get(endpoint)
+        if response.status == 200 and not response.error and response.data:
+            self._entries[key] = [time.time(), response.json_body]
+            self._store.async_delay_save(self._data_to_save, CONSTRAINT_CACHE_SAVE_DELAY)
+        return response
+
+    def _learn_vibs(self, response:HomeConnectApi.ApiResponse) -> None:
+        """ Record the models of the appliances listed by the service """
+        if response.status != 200 or not response.data:
+            return
+        for ha in response.data.get('homeappliances', [response.data]):
+            if 'haId' in ha and 'vib' in ha:
+                self._vibs[ha['haId']] = ha['vib']
+
+    @staticmethod
+    def _key(vib:str, program_key:str, lang:str|None) -> str:
+        return f"{vib}|{program_key}|{lang or ''}"
+
+    def _lookup(self, key:str) -> dict|None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        if entry[0] <= time.time() - CONSTRAINT_CACHE_TTL:
+            del self._entries[key]
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return entry[1]
+
+    def invalidate(self, vib:str|None = None, program_key:str|None = None) -> int:
+        """ Drop the constraints of a model and/or program, or all of them, and return the number of dropped entries """
+        dropped = [key for key in self._entries
+                   if (vib is None or key.split("|")[0] == vib) and (program_key is None or key.split("|")[1] == program_key)]
+        for key in dropped:
+            del self._entries[key]
+        if dropped:
+            self.stats["invalidated"] += len(dropped)
+            self._store.async_delay_save(self._data_to_save, CONSTRAINT_CACHE_SAVE_DELAY)
+        return len(dropped)
+
+    def _data_to_save(self) -> dict:
+        return { "entries": self._entries }
+
+    def get_stats(self) -> dict:
+        """ Return the cache counters for diagnostics """
+        return { "entries": len(self._entries), **self.stats }
@@ -0,0 +1,78 @@
+""" Stable finish times for the program time options of an appliance """
+from __future__ import annotations
+import logging
+from datetime import datetime, timedelta
+from typing import Callable
+
+from home_connect_async import Appliance, Events
+from homeassistant.core import callback
+from homeassistant.util import dt as dt_util
+
+_LOGGER = logging.getLogger(__name__)
+
+# The program the options are read from changes on these events
+COUNTDOWN_EVENTS = [Events.PROGRAM_STARTED, Events.PROGRAM_FINISHED, Events.PROGRAM_SELECTED]
+
+
+class CountdownEngine():
+    """ Anchor the finish time of the program time options of an appliance
+
+    The appliance reports the remaining time of a program, which turned into a timestamp moves with every
+    state write. The engine anchors the finish time when a remaining time is reported and keeps it as long as the
+    following reports agree with it within the tolerance of the option, so the countdown in between is done
+    locally by the frontend from the anchored timestamp, which only changes when the program actually runs late
+    or early, or when a program that isn't running yet or is paused reports a remaining time that has drifted
+    beyond the tolerance. No timers are used so an idle appliance causes no work and no state writes.
+    """
+
+    def __init__(self, appliance:Appliance) -> None:
+        self._appliance = appliance
+        self._tracked:dict[str, tuple[int, Callable[[], None]]] = {}
+        self._anchors:dict[str, datetime] = {}
+
+    def track(self, key:str, tolerance:int, on_change:Callable[[], None]) -> Callable[[], None]:
+        """ Anchor the finish time of an option and call on_change when it moves, returns a function that stops tracking it """
+        if not self._tracked:
+            self._appliance.register_callback(self._async_on_state_changed, COUNTDOWN_EVENTS)
+        self._tracked[key] = (tolerance, on_change)
+        self.refresh()
+
+        def untrack() -> None:
+            self._tracked.pop(key, None)
+            self._anchors.pop(key, None)
+            if not self._tracked:
+                self._appliance.deregister_callback(self._async_on_state_changed, COUNTDOWN_EVENTS)
+        return untrack
+
+    def get_finish(self, key:str) -> datetime|None:
+        """ Return the anchored finish time of an option """
+        return self._anchors.get(key)
+
+    def _get_option_value(self, key:str) -> int|None:
+        appliance = self._appliance
+        program = appliance.active_program if appliance.active_program else appliance.selected_program
+        if program is None or not program.options or key not in program.options:
+            return None
+        value = program.options[key].value
+        return value if isinstance(value, (int, float)) else None
+
+    @callback
+    def refresh(self) -> None:
+        """ Anchor the reported remaining times and notify the options whose finish time moved """
+        now = dt_util.now()
+        for (key, (tolerance, on_change)) in list(self._tracked.items()):
+            value = self._get_option_value(key)
+            anchor = self._anchors.get(key)
+            if value is None:
+                if anchor is not None:
+                    del self._anchors[key]
+                    on_change()
+                continue
+            finish = now + timedelta(seconds=value)
+            if anchor is None or abs((finish - anchor).total_seconds()) > tolerance:
+                _LOGGER.debug("Anchoring the finish time of %s to %s", key, finish)
+                self._anchors[key] = finish
+                on_change()
+
+    async def _async_on_state_changed(self, appliance:Appliance, key:str, value) -> None:
+        self.refresh()
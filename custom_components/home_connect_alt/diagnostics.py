@@ -0,0 +1,31 @@
+""" Diagnostics support for the Home Connect Alt integration """
+from __future__ import annotations
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .catalog import CatalogInterner
+from .common import Configuration
+from .constraints import ConstraintCache
+from .const import DOMAIN
+
+
+async def async_get_config_entry_diagnostics(hass:HomeAssistant, config_entry:ConfigEntry) -> dict[str, Any]:
+    """ Return the diagnostics of a config entry """
+    entry_conf:Configuration = hass.data[DOMAIN][config_entry.entry_id]
+    return {
+        "appliances": len(entry_conf["homeconnect"].appliances),
+        "data_changed_dispatch": dict(entry_conf["dispatcher"].stats),
+        "state_writes": dict(entry_conf["state_writer"].stats),
+        "filtered_writes": dict(entry_conf["state_writer"].filtered_keys),
+        "appliance_writes": dict(entry_conf["write_queue"].stats),
+        "appliance_loads": dict(entry_conf["loader"].stats),
+        "appliance_readiness": entry_conf["readiness"].get_states(),
+        "entity_discovery": dict(entry_conf["discovery"].stats),
+        "api_budget": entry_conf["budget"].get_stats(),
+        "event_publishing": entry_conf["publisher"].get_stats(),
+        "program_history": entry_conf["history"].get_stats(),
+        "constraint_cache": ConstraintCache.get(hass).get_stats(),
+        "shared_catalog": CatalogInterner.get(hass).get_report(),
+    }
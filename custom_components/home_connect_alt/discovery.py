@@ -0,0 +1,217 @@
+""" Shared discovery of the entities that should be created for each appliance """
+from __future__ import annotations
+import asyncio
+import logging
+from collections.abc import Callable
+from typing import Any, NamedTuple
+
+from home_connect_async import Appliance, HomeConnect, Events
+from homeassistant.const import Platform
+from homeassistant.helpers.entity import Entity
+
+from .common import Configuration, EntityManager, is_boolean_enum, get_program_run_time
+from .const import CONF_DELAYED_OPS, CONF_DELAYED_OPS_ABSOLUTE_TIME, CONF_DELAYED_OPS_DEFAULT
+from .readiness import ApplianceReadiness, ReadinessState
+
+_LOGGER = logging.getLogger(__name__)
+
+NUMBER_TYPES = ["Int", "Float", "Double"]
+BUTTON_EXCLUDED_COMMANDS = ["BSH.Common.Command.PauseProgram", "BSH.Common.Command.ResumeProgram", "BSH.Common.Command.AcknowledgeEvent"]
+
+
+class EntitySpec(NamedTuple):
+    """ The description of an entity that should exist for an appliance """
+    kind: str
+    key: str|None
+    hc_obj: Any = None
+    extra_conf: tuple|None = None
+
+    @property
+    def id(self) -> tuple:
+        """ Identifies the entity within its platform """
+        return (self.kind, self.key, self.extra_conf)
+
+
+EntityPlan = dict[Platform, dict[tuple, EntitySpec]]
+EntityBuilder = Callable[[Appliance, EntitySpec, Configuration], Entity|None]
+
+
+def classify_appliance(appliance:Appliance, conf:Configuration) -> EntityPlan:
+    """ Walk the appliance data model once and return the entities that should exist for each platform """
+    plan:EntityPlan = { platform: {} for platform in Platform }
+
+    def add(platform:Platform, spec:EntitySpec) -> None:
+        # The first definition wins, this matters for options which appear in several programs
+        if spec.id not in plan[platform]:
+            plan[platform][spec.id] = spec
+
+    entity_type = lambda key: conf.get_entity_setting(key, "type")
+
+    # Every appliance can be refreshed on its own, except for the stubs of appliances whose data wasn't loaded yet
+    if appliance.status is not None:
+        add(Platform.BUTTON, EntitySpec("refresh", None))
+
+    # Selected and active programs
+    for (program_type, program) in [("selected", appliance.selected_program), ("active", appliance.active_program)]:
+        if program:
+            add(Platform.SENSOR, EntitySpec("program", None, extra_conf=(("program_type", program_type),)))
+            if program.options:
+                for option in program.options.values():
+                    if not isinstance(option.value, bool):
+                        add(Platform.SENSOR, EntitySpec("option", option.key))
+                    if isinstance(option.value, bool) or entity_type(option.key) == "Boolean":
+                        add(Platform.BINARY_SENSOR, EntitySpec("option", option.key))
+
+    # Available programs and their options
+    if appliance.available_programs:
+        add(Platform.SELECT, EntitySpec("program", None))
+        add(Platform.BUTTON, EntitySpec("start", None))
+        add(Platform.BUTTON, EntitySpec("stop", None))
+        has_program_run_time = get_program_run_time(appliance) is not None
+        for program in appliance.available_programs.values():
+            if not program.options:
+                continue
+            for option in program.options.values():
+                is_delayed_operation = entity_type(option.key) == "DelayedOperation"
+                if is_delayed_operation and conf[CONF_DELAYED_OPS] == CONF_DELAYED_OPS_ABSOLUTE_TIME and has_program_run_time:
+                    add(Platform.TIME, EntitySpec("delayed_operation", option.key, option))
+                if is_delayed_operation and (conf[CONF_DELAYED_OPS] == CONF_DELAYED_OPS_DEFAULT or not has_program_run_time):
+                    add(Platform.SELECT, EntitySpec("delayed_operation", option.key, option))
+                elif option.allowedvalues and len(option.allowedvalues)>1:
+                    add(Platform.SELECT, EntitySpec("option", option.key))
+
+                if (not conf.has_entity_setting(option.key, "type") and option.type in NUMBER_TYPES) or entity_type(option.key) in NUMBER_TYPES:
+                    add(Platform.NUMBER, EntitySpec("option", option.key, option))
+
+                if (not conf.has_entity_setting(option.key, "type") and (option.type == "Boolean" or isinstance(option.value, bool))) \
+                    or entity_type(option.key) == "Boolean":
+                    add(Platform.SWITCH, EntitySpec("option", option.key))
+
+    # Status
+    if appliance.status:
+        for (key, status) in appliance.status.items():
+            if isinstance(status.value, bool) or entity_type(key) == "Boolean":
+                add(Platform.BINARY_SENSOR, EntitySpec("status", key))
+            else:
+                add(Platform.SENSOR, EntitySpec("status", key))
+
+    # Settings
+    if appliance.settings:
+        for setting in appliance.settings.values():
+            is_boolean = setting.type == "Boolean" or isinstance(setting.value, bool) or entity_type(setting.key) == "Boolean"
+            if is_boolean:
+                add(Platform.BINARY_SENSOR, EntitySpec("setting", setting.key))
+            else:
+                add(Platform.SENSOR, EntitySpec("setting", setting.key))
+
+            if setting.access == "read":
+                continue
+            if setting.allowedvalues and len(setting.allowedvalues)>1 and not is_boolean_enum(setting.allowedvalues):
+                add(Platform.SELECT, EntitySpec("setting", setting.key))
+            if (not conf.has_entity_setting(setting.key, "type") and setting.type in NUMBER_TYPES) or entity_type(setting.key) in NUMBER_TYPES:
+                add(Platform.NUMBER, EntitySpec("setting", setting.key, setting))
+            if (not conf.has_entity_setting(setting.key, "type") and (setting.type == "Boolean" or isinstance(setting.value, bool) or is_boolean_enum(setting.allowedvalues))) \
+                or entity_type(setting.key) == "Boolean":
+                add(Platform.SWITCH, EntitySpec("setting", setting.key))
+
+    # Commands
+    if appliance.commands:
+        for command in appliance.commands.values():
+            # The "BSH.Common.Command.AcknowledgeEvent" command is used to acknowledge the ProgramFinished state
+            if command.key not in BUTTON_EXCLUDED_COMMANDS:
+                add(Platform.BUTTON, EntitySpec("command", command.key, command))
+
+    add(Platform.BINARY_SENSOR, EntitySpec("connection", "Connected"))
+
+    return plan
+
+
+class EntityDiscovery():
+    """ Discover the entities of all the platforms of a config entry with a single walk of the appliance data model
+
+    An appliance is classified when its readiness state advances and on the events that can add entities, the
+    resulting plan is compared with the entities that were already handed to each platform, so only new entities
+    are built and registered. The walks triggered in the same loop iteration, such as a readiness transition and
+    the PAIRED and DATA_CHANGED events that follow it, are coalesced into a single walk.
+    """
+
+    def __init__(self, homeconnect:HomeConnect, entry_conf:Configuration, readiness:ApplianceReadiness) -> None:
+        self._homeconnect = homeconnect
+        self._entry_conf = entry_conf
+        self._readiness = readiness
+        self._platforms:dict[Platform, tuple[EntityManager, EntityBuilder]] = {}
+        self._plans:dict[str, EntityPlan] = {}
+        self._emitted:dict[Platform, dict[str, set[tuple]]] = {}
+        self._pending:set[str] = set()
+        self.stats = { "walks": 0, "coalesced": 0 }
+
+        readiness.add_listener(self._on_readiness_changed)
+        homeconnect.register_callback(self.on_appliance_changed, [Events.PAIRED, Events.DATA_CHANGED, Events.PROGRAM_STARTED, Events.PROGRAM_SELECTED])
+        homeconnect.register_callback(self.on_appliance_removed, Events.DEPAIRED)
+
+    def register_platform(self, platform:Platform, entity_manager:EntityManager, builder:EntityBuilder) -> None:
+        """ Register a platform to receive its entities and add the entities of the appliances that are ready """
+        self._platforms[platform] = (entity_manager, builder)
+        self._emitted[platform] = {}
+        for appliance in self._homeconnect.appliances.values():
+            if self._readiness.get_state(appliance.haId) is None:
+                continue
+            if appliance.haId not in self._plans:
+                self._walk(appliance)
+            else:
+                self._emit(platform, appliance)
+
+    def on_appliance_changed(self, appliance:Appliance) -> None:
+        """ Schedule a walk of an appliance whose loading has started """
+        if self._readiness.get_state(appliance.haId) is not None:
+            self._schedule_walk(appliance.haId)
+
+    def on_appliance_removed(self, appliance:Appliance) -> None:
+        """ Forget the entities of a removed appliance """
+        self._plans.pop(appliance.haId, None)
+        self._pending.discard(appliance.haId)
+        for (platform, (entity_manager, _)) in self._platforms.items():
+            self._emitted[platform].pop(appliance.haId, None)
+            entity_manager.remove_appliance(appliance)
+
+    def _on_readiness_changed(self, haid:str, state:ReadinessState) -> None:
+        # The appliance object doesn't exist yet when it was just discovered and is still loading
+        if haid in self._homeconnect.appliances:
+            self._schedule_walk(haid)
+
+    def _schedule_walk(self, haid:str) -> None:
+        if haid in self._pending:
+            self.stats["coalesced"] += 1
+            return
+        self._pending.add(haid)
+        asyncio.get_running_loop().call_soon(self._walk_pending, haid)
+
+    def _walk_pending(self, haid:str) -> None:
+        if haid not in self._pending:
+            return
+        self._pending.discard(haid)
+        appliance = self._homeconnect.appliances.get(haid)
+        if appliance:
+            self._walk(appliance)
+
+    def _walk(self, appliance:Appliance) -> None:
+        """ Classify the appliance and add the new entities to all the registered platforms """
+        self.stats["walks"] += 1
+        self._plans[appliance.haId] = classify_appliance(appliance, self._entry_conf)
+        for platform in self._platforms:
+            self._emit(platform, appliance)
+
+    def _emit(self, platform:Platform, appliance:Appliance) -> None:
+        """ Build and register the entities of the plan which weren't handed to the platform yet """
+        entity_manager, builder = self._platforms[platform]
+        emitted = self._emitted[platform].setdefault(appliance.haId, set())
+        specs = [ spec for (spec_id, spec) in self._plans[appliance.haId][platform].items() if spec_id not in emitted ]
+        if not specs:
+            return
+
+        conf = self._entry_conf.get_config()
+        for spec in specs:
+            entity_conf = self._entry_conf.get_config(dict(spec.extra_conf)) if spec.extra_conf else conf
+            entity_manager.add(builder(appliance, spec, entity_conf))
+            emitted.add(spec.id)
+        entity_manager.register()
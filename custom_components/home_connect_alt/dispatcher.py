@@ -0,0 +1,140 @@
+""" Dispatch data model changes only to the entities bound to the data that actually changed """
+from __future__ import annotations
+import logging
+from collections import defaultdict
+from typing import Any
+
+from home_connect_async import Appliance, HomeConnect, Events
+
+from .common import EntityBase
+
+_LOGGER = logging.getLogger(__name__)
+
+SELECTED_PROGRAM_KEY = "BSH.Common.Root.SelectedProgram"
+ACTIVE_PROGRAM_KEY = "BSH.Common.Root.ActiveProgram"
+# Not an actual Home Connect key, used to bind entities to the list of available programs
+AVAILABLE_PROGRAMS_KEY = "BSH.Common.Root.AvailablePrograms"
+
+_MISSING = object()
+
+
+def _fingerprint(obj) -> tuple|None:
+    """ Return a comparable copy of the fields of a data model object """
+    if obj is None:
+        return None
+    return tuple(tuple(v) if isinstance(v, list) else v for v in vars(obj).values())
+
+
+def take_snapshot(appliance:Appliance) -> dict[tuple[str, str], Any]:
+    """ Capture the parts of the appliance data model that entities are bound to
+
+    The snapshot maps (section, key) to a comparable fingerprint, the key is the Home Connect
+    key that entities bind to.
+    """
+    snapshot = {}
+    snapshot[("root", Events.CONNECTION_CHANGED)] = appliance.connected
+    for (section, key, program) in [("selected", SELECTED_PROGRAM_KEY, appliance.selected_program), ("active", ACTIVE_PROGRAM_KEY, appliance.active_program)]:
+        snapshot[("root", key)] = (program.key, program.name) if program else None
+        if program and program.options:
+            for option in program.options.values():
+                snapshot[(section, option.key)] = _fingerprint(option)
+
+    if appliance.available_programs:
+        snapshot[("root", AVAILABLE_PROGRAMS_KEY)] = tuple((program.key, program.name) for program in appliance.available_programs.values())
+        for program in appliance.available_programs.values():
+            if program.options:
+                for option in program.options.values():
+                    snapshot[(f"available.{program.key}", option.key)] = _fingerprint(option)
+
+    for (section, items) in [("status", appliance.status), ("setting", appliance.settings), ("command", appliance.commands)]:
+        if items:
+            for (key, item) in items.items():
+                snapshot[(section, key)] = _fingerprint(item)
+    return snapshot
+
+
+def diff_snapshots(old:dict, new:dict) -> set[str]:
+    """ Return the keys whose data is different between the two snapshots """
+    changed = { key for ((section, key), value) in new.items() if old.get((section, key), _MISSING) != value }
+    changed.update(key for (_, key) in old.keys() - new.keys())
+    return changed
+
+
+class DataChangeDispatcher():
+    """ Notify the entities about DATA_CHANGED events only when the data they are bound to has changed
+
+    The library broadcasts DATA_CHANGED whenever it reloads any part of an appliance and every entity
+    of the appliance used to write its state in response. The dispatcher keeps a snapshot of each appliance,
+    computes the changed keys when the event is received and only notifies the entities bound to these keys.
+    Entities without data keys (data_keys is None) are always notified and a change of the connection state
+    notifies all the entities of the appliance.
+    """
+
+    def __init__(self, homeconnect:HomeConnect) -> None:
+        self._snapshots:dict[str, dict] = {}
+        self._bound:dict[str, dict[str, set[EntityBase]]] = defaultdict(lambda: defaultdict(set))
+        self._unbound:dict[str, set[EntityBase]] = defaultdict(set)
+        self.stats = { "events": 0, "notified": 0, "suppressed": 0 }
+
+        homeconnect.register_callback(self.async_on_data_changed, Events.DATA_CHANGED)
+        homeconnect.register_callback(self.on_appliance_removed, Events.DEPAIRED)
+
+    def register(self, appliance:Appliance, entity:EntityBase) -> None:
+        """ Start dispatching the changes of the appliance to the entity """
+        haid = appliance.haId
+        if haid not in self._snapshots:
+            # The entity state is written with the current data when it is added so it is the baseline for changes
+            self._snapshots[haid] = take_snapshot(appliance)
+        if entity.data_keys is None:
+            self._unbound[haid].add(entity)
+        else:
+            for key in entity.data_keys:
+                self._bound[haid][key].add(entity)
+
+    def deregister(self, appliance:Appliance, entity:EntityBase) -> None:
+        """ Stop dispatching changes to the entity """
+        haid = appliance.haId
+        self._unbound[haid].discard(entity)
+        for entities in self._bound[haid].values():
+            entities.discard(entity)
+
+    def on_appliance_removed(self, appliance:Appliance) -> None:
+        """ Drop the state of a depaired appliance """
+        self._snapshots.pop(appliance.haId, None)
+        self._bound.pop(appliance.haId, None)
+        self._unbound.pop(appliance.haId, None)
+
+    def get_entities(self, haid:str, changed:set[str]|None) -> set[EntityBase]:
+        """ Return the entities of the appliance affected by the changed keys, None means everything changed """
+        entities = set(self._unbound[haid])
+        bound = self._bound[haid]
+        if changed is None or Events.CONNECTION_CHANGED in changed:
+            for key_entities in bound.values():
+                entities |= key_entities
+        else:
+            for key in changed:
+                if key in bound:
+                    entities |= bound[key]
+        return entities
+
+    async def async_on_data_changed(self, appliance:Appliance, event:str) -> None:
+        """ Compute the changed keys of the appliance and notify the affected entities """
+        haid = appliance.haId
+        snapshot = take_snapshot(appliance)
+        previous = self._snapshots.get(haid)
+        self._snapshots[haid] = snapshot
+        changed = diff_snapshots(previous, snapshot) if previous is not None else None
+
+        entities = self.get_entities(haid, changed)
+        total = len(self._unbound[haid] | { entity for key_entities in self._bound[haid].values() for entity in key_entities })
+        self.stats["events"] += 1
+        self.stats["notified"] += len(entities)
+        self.stats["suppressed"] += total - len(entities)
+        _LOGGER.debug("Data changed for appliance %s, changed keys: %s, notifying %d of %d entities",
+                      haid, changed if changed is not None else "all", len(entities), total)
+
+        for entity in entities:
+            try:
+                await entity.async_on_update(appliance, Events.DATA_CHANGED, None)
+            except Exception as ex:
+                _LOGGER.warning("Unhandled exception in entity update for key %s", Events.DATA_CHANGED, exc_info=ex)
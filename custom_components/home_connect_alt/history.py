@@ -0,0 +1,159 @@
+""" Compact history of the program runs of the appliances """
+from __future__ import annotations
+import logging
+from collections import deque
+from datetime import datetime
+from fnmatch import fnmatch
+
+from home_connect_async import Appliance, HomeConnect, Events
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import storage
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN, HISTORY_MAX_RUNS, HISTORY_SAVE_DELAY
+
+_LOGGER = logging.getLogger(__name__)
+
+OPERATION_STATE = "BSH.Common.Status.OperationState"
+RUN_RESULT_EVENTS = {
+    "BSH.Common.EnumType.OperationState.Finished": "finished",
+    "BSH.Common.Event.ProgramFinished": "finished",
+    "BSH.Common.EnumType.OperationState.Aborting": "aborted",
+    "BSH.Common.Event.ProgramAborted": "aborted",
+}
+# The consumption of a run is reported by the options and status whose key matches these patterns
+CONSUMPTION_KEYS = ["*Consumption*", "*Forecast*"]
+# The options that only report the progress of the run aren't kept in its record
+PROGRESS_OPTIONS = ["BSH.Common.Option.RemainingProgramTime", "BSH.Common.Option.ProgramProgress",
+                    "BSH.Common.Option.ElapsedProgramTime", "BSH.Common.Option.EstimatedTotalProgramTime"]
+
+
+def is_consumption_key(key:str) -> bool:
+    """ True for the keys of the options and status that report the consumption of a run """
+    return any(fnmatch(key, pattern) for pattern in CONSUMPTION_KEYS)
+
+
+class ProgramHistory():
+    """ Append-only history of the program runs of the appliances of a config entry
+
+    The start and end of a run are taken from the PROGRAM_STARTED and PROGRAM_FINISHED events and each run is
+    stored as a single record with its program, options, start and end times, result and the last reported
+    consumption. The history is bounded to the most recent runs so it can replace the recorder history of the
+    high frequency program sensors. The runs in progress are stored as well so they survive a restart.
+    """
+
+    def __init__(self, hass:HomeAssistant, entry_id:str, max_runs:int = HISTORY_MAX_RUNS) -> None:
+        self._store = storage.Store(hass, version=1, key=f"{DOMAIN}_history_{entry_id}", private=True)
+        self._runs:deque[dict] = deque(maxlen=max_runs)
+        # haId => the record of the run in progress
+        self._running:dict[str, dict] = {}
+        # haId => the record of the last run, its result may still be reported by the events following the end
+        self._ended:dict[str, dict] = {}
+        self.stats = { "started": 0, "ended": 0 }
+
+    async def async_load(self) -> None:
+        """ Restore the stored history """
+        data = await self._store.async_load()
+        if data:
+            self._runs.extend(data.get("runs", []))
+            self._running.update(data.get("running", {}))
+
+    async def async_unload(self) -> None:
+        """ Save the history """
+        await self._store.async_save(self._data_to_save())
+
+    async def async_remove(self) -> None:
+        """ Remove the stored history of a deleted config entry """
+        await self._store.async_remove()
+
+    def _data_to_save(self) -> dict:
+        return { "runs": list(self._runs), "running": self._running }
+
+    def _schedule_save(self) -> None:
+        self._store.async_delay_save(self._data_to_save, HISTORY_SAVE_DELAY)
+
+    def attach(self, homeconnect:HomeConnect) -> None:
+        """ Follow the program runs of the appliances of the HomeConnect object """
+        homeconnect.register_callback(self._async_on_program_started, Events.PROGRAM_STARTED)
+        homeconnect.register_callback(self._async_on_program_finished, Events.PROGRAM_FINISHED)
+        homeconnect.register_callback(self._async_on_run_event, [OPERATION_STATE] + [key for key in RUN_RESULT_EVENTS if "Event" in key])
+        homeconnect.register_callback(self._async_on_consumption, CONSUMPTION_KEYS)
+
+    async def _async_on_program_started(self, appliance:Appliance, key:str, value) -> None:
+        stale = self._running.pop(appliance.haId, None)
+        if stale:
+            # The end of the previous run was missed, most likely because it ended while Home Assistant was down
+            self._end_run(appliance.haId, stale, None)
+        self._ended.pop(appliance.haId, None)
+        options = {}
+        consumption = {}
+        program = appliance.active_program
+        for option in (program.options or {}).values() if program else []:
+            if is_consumption_key(option.key):
+                consumption[option.key] = option.value
+            elif option.key not in PROGRESS_OPTIONS:
+                options[option.key] = option.value
+        self._running[appliance.haId] = {
+            "haId": appliance.haId,
+            "program": value,
+            "start": dt_util.utcnow().isoformat(),
+            "end": None,
+            "duration": None,
+            "result": None,
+            "options": options,
+            "consumption": consumption,
+        }
+        self.stats["started"] += 1
+        self._schedule_save()
+
+    async def _async_on_program_finished(self, appliance:Appliance, key:str, value) -> None:
+        run = self._running.pop(appliance.haId, None)
+        if run is None:
+            return
+        if run["program"] is None:
+            run["program"] = value
+        self._end_run(appliance.haId, run, dt_util.utcnow())
+
+    def _end_run(self, haid:str, run:dict, end:datetime|None) -> None:
+        if end:
+            run["end"] = end.isoformat()
+            run["duration"] = int((end - dt_util.parse_datetime(run["start"])).total_seconds())
+        run["result"] = run["result"] or ("finished" if end else "unknown")
+        self._runs.append(run)
+        self._ended[haid] = run
+        self.stats["ended"] += 1
+        self._schedule_save()
+
+    async def _async_on_run_event(self, appliance:Appliance, key:str, value) -> None:
+        result = RUN_RESULT_EVENTS.get(value if key == OPERATION_STATE else key)
+        if result is None:
+            return
+        # The events reporting how a run ended may arrive just before or just after the program is reported finished
+        run = self._running.get(appliance.haId) or self._ended.get(appliance.haId)
+        if run and run["result"] != "aborted" and run["result"] != result:
+            run["result"] = result
+            self._schedule_save()
+
+    async def _async_on_consumption(self, appliance:Appliance, key:str, value) -> None:
+        run = self._running.get(appliance.haId) or self._ended.get(appliance.haId)
+        if run and run["consumption"].get(key) != value:
+            run["consumption"][key] = value
+            self._schedule_save()
+
+    def query(self, haid:str|None = None, program_key:str|None = None, since:datetime|None = None, limit:int|None = None) -> list[dict]:
+        """ Return the runs matching the filters, the most recent first """
+        since = dt_util.as_utc(since) if since else None
+        runs = []
+        for run in reversed(self._runs):
+            if (haid and run["haId"] != haid) or (program_key and run["program"] != program_key):
+                continue
+            if since and (run["start"] is None or dt_util.parse_datetime(run["start"]) < since):
+                continue
+            runs.append(run)
+            if limit and len(runs) >= limit:
+                break
+        return runs
+
+    def get_stats(self) -> dict:
+        """ Return the history counters for diagnostics """
+        return { "runs": len(self._runs), "running": len(self._running), **self.stats }
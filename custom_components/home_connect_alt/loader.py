@@ -0,0 +1,177 @@
+""" Connection aware loading of the appliances data """
+from __future__ import annotations
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from home_connect_async import Appliance, HomeConnect, HomeConnectError, Events
+
+from .const import LOAD_CONCURRENCY
+from .readiness import ApplianceReadiness, ReadinessState
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ApplianceLoader():
+    """ Load the data of the appliances of a HomeConnect object
+
+    This replaces HomeConnect.start_load_data_task() which fetches the appliances one after the other and
+    skips new appliances that are disconnected. The connected appliances are loaded with a bounded concurrency
+    while a disconnected appliance only gets a stub with its identity, so just its connection entity is created,
+    and its data is loaded when it connects. The library reloads the data of an appliance when it connects and
+    the loader then notifies the entities so the rest of them are created.
+    """
+
+    def __init__(self, homeconnect:HomeConnect, readiness:ApplianceReadiness, concurrency:int = LOAD_CONCURRENCY) -> None:
+        self._homeconnect = homeconnect
+        self._readiness = readiness
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.stats = { "loaded": 0, "stubs": 0, "deferred_loads": 0, "failed": 0 }
+        homeconnect.register_callback(self._async_on_connected, Events.CONNECTED)
+        homeconnect.register_callback(self._on_paired, Events.PAIRED)
+        homeconnect.register_callback(self._on_depaired, Events.DEPAIRED)
+
+    def start(self,
+        refresh:HomeConnect.RefreshMode = None,
+        on_complete:Callable[[HomeConnect], Awaitable] = None,
+        on_error:Callable[[HomeConnect, Exception], Awaitable] = None
+    ) -> asyncio.Task:
+        """ Start loading or refreshing the data, a drop-in replacement for HomeConnect.start_load_data_task() """
+        homeconnect = self._homeconnect
+        refresh = refresh if refresh else homeconnect._refresh_mode
+        # The appliances restored from the cache have their entities created from the restored data right away
+        for (haid, appliance) in homeconnect.appliances.items():
+            self._readiness.set_state(haid, ReadinessState.STATIC_LOADED if appliance.status is not None else ReadinessState.DISCOVERED)
+        if refresh == HomeConnect.RefreshMode.NOTHING:
+            # Nothing is fetched in this mode so there is nothing to defer and the restored data is current
+            for haid in homeconnect.appliances:
+                self._readiness.set_state(haid, ReadinessState.DYNAMIC_LOADED)
+            return homeconnect.start_load_data_task(refresh, on_complete, on_error)
+        # The task is stored in the HomeConnect object so closing it cancels the load
+        homeconnect._load_task = asyncio.create_task(self.async_load(refresh, on_complete, on_error), name="_async_load_data")
+        return homeconnect._load_task
+
+    def _is_disabled(self, haid:str) -> bool:
+        disabled = self._homeconnect._disabled_appliances
+        return haid in disabled or haid.lower().replace('-','_') in disabled
+
+    async def async_load(self,
+        refresh:HomeConnect.RefreshMode,
+        on_complete:Callable[[HomeConnect], Awaitable] = None,
+        on_error:Callable[[HomeConnect, Exception], Awaitable] = None
+    ) -> None:
+        """ Load or refresh the data of all the appliances """
+        homeconnect = self._homeconnect
+        health = homeconnect.health
+        health.set_status(health.Status.RUNNING)
+        health.unset_status(health.Status.LOADING_FAILED)
+        try:
+            response = await homeconnect._api.async_get('/api/homeappliances')
+            if response.status != 200:
+                _LOGGER.warning("Failed to get the list of appliances code=%d error=%s", response.status, response.error_key)
+                raise HomeConnectError(f"Failed to get the list of appliances (code={response.status})", response=response)
+
+            homeappliances = []
+            for ha in response.data.get('homeappliances', []):
+                if self._is_disabled(ha['haId']):
+                    _LOGGER.info("Skipping disabled appliance '%s'", ha['haId'])
+                else:
+                    homeappliances.append(ha)
+            results = await asyncio.gather(*[self._async_load_appliance(ha, refresh) for ha in homeappliances], return_exceptions=True)
+            # A failed appliance doesn't stop the others from loading, it is loaded again when it reconnects
+            failed = [ ha['haId'] for (ha, result) in zip(homeappliances, results) if isinstance(result, Exception) ]
+            for (ha, result) in zip(homeappliances, results):
+                if isinstance(result, Exception):
+                    _LOGGER.warning("Failed to load appliance %s (%s)", ha['haId'], str(result), exc_info=result)
+            self.stats["failed"] += len(failed)
+
+            # clear appliances that are no longer paired with the service
+            listed = { ha['haId'] for ha in homeappliances }
+            for haid in list(homeconnect.appliances.keys()):
+                if haid not in listed:
+                    await homeconnect._callbacks.async_broadcast_event(homeconnect.appliances[haid], Events.DEPAIRED)
+                    del homeconnect.appliances[haid]
+
+            if failed and len(failed) == len(homeappliances):
+                raise HomeConnectError(f"Failed to load all the appliances: {', '.join(failed)}")
+            health.set_status(health.Status.LOADED)
+        except Exception as ex:
+            _LOGGER.warning("Failed to load data from Home Connect (%s)", str(ex), exc_info=ex)
+            health.set_status(health.Status.LOADING_FAILED)
+            if on_error:
+                await on_error(homeconnect, ex)
+            raise
+
+        if on_complete:
+            await on_complete(homeconnect)
+
+    async def _async_load_appliance(self, ha:dict, refresh:HomeConnect.RefreshMode) -> None:
+        homeconnect = self._homeconnect
+        haid = ha['haId']
+        appliance = homeconnect.appliances.get(haid)
+        self._readiness.set_state(haid, ReadinessState.DISCOVERED)
+
+        if not ha['connected']:
+            if appliance:
+                await appliance.async_set_connection_state(False)
+            else:
+                _LOGGER.debug("Appliance %s is disconnected, deferring its data load until it connects", haid)
+                appliance = self._create_stub(ha)
+                homeconnect.appliances[haid] = appliance
+                self.stats["stubs"] += 1
+                await homeconnect._callbacks.async_broadcast_event(appliance, Events.PAIRED)
+            return
+
+        async with self._semaphore:
+            if not appliance:
+                appliance = await Appliance.async_create(homeconnect, ha)
+                homeconnect.appliances[haid] = appliance
+            elif not appliance.connected:
+                # Setting the connection state fetches the data so it isn't fetched twice
+                await appliance.async_set_connection_state(True)
+            else:
+                await appliance.async_fetch_data(include_static_data=(refresh == HomeConnect.RefreshMode.ALL))
+        self.stats["loaded"] += 1
+        self._readiness.set_state(haid, ReadinessState.DYNAMIC_LOADED)
+        await homeconnect._callbacks.async_broadcast_event(appliance, Events.PAIRED)
+        await homeconnect._callbacks.async_broadcast_event(appliance, Events.DATA_CHANGED)
+        _LOGGER.debug("Loaded appliance: %s", appliance.name)
+
+    def _create_stub(self, ha:dict) -> Appliance:
+        """ Create an appliance with just its identity, without fetching any of its data """
+        homeconnect = self._homeconnect
+        appliance = Appliance(
+            name = ha['name'],
+            brand = ha['brand'],
+            type = ha['type'],
+            vib = ha['vib'],
+            connected = False,
+            enumber = ha['enumber'],
+            haId = ha['haId'],
+            uri = f"/api/homeappliances/{ha['haId']}"
+        )
+        appliance._homeconnect = homeconnect
+        appliance._callbacks = homeconnect._callbacks
+        appliance._api = homeconnect._api
+        return appliance
+
+    async def _async_on_connected(self, appliance:Appliance) -> None:
+        """ The library has loaded the data of a stub when it connected so let the entities be created
+
+        Whether an appliance is a stub is decided from its data (a stub has no status) when it is created or restored
+        from the cache and is recorded in its readiness state, which only becomes DYNAMIC_LOADED once the data is loaded.
+        """
+        if self._readiness.get_state(appliance.haId) != ReadinessState.DYNAMIC_LOADED:
+            self.stats["deferred_loads"] += 1
+            _LOGGER.debug("Completing the deferred load of appliance %s", appliance.haId)
+            self._readiness.set_state(appliance.haId, ReadinessState.DYNAMIC_LOADED)
+            await self._homeconnect._callbacks.async_broadcast_event(appliance, Events.PAIRED)
+            await self._homeconnect._callbacks.async_broadcast_event(appliance, Events.DATA_CHANGED)
+
+    def _on_paired(self, appliance:Appliance) -> None:
+        """ Appliances paired while running are loaded in full by the library before it announces them """
+        if self._readiness.get_state(appliance.haId) is None:
+            self._readiness.set_state(appliance.haId, ReadinessState.DYNAMIC_LOADED)
+
+    def _on_depaired(self, appliance:Appliance) -> None:
+        self._readiness.forget(appliance.haId)
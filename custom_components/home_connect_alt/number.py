@@ -1,14 +1,17 @@
 """ Implement the Number entities of this implementation """
 from __future__ import annotations
 import sys
-from home_connect_async import Appliance, HomeConnect, HomeConnectError, Events
+from home_connect_async import Appliance, HomeConnectError
 from homeassistant.components.number import NumberEntity
+from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
 from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType
 
 from .common import Configuration, InteractiveEntityBase, EntityManager
+from .discovery import EntitySpec
 from .const import DOMAIN
 
 
@@ -17,39 +20,16 @@ async def async_setup_entry(hass:HomeAssistant , config_entry:ConfigType, async_
     #auth = hass.data[DOMAIN][config_entry.entry_id]
     #homeconnect:HomeConnect = hass.data[DOMAIN]['homeconnect']
     entry_conf:Configuration = hass.data[DOMAIN][config_entry.entry_id]
-    homeconnect:HomeConnect = entry_conf["homeconnect"]
     entity_manager = EntityManager(async_add_entities, "Number")
 
-    number_types = ["Int", "Float", "Double"]
+    def build_entity(appliance:Appliance, spec:EntitySpec, conf:Configuration) -> Entity:
+        match spec.kind:
+            case "option":
+                return OptionNumber(appliance, spec.key, conf, hc_obj=spec.hc_obj)
+            case "setting":
+                return SettingsNumber(appliance, spec.key, conf, hc_obj=spec.hc_obj)
 
-    def add_appliance(appliance:Appliance) -> None:
-        conf = entry_conf.get_config()
-
-        if appliance.available_programs:
-            for program in appliance.available_programs.values():
-                if program.options:
-                    for option in program.options.values():
-                        if (not conf.has_entity_setting(option.key, "type") and option.type in number_types) or conf.has_entity_setting(option.key, "type") in number_types:
-                            device = OptionNumber(appliance, option.key, conf, hc_obj=option)
-                            entity_manager.add(device)
-
-        if appliance.settings:
-            for setting in appliance.settings.values():
-                if ((not conf.has_entity_setting(setting.key, "type") and setting.type in number_types) or conf.has_entity_setting(setting.key, "type") in number_types) \
-                    and setting.access != "read" :
-                    device = SettingsNumber(appliance, setting.key, conf, hc_obj=setting)
-                    entity_manager.add(device)
-
-        entity_manager.register()
-
-
-    def remove_appliance(appliance:Appliance) -> None:
-        entity_manager.remove_appliance(appliance)
-
-    homeconnect.register_callback(add_appliance,[Events.PAIRED, Events.DATA_CHANGED, Events.PROGRAM_STARTED, Events.PROGRAM_SELECTED])
-    homeconnect.register_callback(remove_appliance, Events.DEPAIRED)
-    for appliance in homeconnect.appliances.values():
-        add_appliance(appliance)
+    entry_conf["discovery"].register_platform(Platform.NUMBER, entity_manager, build_entity)
 
 
 class OptionNumber(InteractiveEntityBase, NumberEntity):
@@ -105,6 +85,8 @@ class OptionNumber(InteractiveEntityBase, NumberEntity):
     @property
     def native_value(self) -> float:
         """Return the entity value to represent the entity state."""
+        if self.has_optimistic_value:
+            return self.optimistic_value
         option = self._appliance.get_applied_program_option(self._key)
         if option:
             return option.value
@@ -115,14 +97,14 @@ class OptionNumber(InteractiveEntityBase, NumberEntity):
         try:
             if self._hc_obj.type == 'Int':
                 value = int(value)
-            await self._appliance.async_set_option(self._key, value)
+            await self.async_write_optimistic(value, lambda: self._appliance.async_set_option(self._key, value))
         except HomeConnectError as ex:
             if ex.error_description:
                 raise HomeAssistantError(f"Failed to set the option value: {ex.error_description} ({ex.code} - {self._key}={value})")
             raise HomeAssistantError(f"Failed to set the option value: ({ex.code} - {self._key}={value})")
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
 
 
 class SettingsNumber(InteractiveEntityBase, NumberEntity):
@@ -169,11 +151,13 @@ class SettingsNumber(InteractiveEntityBase, NumberEntity):
     @property
     def native_value(self) -> float:
         """Return the entity value to represent the entity state."""
+        if self.has_optimistic_value:
+            return self.optimistic_value
         return self._hc_obj.value
 
     async def async_set_native_value(self, value: float) -> None:
         try:
-            await self._appliance.async_apply_setting(self._key, value)
+            await self.async_write_optimistic(value, lambda: self._appliance.async_apply_setting(self._key, value))
         except HomeConnectError as ex:
             if ex.error_description:
                 raise HomeAssistantError(f"Failed to apply the setting value: {ex.error_description} ({ex.code})")
@@ -181,4 +165,4 @@ class SettingsNumber(InteractiveEntityBase, NumberEntity):
 
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
@@ -0,0 +1,134 @@
+""" Publishing of the appliance events on the Home Assistant event bus """
+from __future__ import annotations
+import logging
+import time
+from functools import partial
+from collections import OrderedDict, deque
+
+from home_connect_async import Appliance, HomeConnect, Events
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+
+from .appliance_index import ApplianceIndex
+from .common import Configuration
+from .const import DOMAIN, PUBLISHED_EVENTS, EVENT_DEDUP_WINDOW, EVENT_DEDUP_SIZE
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ApplianceEventQueue():
+    """ The events of a single appliance waiting to be published, in the order they were received """
+
+    def __init__(self) -> None:
+        self.events:deque[tuple[float, dict]] = deque()
+        # key => (value, time) of the last events accepted for publishing, the oldest keys are evicted first
+        self.recent:OrderedDict[str, tuple[object, float]] = OrderedDict()
+        self.cancel_timer = None
+
+    def is_duplicate(self, key:str, value, now:float) -> bool:
+        """ True if the same value of the key was accepted within the dedup window, otherwise remember it """
+        last = self.recent.pop(key, None)
+        duplicate = last is not None and last[0] == value and now - last[1] <= EVENT_DEDUP_WINDOW
+        # A duplicate doesn't extend the window of the value it repeats
+        self.recent[key] = last if duplicate else (value, now)
+        while len(self.recent) > EVENT_DEDUP_SIZE:
+            self.recent.popitem(last=False)
+        return duplicate
+
+
+class EventPublisher():
+    """ Publish the events of the appliances of a config entry on the Home Assistant event bus
+
+    Each appliance has its own queue so the events of an appliance are published in the order they were received
+    and a repeated value of a key is skipped only if it repeats the last value of the same key of the same appliance
+    within the dedup window. The publishing of a key can be delayed with its "publish_delay" entity setting to let
+    the data of the appliance settle before automations react to it, the events received after a delayed
+    event wait for it so they keep their order. The pending events are dropped when the config entry is unloaded.
+    """
+
+    def __init__(self, hass:HomeAssistant, conf:Configuration) -> None:
+        self._hass = hass
+        self._conf = conf
+        self._index = ApplianceIndex.get(hass)
+        self._queues:dict[str, ApplianceEventQueue] = {}
+        self._closed = False
+        self.stats = { "received": 0, "published": 0, "delayed": 0, "duplicates": 0, "no_device": 0, "cancelled": 0 }
+
+    def attach(self, homeconnect:HomeConnect) -> None:
+        """ Publish the events of the appliances of the HomeConnect object """
+        homeconnect.register_callback(self._register_appliance, [Events.PAIRED, Events.CONNECTED])
+        homeconnect.register_callback(self._on_appliance_removed, Events.DEPAIRED)
+        for appliance in homeconnect.appliances.values():
+            self._register_appliance(appliance)
+
+    def _register_appliance(self, appliance:Appliance) -> None:
+        for event in PUBLISHED_EVENTS:
+            appliance.register_callback(self._async_handle_event, event)
+
+    def _on_appliance_removed(self, appliance:Appliance) -> None:
+        queue = self._queues.pop(appliance.haId, None)
+        if queue:
+            self._drop(queue)
+
+    def cancel(self) -> None:
+        """ Drop the pending events and stop publishing """
+        self._closed = True
+        for queue in self._queues.values():
+            self._drop(queue)
+        self._queues.clear()
+
+    def _drop(self, queue:ApplianceEventQueue) -> None:
+        if queue.cancel_timer:
+            queue.cancel_timer()
+            queue.cancel_timer = None
+        self.stats["cancelled"] += len(queue.events)
+        queue.events.clear()
+
+    async def _async_handle_event(self, appliance:Appliance, key:str, value) -> None:
+        if self._closed:
+            return
+        self.stats["received"] += 1
+        now = time.monotonic()
+        queue = self._queues.setdefault(appliance.haId, ApplianceEventQueue())
+        if queue.is_duplicate(key, value, now):
+            self.stats["duplicates"] += 1
+            _LOGGER.debug("Skipped publishing of duplicate event to Home Assistant event bus: %s = %s", key, str(value))
+            return
+        device_id = self._index.get_device_id(appliance)
+        if not device_id:
+            self.stats["no_device"] += 1
+            _LOGGER.warning("No device found for appliance %s, cannot publish event %s = %s", appliance.normalized_haId, key, str(value))
+            return
+
+        event_data = { "device_id": device_id, "key": key, "value": value }
+        delay = self._conf.get_entity_setting(key, "publish_delay", 0) or 0
+        if delay:
+            self.stats["delayed"] += 1
+        # An event is never published before the events received ahead of it
+        due = max(now + delay, queue.events[-1][0]) if queue.events else now + delay
+        queue.events.append((due, event_data))
+        if not queue.cancel_timer:
+            self._publish_due(appliance.haId)
+
+    @callback
+    def _publish_due(self, haid:str) -> None:
+        queue = self._queues.get(haid)
+        if not queue:
+            return
+        queue.cancel_timer = None
+        now = time.monotonic()
+        while queue.events and queue.events[0][0] <= now:
+            event_data = queue.events.popleft()[1]
+            self._hass.bus.async_fire(f"{DOMAIN}_event", event_data)
+            self.stats["published"] += 1
+            _LOGGER.debug("Published event to Home Assistant event bus: %s = %s", event_data["key"], str(event_data["value"]))
+        if queue.events:
+            queue.cancel_timer = async_call_later(self._hass, queue.events[0][0] - now, partial(self._on_timer, haid))
+
+    @callback
+    def _on_timer(self, haid:str, _now) -> None:
+        self._publish_due(haid)
+
+    def get_stats(self) -> dict:
+        """ Return the publishing counters for diagnostics """
+        return { "pending": sum(len(queue.events) for queue in self._queues.values()), **self.stats }
@@ -0,0 +1,82 @@
+""" Track how much of the data of each appliance has been loaded """
+from __future__ import annotations
+import asyncio
+import logging
+from enum import IntEnum
+from typing import Callable
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ReadinessState(IntEnum):
+    """ The loading stages of an appliance, an appliance only moves forward through them """
+    DISCOVERED = 1          # Listed by the service, only its identity is known
+    STATIC_LOADED = 2       # The programs and commands are known, the other data may be stale (restored from the cache)
+    DYNAMIC_LOADED = 3      # All the data was loaded from the service
+
+
+class ApplianceReadiness():
+    """ The readiness state of the appliances of a config entry
+
+    The loader advances the state of each appliance as its data is loaded. Listeners are called on every transition
+    so the entities of an appliance are created as soon as its data is available instead of waiting for all the
+    appliances to load, and futures let callers wait for an appliance to reach a state.
+    """
+
+    def __init__(self, loop:asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._states:dict[str, ReadinessState] = {}
+        self._futures:dict[str, dict[ReadinessState, asyncio.Future]] = {}
+        self._listeners:list[Callable[[str, ReadinessState], None]] = []
+
+    def add_listener(self, listener:Callable[[str, ReadinessState], None]) -> None:
+        """ Call the listener with the haId and the new state on every state transition """
+        self._listeners.append(listener)
+
+    def get_state(self, haid:str) -> ReadinessState|None:
+        """ Return the state of an appliance or None if it wasn't discovered yet """
+        return self._states.get(haid)
+
+    def set_state(self, haid:str, state:ReadinessState) -> None:
+        """ Advance the state of an appliance, moving back to an earlier state is ignored """
+        current = self._states.get(haid)
+        if current is not None and state <= current:
+            return
+        _LOGGER.debug("Appliance %s is now %s", haid, state.name)
+        self._states[haid] = state
+        for (waited_state, future) in list(self._futures.get(haid, {}).items()):
+            if waited_state <= state:
+                if not future.done():
+                    future.set_result(None)
+                del self._futures[haid][waited_state]
+        for listener in self._listeners:
+            listener(haid, state)
+
+    async def async_wait(self, haid:str, state:ReadinessState = ReadinessState.DYNAMIC_LOADED) -> None:
+        """ Wait until the appliance reaches the state """
+        current = self._states.get(haid)
+        if current is not None and current >= state:
+            return
+        future = self._futures.setdefault(haid, {}).get(state)
+        if future is None:
+            future = self._loop.create_future()
+            self._futures[haid][state] = future
+        # Shielded so a waiter that times out doesn't cancel the future of the other waiters
+        await asyncio.shield(future)
+
+    def forget(self, haid:str) -> None:
+        """ Drop the state of a removed appliance and cancel its waiters """
+        self._states.pop(haid, None)
+        for future in self._futures.pop(haid, {}).values():
+            future.cancel()
+
+    def cancel(self) -> None:
+        """ Cancel all the waiters, used when the config entry is unloaded """
+        for futures in self._futures.values():
+            for future in futures.values():
+                future.cancel()
+        self._futures = {}
+
+    def get_states(self) -> dict[str, str]:
+        """ Return the state names of the appliances for diagnostics """
+        return { haid: state.name for (haid, state) in self._states.items() }
@@ -0,0 +1,121 @@
+""" Targeted refresh of the data of a single appliance """
+from __future__ import annotations
+import asyncio
+import logging
+
+from home_connect_async import Appliance, Events, HomeConnectError
+from home_connect_async.api import HomeConnectApi
+from home_connect_async.appliance import Option, Status
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+
+from .appliance_index import ApplianceIndex
+from .budget import ApiBudget, PRIORITY_REFRESH, PRIORITY_CONSTRAINTS
+from .const import DOMAIN, APPLIANCE_READY_TIMEOUT
+from .constraints import ConstraintCache
+from .readiness import ApplianceReadiness, ReadinessState
+
+_LOGGER = logging.getLogger(__name__)
+
+REFRESH_SCOPE_STATUS = "status"
+REFRESH_SCOPE_SETTINGS = "settings"
+REFRESH_SCOPE_PROGRAM = "program"
+REFRESH_SCOPE_FULL = "full"
+REFRESH_SCOPES = [REFRESH_SCOPE_STATUS, REFRESH_SCOPE_SETTINGS, REFRESH_SCOPE_PROGRAM, REFRESH_SCOPE_FULL]
+
+
+def estimate_refresh_cost(appliance:Appliance, scope:str) -> int:
+    """ Return the expected number of API calls needed to refresh the scope of the appliance data
+
+    The estimate is based on the currently loaded data, settings are fetched one call per setting and the
+    options of the available programs are fetched for the current and the "startonly" programs.
+    """
+    settings = 1 + len(appliance.settings or {})
+    match scope:
+        case "status":
+            return 1
+        case "settings":
+            return settings
+        case "program":
+            return 2
+    available = 1 + sum(1 for program in (appliance.available_programs or {}).values() if program.execution == "startonly")
+    if appliance.active_program or appliance.selected_program:
+        available += 1
+    return 2 + settings + 1 + 1 + available
+
+
+def estimate_constraint_calls(appliance:Appliance, scope:str) -> int:
+    """ Return how many of the estimated calls fetch the options of the available programs """
+    if scope != REFRESH_SCOPE_FULL:
+        return 0
+    calls = sum(1 for program in (appliance.available_programs or {}).values() if program.execution == "startonly")
+    return calls + 1 if appliance.active_program or appliance.selected_program else calls
+
+
+async def _async_get_list(api:HomeConnectApi, endpoint:str, name:str) -> list[dict]:
+    """ GET a list of the appliance data, fails instead of returning partial data """
+    response = await api.async_get(endpoint)
+    if response.error or not response.data or name not in response.data:
+        raise HomeConnectError(f"Failed to refresh the {name} of the appliance", response=response)
+    return response.data[name]
+
+
+async def async_refresh_appliance(api:HomeConnectApi, appliance:Appliance, scope:str) -> None:
+    """ Reload the scope of the appliance data from the service and notify the entities
+
+    The library only offers a full reload and a reload of the programs, so the status and settings are
+    fetched through the API object of the config entry and parsed with the classes of the library.
+    """
+    _LOGGER.debug("Refreshing the %s data of appliance %s", scope, appliance.haId)
+    base_endpoint = f"/api/homeappliances/{appliance.haId}"
+    match scope:
+        case "status":
+            statuses = await _async_get_list(api, f"{base_endpoint}/status", "status")
+            appliance.status = { status["key"]: Status.create(status) for status in statuses }
+        case "settings":
+            settings = {}
+            # The list doesn't include the allowed values and constraints so each setting is fetched as well
+            for setting in await _async_get_list(api, f"{base_endpoint}/settings", "settings"):
+                response = await api.async_get(f"{base_endpoint}/settings/{setting['key']}")
+                if response.status == 200 and response.data:
+                    settings[setting["key"]] = Option.create(response.data)
+            appliance.settings = settings
+        case "program":
+            await appliance.async_get_selected_program()
+            await appliance.async_get_active_program()
+        case _:
+            await appliance.async_fetch_data(include_static_data=True)
+    await appliance._callbacks.async_broadcast_event(appliance, Events.DATA_CHANGED)
+
+
+async def async_refresh(hass:HomeAssistant, appliance:Appliance, scope:str, dry_run:bool=False) -> dict:
+    """ Estimate the cost of a refresh, run it unless it is a dry run and return a summary of the calls it made """
+    entry_conf = hass.data[DOMAIN][ApplianceIndex.get(hass).get_entry_id(appliance)]
+    readiness:ApplianceReadiness = entry_conf["readiness"]
+    try:
+        # The estimate and the partial refreshes need the programs and settings of the appliance to be known
+        await asyncio.wait_for(readiness.async_wait(appliance.haId, ReadinessState.STATIC_LOADED), APPLIANCE_READY_TIMEOUT)
+    except asyncio.TimeoutError as ex:
+        raise HomeAssistantError(f"The data of {appliance.name} hasn't been loaded yet, it is loaded when the appliance connects") from ex
+
+    estimate = estimate_refresh_cost(appliance, scope)
+    budget:ApiBudget = entry_conf["budget"]
+    # The budget keeps a reserve for the higher priorities so the refresh has to fit in the calls left to its own.
+    # The program options are fetched last and with the lowest priority so the whole refresh has to fit in their share
+    priority = PRIORITY_CONSTRAINTS if estimate_constraint_calls(appliance, scope) else PRIORITY_REFRESH
+    available = budget.available(priority)
+    result = { "haId": appliance.haId, "scope": scope, "estimated_calls": estimate, "remaining_calls": budget.remaining, "available_calls": available }
+    if dry_run:
+        return result
+    if estimate > available:
+        raise HomeAssistantError(f"Refreshing the {scope} data of {appliance.name} needs about {estimate} API calls but only {available} are available for refreshing")
+
+    if scope == REFRESH_SCOPE_FULL:
+        # A full refresh reloads the static data so the cached constraints of the model are fetched again
+        ConstraintCache.get(hass).invalidate(vib=appliance.vib)
+    before = budget.get_appliance_usage().get(appliance.normalized_haId, 0)
+    await async_refresh_appliance(entry_conf["api"], appliance, scope)
+    result["actual_calls"] = budget.get_appliance_usage().get(appliance.normalized_haId, 0) - before
+    result["remaining_calls"] = budget.remaining
+    _LOGGER.debug("Refreshed the %s data of appliance %s with %d API calls (estimated %d)", scope, appliance.haId, result["actual_calls"], estimate)
+    return result
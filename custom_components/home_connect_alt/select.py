@@ -1,17 +1,20 @@
 """ Implement the Select entities of this implementation """
 from __future__ import annotations
 import logging
-from custom_components.home_connect_alt.time import DelayedOperationTime
-from home_connect_async import Appliance, HomeConnect, HomeConnectError, Events, ConditionalLogger as CL
+from home_connect_async import Appliance, HomeConnectError, Events, ConditionalLogger as CL
 from homeassistant.components.select import SelectEntity
+from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
 from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.helpers.entity_registry import async_get
 
-from .common import InteractiveEntityBase, EntityManager, is_boolean_enum, Configuration
-from .const import CONF_DELAYED_OPS, CONF_DELAYED_OPS_ABSOLUTE_TIME, CONF_DELAYED_OPS_DEFAULT, CONF_TRANSLATION_MODE, CONF_TRANSLATION_MODE_SERVER, DEVICE_ICON_MAP, DOMAIN
+from .common import InteractiveEntityBase, EntityManager, Configuration
+from .discovery import EntitySpec
+from .dispatcher import AVAILABLE_PROGRAMS_KEY, SELECTED_PROGRAM_KEY
+from .const import CONF_TRANSLATION_MODE, CONF_TRANSLATION_MODE_SERVER, DEVICE_ICON_MAP, DOMAIN
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -19,50 +22,26 @@ async def async_setup_entry(hass:HomeAssistant , config_entry:ConfigType, async_
     """Add Selects for passed config_entry in HA."""
     #homeconnect:HomeConnect = hass.data[DOMAIN]['homeconnect']
     entry_conf:Configuration = hass.data[DOMAIN][config_entry.entry_id]
-    homeconnect:HomeConnect = entry_conf["homeconnect"]
     entity_manager = EntityManager(async_add_entities, "Select")
 
-    def add_appliance(appliance:Appliance) -> None:
-        conf = entry_conf.get_config()
-
-        if appliance.available_programs:
-            device = ProgramSelect(appliance, None, conf)
-            entity_manager.add(device)
-
-        if appliance.available_programs:
-            for program in appliance.available_programs.values():
-                if program.options:
-                    for option in program.options.values():
-                        if conf.get_entity_setting(option.key, "type") == "DelayedOperation" and (
-                            entry_conf[CONF_DELAYED_OPS] == CONF_DELAYED_OPS_DEFAULT or not DelayedOperationTime.has_program_run_time(appliance)):
-                            device = DelayedOperationSelect(appliance, option.key, conf, option)
-                            # remove the TIME delayed operation entity if it exists
-                            reg = async_get(hass)
-                            time_entity = reg.async_get_entity_id("time", DOMAIN, device.unique_id)
-                            if time_entity:
-                                reg.async_remove(time_entity)
-
-                            entity_manager.add(device)
-                        elif option.allowedvalues and len(option.allowedvalues)>1:
-                            device = OptionSelect(appliance, option.key, conf)
-                            entity_manager.add(device)
-
-        if appliance.settings:
-            for setting in appliance.settings.values():
-                if (setting.allowedvalues and len(setting.allowedvalues)>1 and not is_boolean_enum(setting.allowedvalues)) \
-                    and setting.access != "read" :
-                    device = SettingsSelect(appliance, setting.key, conf)
-                    entity_manager.add(device)
-
-        entity_manager.register()
-
-    def remove_appliance(appliance:Appliance) -> None:
-        entity_manager.remove_appliance(appliance)
-
-    homeconnect.register_callback(add_appliance, [Events.PAIRED, Events.DATA_CHANGED, Events.PROGRAM_STARTED, Events.PROGRAM_SELECTED])
-    homeconnect.register_callback(remove_appliance, Events.DEPAIRED)
-    for appliance in homeconnect.appliances.values():
-        add_appliance(appliance)
+    def build_entity(appliance:Appliance, spec:EntitySpec, conf:Configuration) -> Entity:
+        match spec.kind:
+            case "program":
+                return ProgramSelect(appliance, None, conf)
+            case "delayed_operation":
+                device = DelayedOperationSelect(appliance, spec.key, conf, spec.hc_obj)
+                # remove the TIME delayed operation entity if it exists
+                reg = async_get(hass)
+                time_entity = reg.async_get_entity_id("time", DOMAIN, device.unique_id)
+                if time_entity:
+                    reg.async_remove(time_entity)
+                return device
+            case "option":
+                return OptionSelect(appliance, spec.key, conf)
+            case "setting":
+                return SettingsSelect(appliance, spec.key, conf)
+
+    entry_conf["discovery"].register_platform(Platform.SELECT, entity_manager, build_entity)
 
 class ProgramSelect(InteractiveEntityBase, SelectEntity):
     """ Selection of available programs """
@@ -71,6 +50,14 @@ class ProgramSelect(InteractiveEntityBase, SelectEntity):
     def unique_id(self) -> str:
         return f'{self.safe_haId}_programs'
 
+    @property
+    def confirmation_keys(self) -> list[str]:
+        return [Events.PROGRAM_SELECTED]
+
+    @property
+    def data_keys(self) -> set[str]:
+        return {SELECTED_PROGRAM_KEY, AVAILABLE_PROGRAMS_KEY, "BSH.Common.Status.RemoteControlActive"}
+
     @property
     def translation_key(self) -> str:
         return "programs"
@@ -110,6 +97,8 @@ class ProgramSelect(InteractiveEntityBase, SelectEntity):
     @property
     def current_option(self) -> str:
         """Return the selected entity option to represent the entity state."""
+        if self.has_optimistic_value:
+            return self.optimistic_value
         current_program = self._appliance.get_applied_program()
         if current_program:
             if self._appliance.available_programs and current_program.key in self._appliance.available_programs:
@@ -126,16 +115,16 @@ class ProgramSelect(InteractiveEntityBase, SelectEntity):
         try:
             if self._conf[CONF_TRANSLATION_MODE] == CONF_TRANSLATION_MODE_SERVER:
                 program = next((p for p in self._appliance.available_programs.values() if p.name == option), None)
-                await self._appliance.async_select_program(program_key=program.key)
+                await self.async_write_optimistic(option, lambda: self._appliance.async_select_program(program_key=program.key), SELECTED_PROGRAM_KEY)
             else:
-                await self._appliance.async_select_program(program_key=option)
+                await self.async_write_optimistic(option, lambda: self._appliance.async_select_program(program_key=option), SELECTED_PROGRAM_KEY)
         except HomeConnectError as ex:
             if ex.error_description:
                 raise HomeAssistantError(f"Failed to set the selected program: {ex.error_description} ({ex.code} - {self._key}={option})")
             raise HomeAssistantError(f"Failed to set the selected program ({ex.code} - {self._key}={option})")
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
 
 
 class OptionSelect(InteractiveEntityBase, SelectEntity):
@@ -194,6 +183,8 @@ class OptionSelect(InteractiveEntityBase, SelectEntity):
         """Return the selected entity option to represent the entity state."""
         # if self._appliance.selected_program.options[self._key].value not in self.options:
         #     _LOGGER.debug("The current option is not in the list of available options")
+        if self.has_optimistic_value:
+            return self.optimistic_value
         option = self._appliance.get_applied_program_option(self._key)
         if option:
             CL.debug(_LOGGER, CL.LogMode.VERBOSE, "Option %s current value: %s", self._key, option.value)
@@ -211,19 +202,20 @@ class OptionSelect(InteractiveEntityBase, SelectEntity):
             _LOGGER.debug('Tried to set an empty option')
             return
         try:
+            displayed = option
             if self._conf[CONF_TRANSLATION_MODE] == CONF_TRANSLATION_MODE_SERVER:
                 available_option = self._appliance.get_applied_program_available_option(self._key)
                 if (available_option.allowedvaluesdisplay):
                     idx = available_option.allowedvaluesdisplay.index(option)
                     option = available_option.allowedvalues[idx]
-            await self._appliance.async_set_option(self._key, option)
+            await self.async_write_optimistic(displayed, lambda: self._appliance.async_set_option(self._key, option))
         except HomeConnectError as ex:
             if ex.error_description:
                 raise HomeAssistantError(f"Failed to set the selected option: {ex.error_description} ({ex.code})")
             raise HomeAssistantError(f"Failed to set the selected option: ({ex.code})")
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
 
 
 class SettingsSelect(InteractiveEntityBase, SelectEntity):
@@ -266,11 +258,13 @@ class SettingsSelect(InteractiveEntityBase, SelectEntity):
     @property
     def current_option(self) -> str:
         """Return the selected entity option to represent the entity state."""
+        if self.has_optimistic_value:
+            return self.optimistic_value
         return self._appliance.settings[self._key].value if self._appliance.settings and self._key in self._appliance.settings else None
 
     async def async_select_option(self, option: str) -> None:
         try:
-            await self._appliance.async_apply_setting(self._key, option)
+            await self.async_write_optimistic(option, lambda: self._appliance.async_apply_setting(self._key, option))
         except HomeConnectError as ex:
             if ex.error_description:
                 raise HomeAssistantError(f"Failed to apply the setting: {ex.error_description} ({ex.code})")
@@ -278,7 +272,7 @@ class SettingsSelect(InteractiveEntityBase, SelectEntity):
 
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
 
 
 class DelayedOperationSelect(InteractiveEntityBase, SelectEntity):
@@ -337,4 +331,4 @@ class DelayedOperationSelect(InteractiveEntityBase, SelectEntity):
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
         if key == Events.PROGRAM_FINISHED:
             self._current = '0:00'
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
@@ -3,19 +3,28 @@ from __future__ import annotations
 from datetime import datetime, timedelta, timezone
 import logging
 from typing import Any, Mapping
-from home_connect_async import Appliance, HomeConnect, Events, HealthStatus
+from home_connect_async import Appliance, HomeConnect, HealthStatus
 from homeassistant.components.sensor import SensorEntity
-from homeassistant.core import HomeAssistant
+from homeassistant.const import Platform
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_call_later
 from homeassistant.helpers.typing import ConfigType
 
+from .budget import ApiBudget
 from .common import Configuration, EntityBase, EntityManager
+from .countdown import CountdownEngine
+from .discovery import EntitySpec
+from .dispatcher import ACTIVE_PROGRAM_KEY, SELECTED_PROGRAM_KEY
 from .const import (
     CONF_TRANSLATION_MODE_SERVER,
     DEVICE_ICON_MAP,
     DOMAIN,
     CONF_TRANSLATION_MODE,
     HOME_CONNECT_DEVICE,
+    STATUS_BUDGET_UPDATE_DELAY,
+    COUNTDOWN_TOLERANCE,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -28,60 +37,26 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigType, async
     homeconnect:HomeConnect = entry_conf["homeconnect"]
 
     entity_manager = EntityManager(async_add_entities, "Sensor")
-
-    def add_appliance(appliance: Appliance) -> None:
-
-        if appliance.selected_program:
-            conf = entry_conf.get_config({"program_type": "selected"})
-            device = ProgramSensor(appliance, None, conf)
-            entity_manager.add(device)
-        if appliance.active_program:
-            conf = entry_conf.get_config({"program_type": "active"})
-            device = ProgramSensor(appliance, None, conf)
-            entity_manager.add(device)
-
-        conf = entry_conf.get_config()
-        if appliance.selected_program and appliance.selected_program.options:
-            for option in appliance.selected_program.options.values():
-                if not isinstance(option.value, bool):
-                    device = ProgramOptionSensor(appliance, option.key, conf)
-                    entity_manager.add(device)
-
-        if appliance.active_program and appliance.active_program.options:
-            for option in appliance.active_program.options.values():
-                if not isinstance(option.value, bool):
-                    device = ProgramOptionSensor(appliance, option.key, conf)
-                    entity_manager.add(device)
-
-        if appliance.status:
-            for (key, value) in appliance.status.items():
-                device = None
-                if not isinstance(value.value, bool) and conf.get_entity_setting(key, "type") != "Boolean":  # should be a binary sensor if it has a boolean value
-                    if "temperature" in key.lower():
-                        conf.set_entity_setting(key,"class","temperature")
-                    device = StatusSensor(appliance, key, conf)
-                    entity_manager.add(device)
-
-        if appliance.settings:
-            for setting in appliance.settings.values():
-                conf = entry_conf.get_config()
-                if setting.type != "Boolean" and not isinstance(setting.value, bool) and conf.get_entity_setting(setting.key, "type") != "Boolean":
-                    device = SettingsSensor(appliance, setting.key, conf)
-                    entity_manager.add(device)
-
-        entity_manager.register()
-
-    def remove_appliance(appliance: Appliance) -> None:
-        entity_manager.remove_appliance(appliance)
+    countdowns:dict[str, CountdownEngine] = {}
+
+    def build_entity(appliance:Appliance, spec:EntitySpec, conf:Configuration) -> Entity:
+        match spec.kind:
+            case "program":
+                return ProgramSensor(appliance, None, conf)
+            case "option":
+                if appliance.haId not in countdowns:
+                    countdowns[appliance.haId] = CountdownEngine(appliance)
+                return ProgramOptionSensor(appliance, spec.key, conf, countdown=countdowns[appliance.haId])
+            case "status":
+                return StatusSensor(appliance, spec.key, conf)
+            case "setting":
+                return SettingsSensor(appliance, spec.key, conf)
 
     # First add the global home connect status sensor
-    async_add_entities( [ HomeConnectStatusSensor(homeconnect, "" if entry_conf["primary_config_entry"] else "_"+config_entry.entry_id) ] )
+    async_add_entities( [ HomeConnectStatusSensor(homeconnect, "" if entry_conf["primary_config_entry"] else "_"+config_entry.entry_id, entry_conf["budget"]) ] )
 
-    # Subscribe for events and register the existing appliances
-    homeconnect.register_callback(add_appliance, [Events.PAIRED, Events.DATA_CHANGED, Events.PROGRAM_STARTED, Events.PROGRAM_SELECTED])
-    homeconnect.register_callback(remove_appliance, Events.DEPAIRED)
-    for appliance in homeconnect.appliances.values():
-        add_appliance(appliance)
+    # Register with the shared discovery which adds the entities of the existing and future appliances
+    entry_conf["discovery"].register_platform(Platform.SENSOR, entity_manager, build_entity)
 
 
 class ProgramSensor(EntityBase, SensorEntity):
@@ -91,6 +66,10 @@ class ProgramSensor(EntityBase, SensorEntity):
     def unique_id(self) -> str:
         return f"{self.safe_haId}_{self._conf['program_type']}_program"
 
+    @property
+    def data_keys(self) -> set[str]:
+        return {SELECTED_PROGRAM_KEY if self._conf["program_type"] == "selected" else ACTIVE_PROGRAM_KEY}
+
     @property
     def name_ext(self) -> str:
         return f"{self._conf['program_type'].capitalize()} Program"
@@ -121,11 +100,31 @@ class ProgramSensor(EntityBase, SensorEntity):
 
     async def async_on_update(self, appliance: Appliance, key: str, value) -> None:
         _LOGGER.debug("Updating sensor %s => %s", self.unique_id, self.native_value)
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
 
 
 class ProgramOptionSensor(EntityBase, SensorEntity):
-    """Special active program sensor"""
+    """Special active program sensor
+
+    The timestamp options show the finish time anchored by the countdown engine of the appliance, which only
+    moves when the reported remaining time disagrees with it by more than the "tolerance" entity setting.
+    """
+
+    def __init__(self, appliance:Appliance, key:str, conf:Configuration, hc_obj=None, countdown:CountdownEngine=None) -> None:
+        super().__init__(appliance, key, conf, hc_obj)
+        self._countdown = countdown
+        self._untrack_countdown = None
+
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
+        if self._countdown and self.device_class == "timestamp":
+            self._untrack_countdown = self._countdown.track(self._key, self.get_entity_setting("tolerance", COUNTDOWN_TOLERANCE), self.schedule_write_ha_state)
+
+    async def async_will_remove_from_hass(self):
+        await super().async_will_remove_from_hass()
+        if self._untrack_countdown:
+            self._untrack_countdown()
+            self._untrack_countdown = None
 
     @property
     def device_class(self) -> str:
@@ -208,6 +207,8 @@ class ProgramOptionSensor(EntityBase, SensorEntity):
         option = program.options[self._key]
 
         if self.device_class == "timestamp":
+            if self._untrack_countdown:
+                return self._countdown.get_finish(self._key)
             return datetime.now(timezone.utc).astimezone() + timedelta(
                 seconds=option.value
             )
@@ -233,7 +234,10 @@ class ProgramOptionSensor(EntityBase, SensorEntity):
         return option.value
 
     async def async_on_update(self, appliance: Appliance, key: str, value) -> None:
-        self.async_write_ha_state()
+        if self._untrack_countdown:
+            # The write is suppressed when the anchored finish time didn't move
+            self._countdown.refresh()
+        self.schedule_write_ha_state()
 
 
 class StatusSensor(EntityBase, SensorEntity):
@@ -279,7 +283,7 @@ class StatusSensor(EntityBase, SensorEntity):
         return None
 
     async def async_on_update(self, appliance: Appliance, key: str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
 
 
 class SettingsSensor(EntityBase, SensorEntity):
@@ -328,19 +332,78 @@ class SettingsSensor(EntityBase, SensorEntity):
         return None
 
     async def async_on_update(self, appliance: Appliance, key: str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
 
 
 class HomeConnectStatusSensor(SensorEntity):
-    """Global Home Connect status sensor"""
+    """Global Home Connect status sensor
+
+    The state is written when the health status changes and, while the service is blocked, by a single timer
+    that fires when the displayed remaining block time changes. The API call counters are written at most once
+    per STATUS_BUDGET_UPDATE_DELAY after calls were made. Nothing runs while the status doesn't change.
+    """
 
-    should_poll = True
+    should_poll = False
     _attr_has_entity_name = True
 
-    def __init__(self, homeconnect: HomeConnect, name_suffix:str) -> None:
+    def __init__(self, homeconnect: HomeConnect, name_suffix:str, budget:ApiBudget) -> None:
         self._homeconnect = homeconnect
         self._name_suffix = name_suffix
+        self._budget = budget
         self.entity_id = f"sensor.{self.unique_id}"
+        self._unsub_countdown = None
+        self._unsub_budget_update = None
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(self._homeconnect.health.add_listener(self._on_health_changed))
+        self.async_on_remove(self._budget.add_listener(self._on_budget_changed))
+        self.async_on_remove(self._cancel_timers)
+        self._schedule_countdown()
+
+    @callback
+    def _on_health_changed(self) -> None:
+        self._schedule_countdown()
+        self.async_write_ha_state()
+
+    @callback
+    def _on_budget_changed(self) -> None:
+        if not self._unsub_budget_update:
+            self._unsub_budget_update = async_call_later(self.hass, STATUS_BUDGET_UPDATE_DELAY, self._on_budget_update)
+
+    @callback
+    def _on_budget_update(self, _now) -> None:
+        self._unsub_budget_update = None
+        self.async_write_ha_state()
+
+    def _schedule_countdown(self) -> None:
+        """ Schedule the next update of the remaining block time, when its displayed value changes """
+        if self._unsub_countdown:
+            self._unsub_countdown()
+            self._unsub_countdown = None
+        blocked_until = self._homeconnect.health.get_blocked_until()
+        if not blocked_until:
+            return
+        remaining = (blocked_until - datetime.now()).total_seconds()
+        if remaining <= 0:
+            return
+        # The remaining time is displayed in seconds under a minute and in minutes above it
+        delay = 1 if remaining <= 60 else (remaining % 60) or 60
+        self._unsub_countdown = async_call_later(self.hass, delay, self._on_countdown)
+
+    @callback
+    def _on_countdown(self, _now) -> None:
+        self._unsub_countdown = None
+        self._schedule_countdown()
+        self.async_write_ha_state()
+
+    @callback
+    def _cancel_timers(self) -> None:
+        if self._unsub_countdown:
+            self._unsub_countdown()
+            self._unsub_countdown = None
+        if self._unsub_budget_update:
+            self._unsub_budget_update()
+            self._unsub_budget_update = None
 
     @property
     def device_info(self):
@@ -368,4 +431,6 @@ class HomeConnectStatusSensor(SensorEntity):
         return {
             "blocked_until": self._homeconnect.health.get_blocked_until(),
             "blocked_for": self._homeconnect.health.get_block_time_str(),
+            "api_calls_remaining": self._budget.remaining,
+            "api_budget_exhausted_at": self._budget.exhaustion_time,
         }
@@ -1,16 +1,20 @@
 """ Implement the services of this implementation """
-from home_connect_async import HomeConnect, HomeConnectError, Appliance
-from homeassistant.core import HomeAssistant
+from home_connect_async import HomeConnectError, Appliance
+from homeassistant.core import HomeAssistant, ServiceResponse
 from homeassistant.exceptions import HomeAssistantError
-from homeassistant.helpers import device_registry as dr
+
+from .appliance_index import ApplianceIndex
+from .const import DOMAIN
+from .history import ProgramHistory
+from .refresh import async_refresh
 
 
 class Services():
-    """ Collection of the Services offered by the integration """
-    def __init__(self, hass:HomeAssistant,  homeconnect:HomeConnect) -> None:
-        self.homeconnect = homeconnect
+    """ Collection of the Services offered by the integration, shared by all the config entries """
+    def __init__(self, hass:HomeAssistant) -> None:
         self.hass = hass
-        self.dr = dr.async_get(hass)
+        self.index = ApplianceIndex.get(hass)
+        self.entries:set[str] = set()
 
     async def async_select_program(self, call) -> None:
         """ Service for selecting a program """
@@ -106,11 +110,35 @@ class Services():
             except ValueError as ex:
                 raise HomeAssistantError(str(ex)) from ex
 
+    async def async_refresh(self, call) -> ServiceResponse:
+        """ Service for refreshing a part of the data of an appliance """
+        data = call.data
+        appliance = self.get_appliance_from_device_id(data['device_id'])
+        if not appliance:
+            raise HomeAssistantError(f"The device {data['device_id']} isn't a known Home Connect appliance")
+        try:
+            return await async_refresh(self.hass, appliance, data['scope'], data['dry_run'])
+        except HomeConnectError as ex:
+            raise HomeAssistantError(ex.error_description if ex.error_description else ex.msg) from ex
+
+    async def async_get_program_history(self, call) -> ServiceResponse:
+        """ Service for querying the history of the program runs of an appliance or of all the appliances """
+        data = call.data
+        haid = None
+        entries = self.entries
+        if 'device_id' in data:
+            appliance = self.get_appliance_from_device_id(data['device_id'])
+            if not appliance:
+                raise HomeAssistantError(f"The device {data['device_id']} isn't a known Home Connect appliance")
+            haid = appliance.haId
+            entries = [self.index.get_entry_id(appliance)]
+        runs = []
+        for entry_id in entries:
+            history:ProgramHistory = self.hass.data[DOMAIN][entry_id]["history"]
+            runs.extend(history.query(haid, data.get('program_key'), data.get('since'), data['limit']))
+        runs.sort(key=lambda run: run["start"] or "", reverse=True)
+        return { "runs": runs[:data['limit']] }
+
     def get_appliance_from_device_id(self, device_id) -> Appliance|None:
         """ Helper function to get an appliance from the Home Assistant device_id """
-        device = self.dr.devices[device_id]
-        haId = list(device.identifiers)[0][1]
-        for (key, appliance) in self.homeconnect.appliances.items():
-            if key.lower().replace('-','_') == haId:
-                return appliance
-        return None
+        return self.index.get_appliance(device_id)
@@ -0,0 +1,185 @@
+""" Automatic distribution of the appliances between config entries using different Home Connect applications """
+from __future__ import annotations
+import logging
+import time
+from datetime import timedelta
+
+from home_connect_async import Appliance, HomeConnect, Events
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import storage
+from homeassistant.helpers.event import async_call_later, async_track_time_interval
+
+from .budget import ApiBudget
+from .const import DOMAIN, CONF_SHARDING, SHARDING_CHECK_INTERVAL, SHARDING_REBALANCE_THRESHOLD, SHARDING_COOLDOWN
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ShardEntry():
+    """ A loaded config entry which takes part in the sharding """
+
+    def __init__(self, budget:ApiBudget, manual_disabled:list[str]) -> None:
+        self.budget = budget
+        self.manual_disabled = manual_disabled
+        # The same list object is used by the HomeConnect object so updating it in place takes effect immediately
+        self.disabled:list[str] = []
+
+
+class ShardManager():
+    """ Assign each appliance of the account to a single config entry
+
+    Every Home Connect application (OAuth client) has its own daily API call limit, so spreading the appliances
+    between config entries that use different applications scales the number of supported appliances.
+    The assignment is persisted and is shared by all the config entries that have sharding enabled, each of them
+    is created with the appliances assigned to the other entries as its disabled appliances.
+    New appliances are assigned to the entry with the lowest call volume and when an entry approaches its daily
+    budget its appliances are moved to the entry with the most spare budget. Moving an appliance reloads the
+    entries that lost or gained it.
+    """
+
+    def __init__(self, hass:HomeAssistant) -> None:
+        self._hass = hass
+        self._store = storage.Store(hass, version=1, key=f"{DOMAIN}_shards", private=True)
+        self._loaded = False
+        self.assignments:dict[str, str] = {}
+        self.volume:dict[str, int] = {}
+        self._entries:dict[str, ShardEntry] = {}
+        self._last_rebalance = 0.0
+        self._pending_reloads:set[str] = set()
+        self._unsub_reload = None
+        self._unsub_check = None
+
+    @classmethod
+    def get(cls, hass:HomeAssistant) -> ShardManager:
+        """ Return the shard manager of the integration, creating it on first use """
+        domain_data = hass.data.setdefault(DOMAIN, {})
+        if "shards" not in domain_data:
+            domain_data["shards"] = ShardManager(hass)
+        return domain_data["shards"]
+
+    def get_participants(self) -> list[str]:
+        """ Return the IDs of the enabled config entries that have sharding enabled """
+        return sorted(entry.entry_id for entry in self._hass.config_entries.async_entries(DOMAIN)
+                      if entry.options.get(CONF_SHARDING) and not entry.disabled_by)
+
+    async def async_attach(self, entry_id:str, budget:ApiBudget, manual_disabled:list[str]) -> list[str]:
+        """ Join a config entry and return its list of disabled appliances to use when creating its HomeConnect object """
+        if not self._loaded:
+            data = await self._store.async_load()
+            if data and not self._loaded:
+                self.assignments = data.get("assignments", {})
+                self.volume = data.get("volume", {})
+            self._loaded = True
+
+        participants = self.get_participants()
+        for (haid, owner) in list(self.assignments.items()):
+            if owner not in participants:
+                # The appliances of removed entries are assigned again when they are loaded
+                del self.assignments[haid]
+
+        entry = ShardEntry(budget, manual_disabled)
+        self._entries[entry_id] = entry
+        self._update_disabled(entry_id)
+        if not self._unsub_check:
+            self._unsub_check = async_track_time_interval(self._hass, self._check_budgets, timedelta(seconds=SHARDING_CHECK_INTERVAL))
+        return entry.disabled
+
+    def bind(self, entry_id:str, homeconnect:HomeConnect) -> None:
+        """ Claim the appliances loaded by the HomeConnect object of a config entry """
+        def on_appliance_paired(appliance:Appliance) -> None:
+            self.claim(entry_id, appliance)
+
+        homeconnect.register_callback(on_appliance_paired, Events.PAIRED)
+
+    def detach(self, entry_id:str) -> None:
+        """ Leave an unloaded config entry, its appliances stay assigned to it """
+        self._entries.pop(entry_id, None)
+        self._pending_reloads.discard(entry_id)
+        if not self._entries and self._unsub_check:
+            self._unsub_check()
+            self._unsub_check = None
+
+    def _update_disabled(self, entry_id:str) -> None:
+        entry = self._entries[entry_id]
+        others = [haid for (haid, owner) in self.assignments.items() if owner != entry_id]
+        entry.disabled[:] = sorted(set(entry.manual_disabled) | set(others))
+
+    def _get_load(self, entry_id:str) -> int:
+        """ The projected daily call volume of the appliances assigned to an entry """
+        default = max(sum(self.volume.values()) // len(self.volume), 1) if self.volume else 1
+        return sum(self.volume.get(haid, default) for (haid, owner) in self.assignments.items() if owner == entry_id)
+
+    def claim(self, entry_id:str, appliance:Appliance) -> None:
+        """ Assign a newly loaded appliance if it isn't assigned yet """
+        haid = appliance.normalized_haId
+        owner = self.assignments.get(haid)
+        if owner == entry_id:
+            return
+        if owner is None:
+            owner = min(self._entries, key=lambda e: (self._get_load(e), e))
+            _LOGGER.debug("Assigning appliance %s to config entry %s", haid, owner)
+            self.assignments[haid] = owner
+            self._store.async_delay_save(self._data_to_save, 10)
+            for other in self._entries:
+                self._update_disabled(other)
+            if owner == entry_id:
+                return
+            # Unassigned appliances aren't disabled in any entry so the new owner loads it as well
+        # The appliance belongs to another entry so reload this one without it
+        self._schedule_reload(entry_id)
+
+    def move(self, haid:str, entry_id:str) -> None:
+        """ Move an appliance to another config entry and reload both entries """
+        previous = self.assignments.get(haid)
+        _LOGGER.info("Moving appliance %s from config entry %s to %s", haid, previous, entry_id)
+        self.assignments[haid] = entry_id
+        self._store.async_delay_save(self._data_to_save, 10)
+        for other in self._entries:
+            self._update_disabled(other)
+        for reloaded in [previous, entry_id]:
+            if reloaded in self._entries:
+                self._schedule_reload(reloaded)
+
+    def _schedule_reload(self, entry_id:str) -> None:
+        """ Reload the entry after a short delay so the changes of a loading pass are applied together """
+        self._pending_reloads.add(entry_id)
+        if not self._unsub_reload:
+            self._unsub_reload = async_call_later(self._hass, 5, self._reload_entries)
+
+    @callback
+    def _reload_entries(self, *_) -> None:
+        self._unsub_reload = None
+        for entry_id in self._pending_reloads:
+            _LOGGER.debug("Reloading config entry %s after its appliances have changed", entry_id)
+            self._hass.config_entries.async_schedule_reload(entry_id)
+        self._pending_reloads.clear()
+
+    def _data_to_save(self) -> dict:
+        return { "assignments": self.assignments, "volume": self.volume }
+
+    @callback
+    def _check_budgets(self, *_) -> None:
+        """ Update the call volumes and rebalance when an entry approaches its daily budget """
+        for entry in self._entries.values():
+            for (haid, calls) in entry.budget.get_appliance_usage().items():
+                self.volume[haid] = calls
+        self._store.async_delay_save(self._data_to_save, 10)
+
+        if len(self._entries) < 2 or time.time() - self._last_rebalance < SHARDING_COOLDOWN:
+            return
+        hot = max(self._entries, key=lambda e: self._entries[e].budget.used)
+        cold = min(self._entries, key=lambda e: self._entries[e].budget.used)
+        hot_used = self._entries[hot].budget.used
+        cold_used = self._entries[cold].budget.used
+        if hot_used < SHARDING_REBALANCE_THRESHOLD * self._entries[hot].budget.limit:
+            return
+
+        # Move the busiest appliance which still leaves the target entry less loaded than the source
+        candidates = sorted(((self.volume.get(haid, 0), haid) for (haid, owner) in self.assignments.items() if owner == hot), reverse=True)
+        for (calls, haid) in candidates:
+            if calls and cold_used + calls < hot_used - calls:
+                self._last_rebalance = time.time()
+                self.move(haid, cold)
+                return
+        self._last_rebalance = time.time()
+        _LOGGER.warning("Config entry %s is close to the daily API call limit (%d calls) and there is no other entry to move its appliances to, consider adding another entry with a different Home Connect application", hot, hot_used)
@@ -4,14 +4,17 @@ from __future__ import annotations
 import logging
 from typing import Any
 
-from home_connect_async import Appliance, HomeConnect, HomeConnectError, Events
+from home_connect_async import Appliance, HomeConnectError
 from homeassistant.components.switch import SwitchEntity
+from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
 from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType
 
-from .common import InteractiveEntityBase, EntityManager, is_boolean_enum, Configuration
+from .common import InteractiveEntityBase, EntityManager, Configuration
+from .discovery import EntitySpec
 from .const import DOMAIN
 
 _LOGGER = logging.getLogger(__name__)
@@ -20,39 +23,16 @@ async def async_setup_entry(hass:HomeAssistant , config_entry:ConfigType, async_
     """Add sensors for passed config_entry in HA."""
     #homeconnect:HomeConnect = hass.data[DOMAIN]['homeconnect']
     entry_conf:Configuration = hass.data[DOMAIN][config_entry.entry_id]
-    homeconnect:HomeConnect = entry_conf["homeconnect"]
     entity_manager = EntityManager(async_add_entities, "Switch")
 
-    def add_appliance(appliance:Appliance) -> None:
-        conf = entry_conf.get_config()
-        if appliance.available_programs:
-            for program in appliance.available_programs.values():
-                if program.options:
-                    for option in program.options.values():
-                        if ( not conf.has_entity_setting(option.key, "type") and (option.type == "Boolean" or isinstance(option.value, bool))) \
-                             or conf.get_entity_setting(option.key, "type") == "Boolean" :
-                            device = OptionSwitch(appliance, option.key, conf)
-                            entity_manager.add(device)
+    def build_entity(appliance:Appliance, spec:EntitySpec, conf:Configuration) -> Entity:
+        match spec.kind:
+            case "option":
+                return OptionSwitch(appliance, spec.key, conf)
+            case "setting":
+                return SettingsSwitch(appliance, spec.key, conf)
 
-        if appliance.settings:
-            for setting in appliance.settings.values():
-                if ( (not conf.has_entity_setting(setting.key, "type")
-                    and ( setting.type == "Boolean" or isinstance(setting.value, bool) or is_boolean_enum(setting.allowedvalues))) \
-                    or conf.get_entity_setting(setting.key, "type") == "Boolean") \
-                    and setting.access != "read" :
-                    device = SettingsSwitch(appliance, setting.key, conf)
-                    entity_manager.add(device)
-
-        entity_manager.register()
-
-
-    def remove_appliance(appliance:Appliance) -> None:
-        entity_manager.remove_appliance(appliance)
-
-    homeconnect.register_callback(add_appliance, [Events.PAIRED, Events.DATA_CHANGED, Events.PROGRAM_STARTED, Events.PROGRAM_SELECTED])
-    homeconnect.register_callback(remove_appliance, Events.DEPAIRED)
-    for appliance in homeconnect.appliances.values():
-        add_appliance(appliance)
+    entry_conf["discovery"].register_platform(Platform.SWITCH, entity_manager, build_entity)
 
 
 class OptionSwitch(InteractiveEntityBase, SwitchEntity):
@@ -80,6 +60,8 @@ class OptionSwitch(InteractiveEntityBase, SwitchEntity):
     @property
     def is_on(self) -> bool:
         """Return True if entity is on."""
+        if self.has_optimistic_value:
+            return self.optimistic_value
         option = self._appliance.get_applied_program_option(self._key)
         if option:
             return option.value
@@ -88,7 +70,7 @@ class OptionSwitch(InteractiveEntityBase, SwitchEntity):
     async def async_turn_on(self, **kwargs: Any) -> None:
         """Turn the entity on."""
         try:
-            await self._appliance.async_set_option(self._key, True)
+            await self.async_write_optimistic(True, lambda: self._appliance.async_set_option(self._key, True))
         except HomeConnectError as ex:
             if ex.error_description:
                 raise HomeAssistantError(f"Failed to set the option: {ex.error_description} ({ex.code})")
@@ -97,7 +79,7 @@ class OptionSwitch(InteractiveEntityBase, SwitchEntity):
     async def async_turn_off(self, **kwargs: Any) -> None:
         """Turn the entity off."""
         try:
-            await self._appliance.async_set_option(self._key, False)
+            await self.async_write_optimistic(False, lambda: self._appliance.async_set_option(self._key, False))
         except HomeConnectError as ex:
             if ex.error_description:
                 raise HomeAssistantError(f"Failed to set the option: {ex.error_description} ({ex.code})")
@@ -105,7 +87,7 @@ class OptionSwitch(InteractiveEntityBase, SwitchEntity):
 
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
 
 
 class SettingsSwitch(InteractiveEntityBase, SwitchEntity):
@@ -136,6 +118,8 @@ class SettingsSwitch(InteractiveEntityBase, SwitchEntity):
     @property
     def is_on(self) -> bool:
         """Return True if entity is on."""
+        if self.has_optimistic_value:
+            return self.optimistic_value
         if self._key in self._appliance.settings:
             setting = self._appliance.settings[self._key]
             if setting.allowedvalues and setting.value.lower().endswith(".off"):
@@ -157,9 +141,9 @@ class SettingsSwitch(InteractiveEntityBase, SwitchEntity):
         try:
             setting = self._appliance.settings[self._key]
             if setting.allowedvalues:
-                await self._appliance.async_apply_setting(self._key, self.bool_to_enum(setting.allowedvalues, True))
+                await self.async_write_optimistic(True, lambda: self._appliance.async_apply_setting(self._key, self.bool_to_enum(setting.allowedvalues, True)))
             else:
-                await self._appliance.async_apply_setting(self._key, True)
+                await self.async_write_optimistic(True, lambda: self._appliance.async_apply_setting(self._key, True))
         except HomeConnectError as ex:
             if ex.error_description:
                 raise HomeAssistantError(f"Failed to apply the setting: {ex.error_description} ({ex.code})")
@@ -171,9 +155,9 @@ class SettingsSwitch(InteractiveEntityBase, SwitchEntity):
         try:
             setting = self._appliance.settings[self._key]
             if setting.allowedvalues:
-                await self._appliance.async_apply_setting(self._key, self.bool_to_enum(setting.allowedvalues, False))
+                await self.async_write_optimistic(False, lambda: self._appliance.async_apply_setting(self._key, self.bool_to_enum(setting.allowedvalues, False)))
             else:
-                await self._appliance.async_apply_setting(self._key, False)
+                await self.async_write_optimistic(False, lambda: self._appliance.async_apply_setting(self._key, False))
         except HomeConnectError as ex:
             if ex.error_description:
                 raise HomeAssistantError(f"Failed to apply the setting: {ex.error_description} ({ex.code})")
@@ -181,4 +165,4 @@ class SettingsSwitch(InteractiveEntityBase, SwitchEntity):
 
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
-        self.async_write_ha_state()
+        self.schedule_write_ha_state()
@@ -2,61 +2,106 @@ from __future__ import annotations
 import logging
 import datetime
 from  homeassistant.components.time import TimeEntity, time, timedelta
-from home_connect_async import Appliance, HomeConnect, HomeConnectError, Events, ConditionalLogger as CL
-from homeassistant.core import HomeAssistant
+from home_connect_async import Appliance, HomeConnectError, Events, ConditionalLogger as CL
+from homeassistant.const import Platform
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_track_point_in_time
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.helpers.entity_registry import async_get
+from homeassistant.util import dt as dt_util
 
-from .common import InteractiveEntityBase, EntityManager, is_boolean_enum, Configuration
-from .const import CONF_DELAYED_OPS, CONF_DELAYED_OPS_ABSOLUTE_TIME, DOMAIN
+from .common import InteractiveEntityBase, EntityManager, Configuration, get_program_run_time, PROGRAM_RUN_TIME_OPTIONS
+from .discovery import EntitySpec
+from .dispatcher import ACTIVE_PROGRAM_KEY, SELECTED_PROGRAM_KEY
+from .const import DOMAIN
 
 _LOGGER = logging.getLogger(__name__)
 
 async def async_setup_entry(hass:HomeAssistant , config_entry:ConfigType, async_add_entities:AddEntitiesCallback) -> None:
     """Add Selects for passed config_entry in HA."""
     entry_conf:Configuration = hass.data[DOMAIN][config_entry.entry_id]
-    homeconnect:HomeConnect = entry_conf["homeconnect"]
     entity_manager = EntityManager(async_add_entities, "Time")
-
-
-    def add_appliance(appliance:Appliance) -> None:
-        conf = entry_conf.get_config()
-
-        if appliance.available_programs:
-            for program in appliance.available_programs.values():
-                if program.options:
-                    for option in program.options.values():
-                        if conf.get_entity_setting(option.key, "type") == "DelayedOperation" \
-                            and entry_conf[CONF_DELAYED_OPS]==CONF_DELAYED_OPS_ABSOLUTE_TIME \
-                            and DelayedOperationTime.has_program_run_time(appliance):
-                            device = DelayedOperationTime(appliance, option.key, conf, option)
-                            # remove the SELECT delayed operation entity if it exists
-                            reg = async_get(hass)
-                            select_entity = reg.async_get_entity_id("select", DOMAIN, device.unique_id)
-                            if select_entity:
-                                reg.async_remove(select_entity)
-                            entity_manager.add(device)
-
-        entity_manager.register()
-
-    def remove_appliance(appliance:Appliance) -> None:
-        entity_manager.remove_appliance(appliance)
-
-    homeconnect.register_callback(add_appliance, [Events.PAIRED, Events.DATA_CHANGED, Events.PROGRAM_STARTED, Events.PROGRAM_SELECTED])
-    homeconnect.register_callback(remove_appliance, Events.DEPAIRED)
-    for appliance in homeconnect.appliances.values():
-        add_appliance(appliance)
+    schedulers:dict[str, DelayedOperationScheduler] = {}
+
+    def build_entity(appliance:Appliance, spec:EntitySpec, conf:Configuration) -> Entity:
+        match spec.kind:
+            case "delayed_operation":
+                if appliance.haId not in schedulers:
+                    schedulers[appliance.haId] = DelayedOperationScheduler(hass)
+                device = DelayedOperationTime(appliance, spec.key, conf, spec.hc_obj, schedulers[appliance.haId])
+                # remove the SELECT delayed operation entity if it exists
+                reg = async_get(hass)
+                select_entity = reg.async_get_entity_id("select", DOMAIN, device.unique_id)
+                if select_entity:
+                    reg.async_remove(select_entity)
+                return device
+
+    entry_conf["discovery"].register_platform(Platform.TIME, entity_manager, build_entity)
+
+
+class DelayedOperationScheduler():
+    """ A single timer shared by the delayed operation entities of an appliance
+
+    The timer fires on minute boundaries, which is the resolution of the displayed end time, and only while
+    one of the entities has a program run time to track. The entities are recomputed by the timer and when
+    the program or its run time changes, never when their state is read.
+    """
+
+    def __init__(self, hass:HomeAssistant) -> None:
+        self._hass = hass
+        self._entities:set[DelayedOperationTime] = set()
+        self._unsub_tick = None
+
+    def add(self, entity:DelayedOperationTime) -> None:
+        """ Start tracking the end time of an entity """
+        self._entities.add(entity)
+        self.update()
+
+    def remove(self, entity:DelayedOperationTime) -> None:
+        """ Stop tracking the end time of an entity """
+        self._entities.discard(entity)
+        self._schedule()
+
+    @callback
+    def update(self) -> None:
+        """ Recompute the end time of the entities and write the state of the ones that changed """
+        now = datetime.datetime.now()
+        for entity in self._entities:
+            if entity.recompute(now):
+                entity.schedule_write_ha_state()
+        self._schedule()
+
+    @callback
+    def _on_tick(self, _now) -> None:
+        self._unsub_tick = None
+        self.update()
+
+    def _schedule(self) -> None:
+        tracking = any(entity.tracking for entity in self._entities)
+        if not tracking and self._unsub_tick:
+            self._unsub_tick()
+            self._unsub_tick = None
+        elif tracking and not self._unsub_tick:
+            next_minute = (dt_util.now() + timedelta(minutes=1)).replace(second=0, microsecond=0)
+            self._unsub_tick = async_track_point_in_time(self._hass, self._on_tick, next_minute)
 
 
 class DelayedOperationTime(InteractiveEntityBase, TimeEntity):
     """ Class for setting delayed start by the program end time """
-    should_poll = True
+    should_poll = False
 
-    def __init__(self, appliance: Appliance, key: str = None, conf: dict = None, hc_obj = None) -> None:
+    def __init__(self, appliance: Appliance, key: str = None, conf: dict = None, hc_obj = None, scheduler:DelayedOperationScheduler = None) -> None:
         super().__init__(appliance, key, conf, hc_obj)
-        self._current:time = None
+        self._scheduler = scheduler
+        self._end:datetime.datetime|None = None
+
+    @property
+    def data_keys(self) -> set[str]:
+        return super().data_keys | set(PROGRAM_RUN_TIME_OPTIONS) | {SELECTED_PROGRAM_KEY, ACTIVE_PROGRAM_KEY}
+
     @property
     def name_ext(self) -> str|None:
         return self._hc_obj.name if self._hc_obj.name else "Delayed operation"
@@ -65,61 +110,60 @@ class DelayedOperationTime(InteractiveEntityBase, TimeEntity):
     def icon(self) -> str:
         return self.get_entity_setting('icon', 'mdi:clock-outline')
 
-
     @property
     def available(self) -> bool:
-
         # We must have the program run time for this entity to work
-        available = super().program_option_available and self.get_program_run_time(self._appliance) is not None
-
-        if not available:
-            self._appliance.clear_startonly_option(self._key)
-        return available
-
-    async def async_set_value(self, value: time) -> None:
-        """Update the current value."""
-        self._current = self.adjust_time(value, True)
-
-        #self.async_write_ha_state()
+        return super().program_option_available and self._end is not None
 
     @property
-    def native_value(self) -> time:
-        """Return the entity value to represent the entity state."""
-        if self._current is None:
-            self._current = self.init_time()
-
-        if self._appliance.startonly_options and self._key in self._appliance.startonly_options:
-            self._current = self.adjust_time(self._current, True)
-        else:
-            self._current = self.adjust_time(self._current, False)
-        return self._current
+    def tracking(self) -> bool:
+        """ True when the end time follows the program run time and has to be recomputed as time passes """
+        return self._end is not None
 
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
+        self._scheduler.add(self)
 
-    def adjust_time(self, t:time, set_option:bool) -> time|None:
-        """ Adjust the time state when required """
+    async def async_will_remove_from_hass(self):
+        await super().async_will_remove_from_hass()
+        self._scheduler.remove(self)
 
+    async def async_set_value(self, value: time) -> None:
+        """Update the current value."""
         now = datetime.datetime.now()
-        endtime = datetime.datetime(year=now.year, month=now.month, day=now.day, hour=t.hour, minute=t.minute)
-
+        endtime = datetime.datetime(year=now.year, month=now.month, day=now.day, hour=value.hour, minute=value.minute)
         if (now.hour > endtime.hour) or (now.hour == endtime.hour and now.minute > endtime.minute):
             # if the specified time is smaller than now then it means tomorrow
             endtime += datetime.timedelta(days=1)
+        self._end = endtime
+        self.recompute(now, True)
+        self._scheduler.update()
+        self.schedule_write_ha_state()
 
-        program_run_time = self.get_program_run_time(self._appliance)
-
-        if not program_run_time:
-            return None
-
-        if endtime < now + timedelta(seconds=program_run_time):
+    @property
+    def native_value(self) -> time:
+        """Return the entity value to represent the entity state."""
+        return time(hour=self._end.hour, minute=self._end.minute) if self._end else None
+
+    def recompute(self, now:datetime.datetime, set_option:bool = False) -> bool:
+        """ Adjust the end time and the delay option to the current time and program run time, returns True if the displayed time changed """
+        previous = self.native_value
+        program_run_time = get_program_run_time(self._appliance)
+        is_set = bool(self._appliance.startonly_options and self._key in self._appliance.startonly_options)
+
+        if not program_run_time or not super().program_option_available:
+            self._end = None
+            if is_set:
+                self._appliance.clear_startonly_option(self._key)
+        elif self._end is None or self._end < now + timedelta(seconds=program_run_time):
             # the set end time is closer then the program run time so change it to the expected end of the program
             # and cancel the set delay option
-            endtime = now + timedelta(seconds=program_run_time)
-            #self._current = time(hour=endtime.hour, minute=endtime.minute)
-            if self._appliance.startonly_options and self._key in self._appliance.startonly_options:
+            self._end = now + timedelta(seconds=program_run_time)
+            if is_set:
                 _LOGGER.debug("Clearing startonly option %s", self._key)
-            self._appliance.clear_startonly_option(self._key)
-        elif set_option:
-            delay = (endtime-now).total_seconds()
+                self._appliance.clear_startonly_option(self._key)
+        elif set_option or is_set:
+            delay = (self._end-now).total_seconds()
             if "StartInRelative" in self._key:
                 delay -= program_run_time
 
@@ -131,38 +175,12 @@ class DelayedOperationTime(InteractiveEntityBase, TimeEntity):
             _LOGGER.debug("Setting startonly option %s to: %i", self._key, delay)
             self._appliance.set_startonly_option(self._key, delay)
 
-        return time(hour=endtime.hour, minute=endtime.minute)
-
-    def init_time(self) -> time:
-        """ Initialize the time state """
-        inittime = datetime.datetime.now() + timedelta(minutes=1)
-        t = time(hour=inittime.hour, minute=inittime.minute)
-        return self.adjust_time(t, False)
-
-    @classmethod
-    def get_program_run_time(cls, appliance:Appliance) -> int|None:
-        """ Try to get the expected run time of the selected program or the remaining time of the running program """
-        time_option_keys = [
-            "BSH.Common.Option.RemainingProgramTime",
-            "BSH.Common.Option.FinishInRelative",
-            "BSH.Common.Option.EstimatedTotalProgramTime",
-        ]
-
-        for key in time_option_keys:
-            o = appliance.get_applied_program_option(key)
-            if o:
-                return o.value
-
-        return None
-
-    @classmethod
-    def has_program_run_time(cls, appliance:Appliance) ->bool:
-        """ Check if it's possible to get a program run time estimate """
-        return cls.get_program_run_time(appliance) is not None
-
+        return self.native_value != previous
 
     async def async_on_update(self, appliance:Appliance, key:str, value) -> None:
         # reset the end time clock when a different program is selected
         if key == Events.PROGRAM_SELECTED or "RemoteControlStartAllowed" in key:
-            self._current = self.init_time()
-        self.async_write_ha_state()
\ No newline at end of file
+            self._end = None
+        # the program run time may have changed so all the entities of the appliance are recomputed
+        self._scheduler.update()
+        self.schedule_write_ha_state()
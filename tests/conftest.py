@@ -0,0 +1,14 @@
+""" Fixtures shared by the tests of the integration
+
+Run with `python -m pytest tests` from the root of the repository, the tests need homeassistant, pytest and pytest-asyncio.
+"""
+import pytest_asyncio
+from homeassistant.core import HomeAssistant
+
+
+@pytest_asyncio.fixture
+async def hass(tmp_path):
+    """ A bare Home Assistant instance, enough for the timers and the storage helpers """
+    hass = HomeAssistant(str(tmp_path))
+    yield hass
+    await hass.async_stop(force=True)
@@ -0,0 +1,177 @@
+""" Tests of the daily API call budget """
+import asyncio
+import time
+from collections import deque
+
+import home_connect_async
+import pytest
+from home_connect_async import ConditionalLogger, HealthStatus, HomeConnectError
+
+from custom_components.home_connect_alt import budget as budget_module
+from custom_components.home_connect_alt.api import AsyncConfigEntryAuth, ConfigEntryApi
+from custom_components.home_connect_alt.budget import ApiBudget, PRIORITY_REFRESH, EVENT_STREAM_TASK
+
+STATUS = "/api/homeappliances/HAID/status"
+SETTING = "/api/homeappliances/HAID/settings/BSH.Common.Setting.PowerState"
+
+
+def create_budget(hass, used:int, limit:int = 100) -> ApiBudget:
+    budget = ApiBudget(hass, "entry", limit=limit)
+    for _ in range(used):
+        budget.record(PRIORITY_REFRESH)
+    return budget
+
+
+def expire_calls(budget:ApiBudget) -> None:
+    budget._calls = deque((t - budget.window, haid) for (t, haid) in budget._calls)
+
+
+@pytest.mark.asyncio
+async def test_requests_within_the_budget_are_counted(hass):
+    budget = create_budget(hass, 0)
+    await budget.async_acquire("GET", STATUS)
+    assert budget.used == 1
+    assert budget.get_appliance_usage() == { "haid": 1 }
+    assert budget.stats["requests"]["refresh"] == 1
+    await budget.async_unload()
+
+
+@pytest.mark.asyncio
+async def test_commands_use_the_reserve(hass):
+    # The refresh requests leave the last 50 calls for the commands
+    budget = create_budget(hass, 60)
+    assert budget.available(PRIORITY_REFRESH) == 0
+    await budget.async_acquire("PUT", SETTING)
+    assert budget.stats["deferred"] == 0
+    assert budget.used == 61
+    await budget.async_unload()
+
+
+@pytest.mark.asyncio
+async def test_deferred_request_is_released_when_old_calls_expire(hass):
+    budget = create_budget(hass, 50)
+    request = asyncio.create_task(budget.async_acquire("GET", STATUS))
+    await asyncio.sleep(0)
+    assert not request.done()
+    assert budget.stats["deferred"] == 1
+    assert budget.get_stats()["waiting"] == 1
+
+    expire_calls(budget)
+    budget._release()
+    await request
+    assert budget.used == 1
+    assert budget.get_stats()["waiting"] == 0
+    await budget.async_unload()
+
+
+@pytest.mark.asyncio
+async def test_deferred_request_is_rejected_after_the_maximum_wait(hass, monkeypatch):
+    monkeypatch.setattr(budget_module, "API_BUDGET_MAX_WAIT", 0.01)
+    budget = create_budget(hass, 50)
+    with pytest.raises(HomeConnectError) as ex:
+        await budget.async_acquire("GET", STATUS)
+    assert ex.value.code == 429
+    assert budget.stats["rejected"] == 1
+    assert budget.get_stats()["waiting"] == 0
+    assert budget.used == 50
+    await budget.async_unload()
+
+
+@pytest.mark.asyncio
+async def test_event_stream_requests_are_rejected_without_waiting(hass):
+    budget = create_budget(hass, 50)
+    request = asyncio.create_task(budget.async_acquire("GET", STATUS), name=EVENT_STREAM_TASK)
+    with pytest.raises(HomeConnectError) as ex:
+        await request
+    assert ex.value.code == 429
+    assert budget.stats["deferred"] == 0
+    assert budget.stats["rejected"] == 1
+    await budget.async_unload()
+
+
+@pytest.mark.asyncio
+async def test_unload_cancels_the_deferred_requests(hass):
+    budget = create_budget(hass, 50)
+    request = asyncio.create_task(budget.async_acquire("GET", STATUS))
+    await asyncio.sleep(0)
+    await budget.async_unload()
+    with pytest.raises(asyncio.CancelledError):
+        await request
+
+
+class FakeResponse():
+    def __init__(self, status:int) -> None:
+        self.status = status
+        self.content_length = 0
+        self.reason = ""
+        self.headers = {}
+
+    async def json(self, encoding=None):
+        return { "data": { "status": [] } }
+
+    def close(self) -> None:
+        pass
+
+
+class FakeAuth(AsyncConfigEntryAuth):
+    """ Answers the requests with the given status codes instead of calling the service """
+
+    def __init__(self, budget:ApiBudget, statuses:list[int]) -> None:
+        self.budget = budget
+        self.statuses = statuses
+        self.sent = []
+
+    async def async_get_access_token(self) -> str:
+        return "token"
+
+    async def _send(self, method, endpoint:str, lang:str=None, **kwargs) -> FakeResponse:
+        self.sent.append(endpoint)
+        return FakeResponse(self.statuses.pop(0))
+
+
+class ConstraintCacheStub():
+    """ Passes every request through """
+
+    async def async_get(self, endpoint, lang, async_get):
+        return await async_get(endpoint)
+
+
+@pytest.fixture
+def fake_requests(monkeypatch):
+    # The request of the base class is replaced so the budget accounting of AsyncConfigEntryAuth still runs
+    monkeypatch.setattr(home_connect_async.AbstractAuth, "request", FakeAuth._send)
+    ConditionalLogger.mode(ConditionalLogger.LogMode.REQUESTS)
+
+
+@pytest.mark.asyncio
+async def test_api_counts_the_retries_of_an_admitted_request(hass, fake_requests):
+    budget = create_budget(hass, 0)
+    auth = FakeAuth(budget, [500, 200])
+    api = ConfigEntryApi(auth, "en", HealthStatus(), budget, ConstraintCacheStub())
+    response = await api.async_get(STATUS)
+    assert response.status == 200
+    assert len(auth.sent) == 2
+    assert budget.used == 2
+    await budget.async_unload()
+
+
+@pytest.mark.asyncio
+async def test_api_raises_the_rejection_once_without_sending(hass, fake_requests):
+    budget = create_budget(hass, 50)
+    auth = FakeAuth(budget, [200])
+    api = ConfigEntryApi(auth, "en", HealthStatus(), budget, ConstraintCacheStub())
+    request = asyncio.create_task(api.async_get(STATUS), name=EVENT_STREAM_TASK)
+    with pytest.raises(HomeConnectError) as ex:
+        await request
+    assert ex.value.code == 429
+    assert auth.sent == []
+    assert budget.stats["rejected"] == 1
+    await budget.async_unload()
+
+
+@pytest.mark.asyncio
+async def test_calls_older_than_the_window_are_not_counted(hass):
+    budget = create_budget(hass, 10)
+    budget._calls.appendleft((time.time() - budget.window - 1, None))
+    assert budget.used == 10
+    await budget.async_unload()
@@ -0,0 +1,106 @@
+""" Tests of the persistent snapshot of the Home Connect data model """
+import json
+
+import pytest
+from home_connect_async import HomeConnect
+
+from custom_components.home_connect_alt.cache import HomeConnectCache, PART_DYNAMIC, PART_STATIC
+
+HAID = "SIEMENS-WM14T6H9NL-000000000001"
+APPLIANCE = {
+    "name": "Washer",
+    "brand": "Siemens",
+    "vib": "WM14T6H9NL",
+    "connected": True,
+    "type": "Washer",
+    "enumber": "WM14T6H9NL/01",
+    "haId": HAID,
+    "uri": f"/api/homeappliances/{HAID}",
+    "available_programs": {
+        "LaundryCare.Washer.Program.Cotton": {
+            "key": "LaundryCare.Washer.Program.Cotton",
+            "name": "Cotton",
+            "options": {
+                "LaundryCare.Washer.Option.Temperature": {
+                    "key": "LaundryCare.Washer.Option.Temperature", "type": "LaundryCare.Washer.EnumType.Temperature",
+                    "allowedvalues": ["LaundryCare.Washer.EnumType.Temperature.GC30", "LaundryCare.Washer.EnumType.Temperature.GC40"],
+                },
+                "LaundryCare.Washer.Option.SpinSpeed": { "key": "LaundryCare.Washer.Option.SpinSpeed", "type": "Int", "min": 400, "max": 1400, "stepsize": 200 },
+            },
+        },
+    },
+    "selected_program": {
+        "key": "LaundryCare.Washer.Program.Cotton",
+        "options": { "LaundryCare.Washer.Option.SpinSpeed": { "key": "LaundryCare.Washer.Option.SpinSpeed", "value": 1200, "unit": "rpm" } },
+    },
+    "status": {
+        "BSH.Common.Status.OperationState": { "key": "BSH.Common.Status.OperationState", "value": "BSH.Common.EnumType.OperationState.Ready" },
+        "BSH.Common.Status.DoorState": { "key": "BSH.Common.Status.DoorState", "value": "BSH.Common.EnumType.DoorState.Closed" },
+    },
+    "settings": {
+        "BSH.Common.Setting.PowerState": { "key": "BSH.Common.Setting.PowerState", "value": "BSH.Common.EnumType.PowerState.On" },
+    },
+    "commands": {
+        "BSH.Common.Command.PauseProgram": { "key": "BSH.Common.Command.PauseProgram", "name": "Pause" },
+    },
+}
+
+
+def create_homeconnect() -> HomeConnect:
+    return HomeConnect.from_json(json.dumps({ "appliances": { HAID: APPLIANCE } }))
+
+
+def public_fields(homeconnect:HomeConnect) -> dict:
+    return { haid: { k: v for (k, v) in appliance.to_dict().items() if not k.startswith("_") }
+             for (haid, appliance) in homeconnect.appliances.items() }
+
+
+@pytest.mark.asyncio
+async def test_snapshot_round_trip(hass):
+    homeconnect = create_homeconnect()
+    cache = HomeConnectCache(hass, "entry", "en")
+    cache.attach(homeconnect)
+    cache.on_appliance_changed(homeconnect.appliances[HAID], "PAIRED")
+    await cache.async_unload()
+
+    restored_cache = HomeConnectCache(hass, "entry", "en")
+    json_data, refresh = await restored_cache.async_load()
+    assert refresh == HomeConnect.RefreshMode.NOTHING
+    restored = HomeConnect.from_json(json_data)
+    assert public_fields(restored) == public_fields(homeconnect)
+    assert restored.appliances[HAID].selected_program.options["LaundryCare.Washer.Option.SpinSpeed"].value == 1200
+
+
+@pytest.mark.asyncio
+async def test_only_changed_parts_are_rewritten(hass):
+    homeconnect = create_homeconnect()
+    appliance = homeconnect.appliances[HAID]
+    cache = HomeConnectCache(hass, "entry", "en")
+    cache.attach(homeconnect)
+    appliance_cache = cache._get_appliance_cache(HAID)
+
+    appliance_cache.dirty = { PART_STATIC, PART_DYNAMIC }
+    assert await appliance_cache.async_save(appliance) == 2
+    appliance_cache.dirty = { PART_STATIC, PART_DYNAMIC }
+    assert await appliance_cache.async_save(appliance) == 0
+
+    appliance.status["BSH.Common.Status.DoorState"].value = "BSH.Common.EnumType.DoorState.Open"
+    appliance_cache.dirty = { PART_STATIC, PART_DYNAMIC }
+    assert await appliance_cache.async_save(appliance) == 1
+    await cache.async_unload()
+
+
+@pytest.mark.asyncio
+async def test_loaded_snapshot_is_not_rewritten(hass):
+    homeconnect = create_homeconnect()
+    cache = HomeConnectCache(hass, "entry", "en")
+    cache.attach(homeconnect)
+    cache.on_appliance_changed(homeconnect.appliances[HAID], "PAIRED")
+    await cache.async_unload()
+
+    restored_cache = HomeConnectCache(hass, "entry", "en")
+    json_data, _ = await restored_cache.async_load()
+    restored = HomeConnect.from_json(json_data)
+    appliance_cache = restored_cache._get_appliance_cache(HAID)
+    appliance_cache.dirty = { PART_STATIC, PART_DYNAMIC }
+    assert await appliance_cache.async_save(restored.appliances[HAID]) == 0
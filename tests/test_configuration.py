@@ -0,0 +1,65 @@
+""" Tests of the layered Configuration """
+import pytest
+
+from custom_components.home_connect_alt.common import Configuration
+from custom_components.home_connect_alt.const import CONF_ENTITY_SETTINGS, CONF_APPLIANCE_SETTINGS
+
+KEY = "BSH.Common.Option.Test"
+
+
+@pytest.fixture(autouse=True)
+def global_config():
+    Configuration.set_global_config(None, { CONF_ENTITY_SETTINGS: { KEY: { "unit": "global", "icon": "mdi:global" } } })
+    yield
+    Configuration.set_global_config(None, None)
+
+
+def test_top_layers_override_bottom_layers_per_option():
+    entry = Configuration({ CONF_ENTITY_SETTINGS: { KEY: { "unit": "entry" } } })
+    entity = entry.get_config({ CONF_ENTITY_SETTINGS: { KEY: { "icon": "mdi:entity" } } })
+    assert entity.get_entity_setting(KEY, "unit") == "entry"
+    assert entity.get_entity_setting(KEY, "icon") == "mdi:entity"
+    assert entry.get_entity_setting(KEY, "icon") == "mdi:global"
+    assert entity.get_entity_setting(KEY, "missing", "default") == "default"
+    # Plain keys are looked up in the parent layers as well
+    entry["name_template"] = "$name"
+    assert entity["name_template"] == "$name"
+    assert "name_template" in entity
+
+
+def test_configured_appliances_are_collected_from_all_the_layers():
+    entry = Configuration({ CONF_APPLIANCE_SETTINGS: { "A": { "disabled": True } } })
+    entity = entry.get_config({ CONF_APPLIANCE_SETTINGS: { "B": { "name_template": "$name" } } })
+    assert entity.get_configured_appliances() == { "A", "B" }
+    assert entity.get_appliance_setting("A", "disabled") is True
+
+
+def test_setting_invalidates_the_layer_and_the_layers_on_top_of_it():
+    entry = Configuration()
+    sibling = Configuration()
+    entity = entry.get_config()
+    sibling_settings = sibling._resolve(CONF_ENTITY_SETTINGS, KEY)
+    assert entity.get_entity_setting(KEY, "unit") == "global"
+
+    entry.set_entity_setting(KEY, "unit", "entry")
+    assert entry.get_entity_setting(KEY, "unit") == "entry"
+    assert entity.get_entity_setting(KEY, "unit") == "entry"
+    # The memoized settings of unrelated layers are kept
+    assert sibling._resolve(CONF_ENTITY_SETTINGS, KEY) is sibling_settings
+    assert sibling.get_entity_setting(KEY, "unit") == "global"
+
+
+def test_global_changes_invalidate_all_the_layers():
+    entry = Configuration()
+    assert entry.get_entity_setting(KEY, "unit") == "global"
+    Configuration.set_global_config(None, { CONF_ENTITY_SETTINGS: { KEY: { "unit": "changed" } } })
+    assert entry.get_entity_setting(KEY, "unit") == "changed"
+
+
+def test_resolved_settings_are_read_only():
+    entry = Configuration()
+    settings = entry.get_entity_settings(KEY)
+    with pytest.raises(TypeError):
+        settings["unit"] = "changed"
+    assert entry.get_entity_setting(KEY, "unit") == "global"
+    assert entry.get_entity_settings("Unknown.Key") is None
@@ -0,0 +1,88 @@
+""" Tests of the optimistic values of the interactive entities """
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from home_connect_async import HomeConnectError
+
+from custom_components.home_connect_alt.common import InteractiveEntityBase, WriteQueue
+
+
+class FakeEntity(InteractiveEntityBase):
+    """ An interactive entity whose state is the optimistic value or the actual data """
+
+    def __init__(self, hass, queue:WriteQueue) -> None:
+        # The EntityBase constructor needs the appliance index, none of it is used here
+        self.hass = hass
+        self._appliance = SimpleNamespace(haId="APPLIANCE")
+        self._key = "BSH.Common.Option.Test"
+        self._conf = { "write_queue": queue }
+        self.actual = 0
+        self.written = []
+
+    @property
+    def state(self):
+        return self.optimistic_value if self.has_optimistic_value else self.actual
+
+    def async_write_ha_state(self) -> None:
+        self.written.append(self.state)
+
+    def schedule_write_ha_state(self) -> None:
+        self.async_write_ha_state()
+
+    async def async_on_update(self, appliance, key, value) -> None:
+        pass
+
+
+def write(result=None, error:Exception|None=None, delay:float=0):
+    async def async_write():
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return result
+    return async_write
+
+
+@pytest.mark.asyncio
+async def test_failed_write_reverts_to_the_actual_data(hass):
+    entity = FakeEntity(hass, WriteQueue(hass, 50))
+    with pytest.raises(HomeConnectError):
+        await entity.async_write_optimistic(5, write(error=HomeConnectError("rejected", 409)))
+    assert entity.state == 0
+    assert entity.written == [5, 0]
+
+
+@pytest.mark.asyncio
+async def test_rollback_after_supersede_reverts_to_the_write_that_went_out(hass):
+    entity = FakeEntity(hass, WriteQueue(hass, 50))
+    # The first write is sent right away and succeeds, the second is superseded by the third which fails
+    first = asyncio.create_task(entity.async_write_optimistic(1, write("ok", delay=0.01)))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(entity.async_write_optimistic(2, write("ok")))
+    await asyncio.sleep(0)
+    third = asyncio.create_task(entity.async_write_optimistic(3, write(error=HomeConnectError("rejected", 409))))
+    assert await first == "ok"
+    # The failure of the write that replaced it is reported to the caller of the superseded write too
+    with pytest.raises(HomeConnectError):
+        await second
+    with pytest.raises(HomeConnectError):
+        await third
+    # The first value was sent but isn't confirmed yet so it is shown until the appliance confirms it
+    assert entity.state == 1
+    await entity._async_on_confirmation(entity._appliance, entity._key, 1)
+    assert not entity.has_optimistic_value
+    entity.clear_optimistic_value()
+
+
+@pytest.mark.asyncio
+async def test_failure_of_an_older_write_keeps_the_newer_value(hass):
+    entity = FakeEntity(hass, WriteQueue(hass, 0))
+    older = asyncio.create_task(entity.async_write_optimistic(1, write(error=HomeConnectError("rejected", 409), delay=0.01)))
+    await asyncio.sleep(0)
+    # A write to another key of the entity isn't coalesced with the first one
+    newer = asyncio.create_task(entity.async_write_optimistic(2, write("ok", delay=0.02), key="BSH.Common.Option.Other"))
+    with pytest.raises(HomeConnectError):
+        await older
+    assert entity.state == 2
+    assert await newer == "ok"
+    entity.clear_optimistic_value()
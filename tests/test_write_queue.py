@@ -0,0 +1,107 @@
+""" Tests of the coalescing of the writes of the interactive entities """
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from home_connect_async import HomeConnectError
+
+from custom_components.home_connect_alt.common import WriteQueue
+
+APPLIANCE = SimpleNamespace(haId="APPLIANCE")
+KEY = "BSH.Common.Option.Test"
+
+
+class Writes():
+    """ Records the writes in the order they are sent """
+
+    def __init__(self) -> None:
+        self.sent = []
+        self.running = 0
+        self.max_running = 0
+
+    def write(self, value, delay:float = 0, error:Exception|None = None):
+        async def async_write():
+            self.sent.append(value)
+            self.running += 1
+            self.max_running = max(self.running, self.max_running)
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self.running -= 1
+            if error:
+                raise error
+            return value
+        return async_write
+
+
+@pytest.mark.asyncio
+async def test_first_write_is_sent_immediately(hass):
+    queue = WriteQueue(hass, 1000)
+    writes = Writes()
+    assert await asyncio.wait_for(queue.async_write(APPLIANCE, KEY, writes.write(1)), 0.5) == 1
+    assert writes.sent == [1]
+    queue.cancel()
+
+
+@pytest.mark.asyncio
+async def test_writes_within_the_window_are_superseded_by_the_last_one(hass):
+    queue = WriteQueue(hass, 50)
+    writes = Writes()
+    first = asyncio.create_task(queue.async_write(APPLIANCE, KEY, writes.write(1)))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(queue.async_write(APPLIANCE, KEY, writes.write(2)))
+    third = asyncio.create_task(queue.async_write(APPLIANCE, KEY, writes.write(3)))
+    assert await first == 1
+    assert await third == 3
+    assert await second is None
+    assert writes.sent == [1, 3]
+    assert queue.stats == { "requested": 3, "sent": 2, "superseded": 1, "failed": 0 }
+
+
+@pytest.mark.asyncio
+async def test_writes_to_an_appliance_are_sent_one_at_a_time(hass):
+    queue = WriteQueue(hass, 50)
+    writes = Writes()
+    results = await asyncio.gather(queue.async_write(APPLIANCE, "A", writes.write("a", delay=0.01)),
+                                   queue.async_write(APPLIANCE, "B", writes.write("b", delay=0.01)))
+    assert results == ["a", "b"]
+    assert writes.max_running == 1
+    # The lock of the appliance isn't kept once none of its writes uses it
+    assert queue._locks == {}
+    queue.cancel()
+
+
+@pytest.mark.asyncio
+async def test_failure_is_reported_to_the_superseded_writes(hass):
+    queue = WriteQueue(hass, 50)
+    writes = Writes()
+    first = asyncio.create_task(queue.async_write(APPLIANCE, KEY, writes.write(1)))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(queue.async_write(APPLIANCE, KEY, writes.write(2)))
+    third = asyncio.create_task(queue.async_write(APPLIANCE, KEY, writes.write(3, error=HomeConnectError("rejected", 409))))
+    assert await first == 1
+    for superseded in (second, third):
+        with pytest.raises(HomeConnectError):
+            await superseded
+    assert queue.stats["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancel_fails_the_pending_and_sending_writes(hass):
+    queue = WriteQueue(hass, 1000)
+    writes = Writes()
+    sending = asyncio.create_task(queue.async_write(APPLIANCE, KEY, writes.write(1, delay=10)))
+    await asyncio.sleep(0)
+    pending = asyncio.create_task(queue.async_write(APPLIANCE, KEY, writes.write(2)))
+    await asyncio.sleep(0)
+    assert writes.sent == [1]
+
+    queue.cancel()
+    for write in (sending, pending):
+        with pytest.raises(HomeConnectError):
+            await asyncio.wait_for(write, 0.5)
+    await asyncio.sleep(0)
+    assert writes.sent == [1]
+    assert queue._tasks == {}
+    assert queue._windows == {}
+    assert queue._locks == {}